@@ -0,0 +1,470 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from .retrieval import Retriever
+
+# Offline performance harness: the pipeline runs end to end against in-process
+# fake chat models (configurable latency, canned planner JSON), so executor /
+# retrieval changes can be compared across commits without a paid, noisy API.
+
+STAGES = ("load", "index", "plan", "retrieve", "generate", "aggregate")
+# Packages the CLI must not import up front (loaded lazily on the paths that need them).
+HEAVY_IMPORTS = ("langchain", "langchain_core", "langchain_openai", "openai", "sklearn", "scipy")
+FAKE_MODELS = {"bench-planner": "plan", "bench-generator": "generate", "bench-aggregator": "aggregate"}
+
+
+class StageTimer:
+    """Thread-safe accumulator of per-stage durations (seconds)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.samples: Dict[str, List[float]] = {s: [] for s in STAGES}
+
+    def add(self, stage: str, seconds: float) -> None:
+        """Record one duration for stage."""
+        with self._lock:
+            self.samples.setdefault(stage, []).append(seconds)
+
+    @contextmanager
+    def time(self, stage: str) -> Iterator[None]:
+        """Context manager charging the enclosed block to stage."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - t0)
+
+
+class LatencyModel:
+    """Lognormal latency around a median (sigma=0 -> fixed)."""
+
+    def __init__(self, median_ms: float, sigma: float = 0.0, seed: Optional[int] = None):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        """One latency draw, in seconds."""
+        if self.median_ms <= 0:
+            return 0.0
+        with self._lock:
+            z = self._rng.gauss(0.0, 1.0) if self.sigma > 0 else 0.0
+        return self.median_ms / 1000.0 * float(np.exp(self.sigma * z))
+
+
+class FakeRateLimitError(Exception):
+    """What FakeQuota raises: shaped like an OpenAI 429 (status_code, retry_after)."""
+
+    status_code = 429
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class FakeQuota:
+    """
+    Provider-side limits for the fake models: requests beyond `max_concurrent`
+    in flight or `rpm` per sliding minute are rejected with FakeRateLimitError.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, max_concurrent: Optional[int] = None, retry_after: Optional[float] = None):
+        self.rpm = rpm
+        self.max_concurrent = max_concurrent
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self._recent: Deque[float] = deque()
+        self.inflight = 0
+        self.counters: Dict[str, int] = {"accepted": 0, "throttled": 0, "peak_inflight": 0}
+
+    def enter(self) -> None:
+        """Admit one call or raise FakeRateLimitError if over the concurrency or rpm limit."""
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60.0:
+                self._recent.popleft()
+            if (self.max_concurrent is not None and self.inflight >= self.max_concurrent) or (
+                self.rpm is not None and len(self._recent) >= self.rpm
+            ):
+                self.counters["throttled"] += 1
+                raise FakeRateLimitError("Rate limit exceeded (fake quota)", self.retry_after)
+            self._recent.append(now)
+            self.inflight += 1
+            self.counters["accepted"] += 1
+            self.counters["peak_inflight"] = max(self.counters["peak_inflight"], self.inflight)
+
+    def exit(self) -> None:
+        """Release a slot taken by enter()."""
+        with self._lock:
+            self.inflight -= 1
+
+    @contextmanager
+    def admit(self) -> Iterator[None]:
+        """Context manager around enter()/exit()."""
+        self.enter()
+        try:
+            yield
+        finally:
+            self.exit()
+
+    def stats(self) -> Dict[str, int]:
+        """Accepted/throttled counts and peak in-flight calls."""
+        with self._lock:
+            return dict(self.counters)
+
+
+class FakeMessage:
+    def __init__(self, content: str, usage_metadata: Optional[Dict[str, int]] = None):
+        self.content = content
+        self.usage_metadata = usage_metadata or {}
+
+
+class FakeChatModel:
+    """
+    Stand-in for a LangChain chat model (invoke/ainvoke).
+    The planner stage answers with canned plan JSON (heuristic_plan of the
+    prompt, or a fixed plan if given); other stages return a fixed answer.
+    With a quota, calls beyond it fail like a throttled API.
+    """
+
+    def __init__(
+        self,
+        stage: str,
+        latency: LatencyModel,
+        timer: StageTimer,
+        plan_json: Optional[str] = None,
+        answer: str = "42",
+        quota: Optional[FakeQuota] = None,
+    ):
+        self.stage = stage
+        self.latency = latency
+        self.timer = timer
+        self.plan_json = plan_json
+        self.answer = answer
+        self.quota = quota or FakeQuota()
+
+    def _reply(self, messages: List[Any]) -> FakeMessage:
+        prompt = str(getattr(messages[-1], "content", messages[-1])) if messages else ""
+        if self.stage == "plan":
+            if self.plan_json is not None:
+                text = self.plan_json
+            else:
+                from .planrag import heuristic_plan
+
+                dag = heuristic_plan(prompt)
+                text = json.dumps({"nodes": [n.model_dump() for n in dag.nodes.values()]})
+        elif self.stage == "generate" and "\nQuestions:\n" in prompt:
+            # Batched generation prompt: answer every listed id.
+            ids = re.findall(r"^- id (\S+):", prompt, flags=re.M)
+            text = json.dumps({nid: self.answer for nid in ids})
+        else:
+            text = self.answer
+        usage = {"input_tokens": len(prompt) // 4, "output_tokens": max(1, len(text) // 4)}
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return FakeMessage(text, usage)
+
+    def invoke(self, messages: List[Any], **_: Any) -> FakeMessage:
+        """Sleep one latency sample (inside the quota), then reply."""
+        t0 = time.perf_counter()
+        with self.quota.admit():
+            time.sleep(self.latency.sample())
+        reply = self._reply(messages)
+        self.timer.add(self.stage, time.perf_counter() - t0)
+        return reply
+
+    async def ainvoke(self, messages: List[Any], **_: Any) -> FakeMessage:
+        """Async invoke(): the same latency awaited instead of slept."""
+        t0 = time.perf_counter()
+        with self.quota.admit():
+            await asyncio.sleep(self.latency.sample())
+        reply = self._reply(messages)
+        self.timer.add(self.stage, time.perf_counter() - t0)
+        return reply
+
+    @staticmethod
+    def _chunks(reply: FakeMessage) -> List[FakeMessage]:
+        # Word-sized chunks; usage rides on the last one, as with OpenAI stream_usage.
+        words = reply.content.split(" ")
+        chunks = [FakeMessage(w if i == 0 else " " + w) for i, w in enumerate(words)]
+        chunks[-1].usage_metadata = reply.usage_metadata
+        return chunks
+
+    def stream(self, messages: List[Any], **_: Any) -> Iterator[FakeMessage]:
+        """invoke() latency split between time-to-first-chunk and the remaining chunks."""
+        t0 = time.perf_counter()
+        total = self.latency.sample()
+        chunks = self._chunks(self._reply(messages))
+        with self.quota.admit():
+            time.sleep(total / 2)
+            for chunk in chunks:
+                yield chunk
+                time.sleep(total / 2 / len(chunks))
+        self.timer.add(self.stage, time.perf_counter() - t0)
+
+    async def astream(self, messages: List[Any], **_: Any) -> AsyncIterator[FakeMessage]:
+        """Async stream(): word chunks at the same pacing."""
+        t0 = time.perf_counter()
+        total = self.latency.sample()
+        chunks = self._chunks(self._reply(messages))
+        with self.quota.admit():
+            await asyncio.sleep(total / 2)
+            for chunk in chunks:
+                yield chunk
+                await asyncio.sleep(total / 2 / len(chunks))
+        self.timer.add(self.stage, time.perf_counter() - t0)
+
+
+class TimedRetriever:
+    """Proxy that charges lookup/query time to the "retrieve" stage."""
+
+    def __init__(self, inner: Retriever, timer: StageTimer):
+        self._inner = inner
+        self._timer = timer
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._inner, name)
+
+    def lookup(self, q: str) -> Optional[str]:
+        """Timed inner.lookup."""
+        with self._timer.time("retrieve"):
+            return self._inner.lookup(q)
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        """Timed inner.query."""
+        with self._timer.time("retrieve"):
+            return self._inner.query(q, k=k)
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        """Timed inner.query_batch."""
+        with self._timer.time("retrieve"):
+            return self._inner.query_batch(queries, k=k)
+
+
+@contextmanager
+def fake_llm(
+    timer: StageTimer,
+    plan_ms: float,
+    gen_ms: float,
+    agg_ms: float,
+    sigma: float,
+    seed: Optional[int] = None,
+    plan_json: Optional[str] = None,
+    quota: Optional[FakeQuota] = None,
+) -> Iterator[None]:
+    """
+    Route every chat model through FakeChatModel; restores env/clients on exit.
+    One quota (if given) is shared by all fake models, like a per-key API limit.
+    """
+    from .clients import set_chat_factory
+
+    latencies = {
+        "plan": LatencyModel(plan_ms, sigma, seed),
+        "generate": LatencyModel(gen_ms, sigma, None if seed is None else seed + 1),
+        "aggregate": LatencyModel(agg_ms, sigma, None if seed is None else seed + 2),
+    }
+
+    def _factory(model: str, base_url: Optional[str]) -> FakeChatModel:
+        stage = FAKE_MODELS.get(model, "generate")
+        return FakeChatModel(stage, latencies[stage], timer, plan_json=plan_json, quota=quota)
+
+    env = {
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY") or "bench-fake-key",
+        "PLAN_MODEL": "bench-planner",
+        "GEN_MODEL": "bench-generator",
+        "AGG_MODEL": "bench-aggregator",
+    }
+    saved = {k: os.environ.get(k) for k in env}
+    os.environ.update(env)
+    set_chat_factory(_factory)
+    try:
+        yield
+    finally:
+        set_chat_factory(None)
+        for k, v in saved.items():
+            if v is None:
+                os.environ.pop(k, None)
+            else:
+                os.environ[k] = v
+
+
+def _summary(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0, "total_ms": 0.0, "mean_ms": 0.0, "p50_ms": 0.0, "p95_ms": 0.0, "p99_ms": 0.0}
+    arr = np.asarray(values) * 1000.0
+    return {
+        "count": int(arr.size),
+        "total_ms": round(float(arr.sum()), 3),
+        "mean_ms": round(float(arr.mean()), 3),
+        "p50_ms": round(float(np.percentile(arr, 50)), 3),
+        "p95_ms": round(float(np.percentile(arr, 95)), 3),
+        "p99_ms": round(float(np.percentile(arr, 99)), 3),
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run_bench(
+    data: str,
+    n: int = 50,
+    workers: int = 1,
+    index_path: Optional[str] = None,
+    plan_ms: float = 400.0,
+    gen_ms: float = 250.0,
+    agg_ms: float = 300.0,
+    sigma: float = 0.3,
+    seed: Optional[int] = 0,
+    plan_json: Optional[str] = None,
+    batch: bool = False,
+    quota_rpm: Optional[float] = None,
+    quota_concurrency: Optional[int] = None,
+    scheduler: bool = True,
+    llm_concurrency: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    Run the last-turn question of the first n records through PlanRAGRunner
+    with fake LLMs and return a machine-readable report.
+    LLM response and plan caches are disabled so every run does the same work.
+    quota_* make the fake API throttle (429s); the run uses a fresh
+    LLMScheduler starting at llm_concurrency (default 4 per worker), or none at all.
+    """
+    from .dataset import LazyRecords, get_turn_question
+    from .executor import PlanRAGRunner
+    from .llm_cache import configure_cache, get_cache, install_cache
+    from .retrieval import load_retriever
+    from .scheduler import LLMScheduler, configure_scheduler, get_scheduler
+
+    timer = StageTimer()
+    quota = FakeQuota(quota_rpm, quota_concurrency)
+    llm_concurrency = llm_concurrency or 4 * max(1, workers)
+    sched = LLMScheduler(concurrency=llm_concurrency, seed=seed) if scheduler else None
+    errors: List[str] = []
+    # The caller's cache, scheduler and PLAN_CACHE are put back however the run ends.
+    saved_cache = get_cache()
+    saved_scheduler = get_scheduler()
+    saved_plan_cache = os.environ.get("PLAN_CACHE")
+
+    def _one(rid: str) -> Optional[float]:
+        with timer.time("load"):
+            rec = store[rid]
+        q = get_turn_question(rec, turn=None)
+        if not q:
+            return None
+        t0 = time.perf_counter()
+        with timer.time("index"):
+            retriever = TimedRetriever(load_retriever(rec, index_path), timer)
+        try:
+            PlanRAGRunner(retriever, batch=batch, concurrency=workers).run(q)
+        except Exception as e:
+            errors.append(f"{rid}: {type(e).__name__}: {e}")
+            return None
+        return time.perf_counter() - t0
+
+    try:
+        configure_cache(None)
+        configure_scheduler(sched)
+        os.environ["PLAN_CACHE"] = "off"
+        with timer.time("load"):
+            store = LazyRecords(data)
+        ids = list(islice(iter(store), max(0, n)))
+        with fake_llm(timer, plan_ms, gen_ms, agg_ms, sigma, seed, plan_json, quota):
+            t_start = time.perf_counter()
+            if workers <= 1:
+                latencies = [_one(rid) for rid in ids]
+            else:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    latencies = list(pool.map(_one, ids))
+            wall = time.perf_counter() - t_start
+    finally:
+        install_cache(saved_cache)
+        configure_scheduler(saved_scheduler)
+        if saved_plan_cache is None:
+            os.environ.pop("PLAN_CACHE", None)
+        else:
+            os.environ["PLAN_CACHE"] = saved_plan_cache
+
+    done = [x for x in latencies if x is not None]
+    return {
+        "commit": _git_commit(),
+        "config": {
+            "data": data, "n": n, "workers": workers, "index": index_path,
+            "plan_ms": plan_ms, "gen_ms": gen_ms, "agg_ms": agg_ms, "sigma": sigma, "seed": seed, "batch": batch,
+            "quota_rpm": quota_rpm, "quota_concurrency": quota_concurrency, "scheduler": scheduler, "llm_concurrency": llm_concurrency,
+        },
+        "questions": len(done),
+        "errors": len(errors),
+        "wall_s": round(wall, 4),
+        "throughput_qps": round(len(done) / wall, 4) if wall > 0 else 0.0,
+        "latency": _summary(done),
+        "stages": {stage: _summary(vals) for stage, vals in timer.samples.items()},
+        "quota": quota.stats(),
+        "scheduler": sched.stats() if sched is not None else None,
+        "error_samples": errors[:5],
+    }
+
+
+def import_time(module: str = "src.main", runs: int = 3) -> Dict[str, Any]:
+    """
+    Cold import cost of `module` in a fresh interpreter (python -X importtime),
+    best of `runs`: total ms, the slowest imported modules and any HEAVY_IMPORTS
+    that got pulled in.
+    """
+    best: Optional[Dict[str, float]] = None
+    for _ in range(max(1, runs)):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, timeout=120,
+        )
+        if out.returncode != 0:
+            raise RuntimeError(f"import {module} failed: {out.stderr.strip().splitlines()[-1:]}")
+        cumulative: Dict[str, float] = {}
+        for line in out.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _self, cum, name = (part.strip() for part in line[len("import time:"):].split("|"))
+            if cum.isdigit():
+                cumulative[name] = int(cum) / 1000.0
+        if best is None or cumulative.get(module, 0.0) < best.get(module, 0.0):
+            best = cumulative
+    assert best is not None
+    heavy = sorted({name for name in best if name.split(".")[0] in HEAVY_IMPORTS})
+    slowest = sorted(best.items(), key=lambda kv: -kv[1])[:15]
+    return {
+        "module": module,
+        "total_ms": round(best.get(module, 0.0), 1),
+        "heavy": heavy,
+        "slowest": [{"module": name, "cumulative_ms": round(ms, 1)} for name, ms in slowest],
+    }
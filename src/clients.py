@@ -0,0 +1,91 @@
+from __future__ import annotations
+
+import asyncio
+import os
+import threading
+import weakref
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Process-wide registry of chat model clients keyed by (model, base_url), so
+# every plan node reuses one client and its keep-alive HTTP connection pool
+# instead of building a new client (and TLS session) per call.
+# Pool settings come from env:
+#   LLM_POOL_MAX_CONNECTIONS   (default 64)
+#   LLM_POOL_MAX_KEEPALIVE     (default 16)
+#   LLM_POOL_KEEPALIVE_EXPIRY  seconds (default 30)
+#   LLM_HTTP_TIMEOUT           seconds (default 60)
+# httpx async connections belong to the event loop that opened them, so async
+# callers get one client set per running loop.
+
+ClientKey = Tuple[str, Optional[str]]
+ChatFactory = Callable[[str, Optional[str]], Any]
+
+_LOCK = threading.Lock()
+_SYNC: Dict[ClientKey, Any] = {}
+_FACTORY: Optional[ChatFactory] = None
+_BY_LOOP: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[ClientKey, Any]] = weakref.WeakKeyDictionary()
+
+
+def _pool_kwargs() -> Dict[str, Any]:
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=int(os.getenv("LLM_POOL_MAX_CONNECTIONS", "64")),
+        max_keepalive_connections=int(os.getenv("LLM_POOL_MAX_KEEPALIVE", "16")),
+        keepalive_expiry=float(os.getenv("LLM_POOL_KEEPALIVE_EXPIRY", "30")),
+    )
+    timeout = httpx.Timeout(float(os.getenv("LLM_HTTP_TIMEOUT", "60")))
+    return {
+        "http_client": httpx.Client(limits=limits, timeout=timeout),
+        "http_async_client": httpx.AsyncClient(limits=limits, timeout=timeout),
+    }
+
+
+def _create(model: str, base_url: Optional[str]) -> Any:
+    if _FACTORY is not None:
+        return _FACTORY(model, base_url)
+    # langchain is imported on the first real client only (heuristic runs never get here).
+    from langchain.chat_models import init_chat_model
+
+    return init_chat_model(
+        model=model,
+        model_provider="openai",
+        api_key=os.getenv("OPENAI_API_KEY"),
+        base_url=base_url,
+        **_pool_kwargs(),
+    )
+
+
+def get_chat_model(model: str) -> Any:
+    """Shared chat model for `model` at $OPENAI_BASE_URL (created on first use)."""
+    key: ClientKey = (model, os.getenv("OPENAI_BASE_URL"))
+    try:
+        loop: Optional[asyncio.AbstractEventLoop] = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    with _LOCK:
+        registry = _SYNC if loop is None else _BY_LOOP.setdefault(loop, {})
+        chat = registry.get(key)
+        if chat is None:
+            chat = _create(*key)
+            registry[key] = chat
+        return chat
+
+
+def reset_clients() -> None:
+    """Drop every cached client (e.g. after changing OPENAI_* env vars)."""
+    with _LOCK:
+        _SYNC.clear()
+        _BY_LOOP.clear()
+
+
+def set_chat_factory(factory: Optional[ChatFactory]) -> None:
+    """
+    Replace how clients are built (e.g. bench's fake chat models); None restores
+    init_chat_model. Cached clients are dropped either way.
+    """
+    global _FACTORY
+    with _LOCK:
+        _FACTORY = factory
+        _SYNC.clear()
+        _BY_LOOP.clear()
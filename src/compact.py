@@ -0,0 +1,212 @@
+from __future__ import annotations
+
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+from .data_models import ConvFinQARecord, Dialogue, Document, Features, Number
+
+# Slotted, array-backed stand-ins for the pydantic record models, for keeping
+# a whole dataset resident (e.g. the serve process). Pydantic validates once at
+# the boundary (LazyRecords / from_model); after that records are plain slots:
+#   - labels, ids and text are sys.intern'ed (filings repeat across records)
+#   - a table is row/col label tuples + one float64 value array + a uint8 cell
+#     kind array, with non-numeric cells kept aside
+# The attribute names match ConvFinQARecord/Document/Dialogue/Features, so
+# dataset, retrieval, evaluation and metrics code takes either via duck typing.
+
+# Cell kinds in CompactTable.kinds
+MISSING, FLOAT, INT, TEXT = 0, 1, 2, 3
+
+
+def _intern(s: str) -> str:
+    return sys.intern(str(s))
+
+
+class CompactTable(Mapping[str, Dict[str, Optional[Number]]]):
+    """
+    Read-only dict[col][row] -> value view over label arrays + values.
+    Iterating it yields the same (col, {row: value}) structure as Document.table.
+    """
+
+    __slots__ = ("rows", "cols", "data", "kinds", "text")
+
+    def __init__(self, rows: Tuple[str, ...], cols: Tuple[str, ...], data: np.ndarray, kinds: np.ndarray, text: Dict[Tuple[int, int], str]):
+        self.rows = rows
+        self.cols = cols
+        self.data = data
+        self.kinds = kinds
+        self.text = text
+
+    @classmethod
+    def from_dict(cls, table: Mapping[str, Mapping[str, object]]) -> CompactTable:
+        """Pack a column -> row -> value table, interning labels and text cells."""
+        cols = tuple(_intern(c) for c in table)
+        row_pos: Dict[str, int] = {}
+        for rowmap in table.values():
+            for row in rowmap:
+                row_pos.setdefault(_intern(row), len(row_pos))
+        data = np.full((len(row_pos), len(cols)), np.nan, dtype=np.float64)
+        kinds = np.zeros((len(row_pos), len(cols)), dtype=np.uint8)
+        text: Dict[Tuple[int, int], str] = {}
+        for j, rowmap in enumerate(table.values()):
+            for row, val in rowmap.items():
+                i = row_pos[row]
+                if isinstance(val, bool) or not isinstance(val, (int, float)):
+                    kinds[i, j] = TEXT
+                    text[(i, j)] = _intern(str(val))
+                else:
+                    data[i, j] = float(val)
+                    kinds[i, j] = INT if isinstance(val, int) else FLOAT
+        return cls(tuple(row_pos), cols, data, kinds, text)
+
+    @property
+    def present(self) -> np.ndarray:
+        """Boolean mask of the cells the source table had."""
+        present: np.ndarray = self.kinds != MISSING
+        return present
+
+    def value(self, i: int, j: int) -> Optional[Number]:
+        """Cell (i, j) with its original type: int, float, text, or None if absent."""
+        kind = self.kinds[i, j]
+        if kind == MISSING:
+            return None
+        if kind == TEXT:
+            return self.text[(i, j)]
+        v = float(self.data[i, j])
+        return int(v) if kind == INT else v
+
+    def column(self, j: int) -> Dict[str, Optional[Number]]:
+        """Column j as a row -> value dict (present cells only)."""
+        return {self.rows[i]: self.value(int(i), j) for i in np.flatnonzero(self.kinds[:, j])}
+
+    def __getitem__(self, col: str) -> Dict[str, Optional[Number]]:
+        try:
+            j = self.cols.index(col)
+        except ValueError:
+            raise KeyError(col) from None
+        return self.column(j)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.cols)
+
+    def __len__(self) -> int:
+        return len(self.cols)
+
+    def to_dict(self) -> Dict[str, Dict[str, Optional[Number]]]:
+        """Unpack to the plain column -> row -> value dict."""
+        return {col: self.column(j) for j, col in enumerate(self.cols)}
+
+
+class CompactDocument:
+    __slots__ = ("pre_text", "post_text", "table")
+
+    def __init__(self, pre_text: str, post_text: str, table: CompactTable):
+        self.pre_text = pre_text
+        self.post_text = post_text
+        self.table = table
+
+
+class CompactDialogue:
+    __slots__ = ("conv_questions", "conv_answers", "turn_program", "executed_answers", "qa_split")
+
+    def __init__(
+        self,
+        conv_questions: Tuple[str, ...],
+        conv_answers: Tuple[str, ...],
+        turn_program: Tuple[str, ...],
+        executed_answers: Tuple[Number, ...],
+        qa_split: Tuple[bool, ...],
+    ):
+        self.conv_questions = conv_questions
+        self.conv_answers = conv_answers
+        self.turn_program = turn_program
+        self.executed_answers = executed_answers
+        self.qa_split = qa_split
+
+
+class CompactFeatures:
+    __slots__ = ("num_dialogue_turns", "has_type2_question", "has_duplicate_columns", "has_non_numeric_values")
+
+    def __init__(self, num_dialogue_turns: int, has_type2_question: bool, has_duplicate_columns: bool, has_non_numeric_values: bool):
+        self.num_dialogue_turns = num_dialogue_turns
+        self.has_type2_question = has_type2_question
+        self.has_duplicate_columns = has_duplicate_columns
+        self.has_non_numeric_values = has_non_numeric_values
+
+
+class CompactRecord:
+    """Slotted ConvFinQARecord; build with from_model, go back with to_model."""
+
+    __slots__ = ("id", "doc", "dialogue", "features")
+
+    def __init__(self, id: str, doc: CompactDocument, dialogue: CompactDialogue, features: CompactFeatures):
+        self.id = id
+        self.doc = doc
+        self.dialogue = dialogue
+        self.features = features
+
+    @classmethod
+    def from_model(cls, rec: ConvFinQARecord) -> CompactRecord:
+        """Slotted, interned copy of a parsed record."""
+        d, g, f = rec.doc, rec.dialogue, rec.features
+        return cls(
+            _intern(rec.id),
+            CompactDocument(_intern(d.pre_text), _intern(d.post_text), CompactTable.from_dict(d.table)),
+            CompactDialogue(
+                tuple(_intern(q) for q in g.conv_questions),
+                tuple(_intern(a) for a in g.conv_answers),
+                tuple(_intern(p) for p in g.turn_program),
+                tuple(g.executed_answers),
+                tuple(g.qa_split),
+            ),
+            CompactFeatures(f.num_dialogue_turns, f.has_type2_question, f.has_duplicate_columns, f.has_non_numeric_values),
+        )
+
+    def to_model(self) -> ConvFinQARecord:
+        """Back to a pydantic ConvFinQARecord."""
+        g, f = self.dialogue, self.features
+        return ConvFinQARecord(
+            id=self.id,
+            doc=Document(pre_text=self.doc.pre_text, post_text=self.doc.post_text, table=self.doc.table.to_dict()),
+            dialogue=Dialogue(
+                conv_questions=list(g.conv_questions),
+                conv_answers=list(g.conv_answers),
+                turn_program=list(g.turn_program),
+                executed_answers=list(g.executed_answers),
+                qa_split=list(g.qa_split),
+            ),
+            features=Features(
+                num_dialogue_turns=f.num_dialogue_turns,
+                has_type2_question=f.has_type2_question,
+                has_duplicate_columns=f.has_duplicate_columns,
+                has_non_numeric_values=f.has_non_numeric_values,
+            ),
+        )
+
+
+class CompactRecords(Mapping[str, Any]):
+    """
+    Resident id -> CompactRecord mapping, in dataset order (values stand in for
+    ConvFinQARecord wherever records are only read).
+    """
+
+    def __init__(self, records: Mapping[str, ConvFinQARecord]):
+        self._records: Dict[str, CompactRecord] = {}
+        for rid in records:
+            rec = CompactRecord.from_model(records[rid])
+            self._records[rec.id] = rec
+
+    def __getitem__(self, record_id: str) -> CompactRecord:
+        return self._records[record_id]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._records)
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __contains__(self, record_id: object) -> bool:
+        return record_id in self._records
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .index import RetrievalIndex, open_index
+from .retrieval import top_k
+from .tracing import get_tracer
+
+# Corpus-wide BM25 over a prebuilt index (see the postings in index.py), for
+# questions that do not name a record. Two stages:
+#   1) score records on their aggregated term counts, keep the best n_docs
+#   2) score only those records' chunks, return the top k labelled by record
+# Postings are term-major arrays, so a query touches only its terms' slices.
+
+K1 = 1.2
+B = 0.75
+
+_POSTING_FILES = ("post_indptr.npy", "post_rows.npy", "post_tf.npy", "chunk_len.npy")
+
+
+class CorpusHit(NamedTuple):
+    record_id: str
+    text: str
+    score: float
+
+
+class _Postings:
+    """One BM25 level (chunks or records) over mmapped term-major postings."""
+
+    def __init__(self, index: RetrievalIndex, prefix: str, lengths: str):
+        def _arr(name: str) -> np.ndarray:
+            arr: np.ndarray = np.load(os.path.join(index.path, name), mmap_mode="r")
+            return arr
+
+        self.indptr = _arr(f"{prefix}post_indptr.npy")
+        self.rows = _arr(f"{prefix}post_rows.npy")
+        self.tf = _arr(f"{prefix}post_tf.npy")
+        lens = np.asarray(_arr(lengths), dtype=np.float32)
+        # Per-row BM25 length normaliser, precomputed once.
+        avg = float(lens.mean()) if lens.size else 1.0
+        self.norm = (K1 * (1.0 - B + B * lens / max(avg, 1e-9))).astype(np.float32)
+        df = np.diff(np.asarray(self.indptr)).astype(np.float64)
+        n = float(lens.size)
+        self.idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    def term(self, t: int) -> Tuple[np.ndarray, np.ndarray]:
+        p0, p1 = int(self.indptr[t]), int(self.indptr[t + 1])
+        return self.rows[p0:p1], self.tf[p0:p1]
+
+    def weights(self, t: int, rows: np.ndarray, tf: np.ndarray) -> np.ndarray:
+        w: np.ndarray = self.idf[t] * tf * (K1 + 1.0) / (tf + self.norm[rows])
+        return w
+
+
+class CorpusRetriever:
+    """
+    BM25 retriever across every record of a prebuilt index.
+    Exposes lookup/query/query_batch like PerDocRetriever, so PlanRAGRunner
+    can run over it; snippets are prefixed with "[record_id]".
+    """
+
+    def __init__(self, index: RetrievalIndex, n_docs: int = 10):
+        if not all(os.path.exists(os.path.join(index.path, f)) for f in _POSTING_FILES):
+            raise ValueError(f"Index at {index.path} has no BM25 postings; rebuild it with `index build`")
+        self.index = index
+        self.n_docs = n_docs
+        self.ids: List[str] = list(index.meta["ids"])
+        self.chunks = _Postings(index, "", "chunk_len.npy")
+        self.docs = _Postings(index, "doc_", "doc_len.npy")
+        self.row_offsets = np.asarray(index.row_offsets, dtype=np.int64)
+
+    @classmethod
+    def open(cls, path: str, n_docs: int = 10) -> CorpusRetriever:
+        """Memory-map the corpus index at path."""
+        return cls(open_index(path), n_docs=n_docs)
+
+    def _terms(self, q: str) -> List[int]:
+        vocab = self.index.vectorizer.vocab
+        seen: Dict[int, None] = {}
+        for tok in self.index.vectorizer._tokens(q):
+            j = vocab.get(tok)
+            if j is not None:
+                seen.setdefault(j, None)
+        return list(seen)
+
+    def top_docs(self, terms: List[int], n: int) -> np.ndarray:
+        """Positions of the n best-scoring records (stage 1), best first."""
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for t in terms:
+            rows, tf = self.docs.term(t)
+            # A term posts each record at most once, so fancy += is exact.
+            scores[rows] += self.docs.weights(t, rows, tf)
+        best = top_k(scores[None, :], n)[0]
+        kept: np.ndarray = best[scores[best] > 0]
+        return kept
+
+    def search(self, q: str, k: int = 6, n_docs: Optional[int] = None) -> List[CorpusHit]:
+        """Top-k chunks across the corpus, each labelled with its record id."""
+        terms = self._terms(q)
+        if not terms or k <= 0:
+            return []
+        with get_tracer().span("retrieve", scope="corpus", terms=len(terms), k=k) as sp:
+            docs = self.top_docs(terms, n_docs or self.n_docs)
+            if not len(docs):
+                return []
+            starts = self.row_offsets[docs]
+            ends = self.row_offsets[docs + 1]
+            base = np.concatenate(([0], np.cumsum(ends - starts)))
+            local = np.zeros(int(base[-1]), dtype=np.float32)
+            for t in terms:
+                rows, tf = self.chunks.term(t)
+                lo = np.searchsorted(rows, starts)
+                hi = np.searchsorted(rows, ends)
+                for i in np.nonzero(hi > lo)[0]:
+                    r = np.asarray(rows[lo[i]:hi[i]])
+                    local[base[i] + r - starts[i]] += self.chunks.weights(t, r, tf[lo[i]:hi[i]])
+            sp.set(docs=len(docs), chunks=len(local))
+            hits: List[CorpusHit] = []
+            for pos in top_k(local[None, :], k)[0]:
+                if local[pos] <= 0:
+                    break
+                d = int(np.searchsorted(base, pos, side="right")) - 1
+                row = int(starts[d] + pos - base[d])
+                hits.append(CorpusHit(self.ids[int(docs[d])], self.index.chunk_text(row), float(local[pos])))
+            return hits
+
+    def lookup(self, q: str) -> Optional[str]:
+        """Always None: table cells are resolved per record; across the corpus evidence comes from search."""
+        return None
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        """Top-k chunks across the corpus for one query."""
+        return self.query_batch([q], k=k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        """search() per query, each hit prefixed with its record id."""
+        return [[(f"[{h.record_id}] {h.text}", h.score) for h in self.search(q, k)] for q in queries]
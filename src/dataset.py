@@ -1,6 +1,9 @@
 from __future__ import annotations
 import json
-from typing import Dict, List, Optional
+import os
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+from .compact import CompactRecords
 from .data_models import ConvFinQARecord
 
 def load_records(path: str) -> List[ConvFinQARecord]:
@@ -11,6 +14,108 @@ def load_records(path: str) -> List[ConvFinQARecord]:
 def index_by_id(records: List[ConvFinQARecord]) -> Dict[str, ConvFinQARecord]:
     return {r.id: r for r in records}
 
+# ---------- Lazy, offset-indexed access ----------
+
+OFFSET_INDEX_SUFFIX = ".offsets.json"
+
+def build_offset_index(path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Scan the top-level JSON array once and return record id -> (byte offset, byte length).
+    Uses the C decoder's raw_decode per element, so no pydantic work happens here.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8")
+    ascii_only = len(text) == len(data)
+    decoder = json.JSONDecoder()
+    offsets: Dict[str, Tuple[int, int]] = {}
+
+    pos = text.index("[") + 1
+    byte_pos = len(text[:pos].encode("utf-8")) if not ascii_only else pos
+    n = len(text)
+    while True:
+        start = pos
+        while pos < n and text[pos] in " \t\r\n,":
+            pos += 1
+        if pos >= n or text[pos] == "]":
+            break
+        if not ascii_only:
+            byte_pos += len(text[start:pos].encode("utf-8"))
+        obj, end = decoder.raw_decode(text, pos)
+        length = (end - pos) if ascii_only else len(text[pos:end].encode("utf-8"))
+        offsets[str(obj["id"])] = (pos if ascii_only else byte_pos, length)
+        if not ascii_only:
+            byte_pos += length
+        pos = end
+    return offsets
+
+def load_offset_index(path: str) -> Dict[str, Tuple[int, int]]:
+    """
+    Reuse the sidecar offset index next to the dataset if it matches the file's
+    size/mtime, otherwise rebuild it (and try to persist it for next time).
+    """
+    sidecar = path + OFFSET_INDEX_SUFFIX
+    st = os.stat(path)
+    try:
+        with open(sidecar, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("size") == st.st_size and cached.get("mtime_ns") == st.st_mtime_ns:
+            return {k: (int(v[0]), int(v[1])) for k, v in cached["offsets"].items()}
+    except (OSError, ValueError, KeyError):
+        pass
+
+    offsets = build_offset_index(path)
+    try:
+        with open(sidecar, "w", encoding="utf-8") as f:
+            json.dump({"size": st.st_size, "mtime_ns": st.st_mtime_ns, "offsets": offsets}, f)
+    except OSError:
+        # Read-only dataset location: keep the in-memory index only.
+        pass
+    return offsets
+
+class LazyRecords(Mapping[str, ConvFinQARecord]):
+    """
+    Read-only id -> ConvFinQARecord mapping backed by the offset index.
+    Records are seeked, parsed and validated on access; nothing is kept resident.
+    Iteration follows file order, so values() streams the dataset for eval.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.offsets = load_offset_index(path)
+        self._order: List[str] = sorted(self.offsets, key=lambda rid: self.offsets[rid][0])
+
+    def __getitem__(self, record_id: str) -> ConvFinQARecord:
+        offset, length = self.offsets[record_id]
+        with open(self.path, "rb") as f:
+            f.seek(offset)
+            raw = f.read(length)
+        return ConvFinQARecord.model_validate_json(raw)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._order)
+
+    def __len__(self) -> int:
+        return len(self._order)
+
+    def __contains__(self, record_id: object) -> bool:
+        return record_id in self.offsets
+
+def load_compact_records(path: str) -> CompactRecords:
+    """
+    Whole dataset resident as slotted/columnar CompactRecords (see compact.py);
+    each record is pydantic-validated once on the way in, then dropped.
+    """
+    return CompactRecords(LazyRecords(path))
+
+def iter_records(path: str, limit: Optional[int] = None) -> Iterator[ConvFinQARecord]:
+    """Generator over records in file order, validating one at a time."""
+    store = LazyRecords(path)
+    for i, rid in enumerate(store):
+        if limit is not None and i >= limit:
+            break
+        yield store[rid]
+
 def get_turn_question(record: ConvFinQARecord, turn: Optional[int]) -> str:
     # default to the last turn if not specified
     if not record.dialogue.conv_questions:
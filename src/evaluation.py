@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import threading
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
+
+from .data_models import ConvFinQARecord
+from .dataset import get_turn_gold, get_turn_question
+from .executor import PlanRAGRunner
+from .logger import get_logger
+from .metrics import numeric_match, numeric_match_batch
+from .retrieval import Retriever, load_retriever
+from .tracing import StageTimes, stage_times
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+logger = get_logger(__name__)
+
+EvalResult = Dict[str, object]
+
+# Per-stage wall time columns in a result row -> the span names summed into them.
+# Node spans run concurrently, so stage totals can exceed the row's seconds.
+STAGES: Dict[str, Tuple[str, ...]] = {
+    "plan_ms": ("plan",),
+    "prefetch_ms": ("prefetch",),
+    "retrieve_ms": ("evidence",),
+    "generate_ms": ("generate", "generate_batch"),
+    "aggregate_ms": ("aggregate",),
+    "llm_ms": ("llm",),
+}
+FEATURES = ("num_dialogue_turns", "has_type2_question", "has_duplicate_columns", "has_non_numeric_values")
+
+
+def evaluate_record(
+    rec: ConvFinQARecord,
+    index_path: Optional[str] = None,
+    retriever: Optional[Retriever] = None,
+    concurrency: int = 1,
+) -> Optional[EvalResult]:
+    """
+    Run the last turn of one record and score it against executed_answers.
+    Returns None when the record has no question/gold to evaluate.
+    A prebuilt `retriever` (e.g. from the server's cache) skips load_retriever.
+    `concurrency` is how many records the caller evaluates at once (sizes the node pool).
+    """
+    q = get_turn_question(rec, turn=None)
+    gold = get_turn_gold(rec, turn=None)
+    if gold is None or not q:
+        return None
+    t0 = time.perf_counter()
+    if retriever is None:
+        retriever = load_retriever(rec, index_path)
+    runner = PlanRAGRunner(retriever, concurrency=concurrency)
+    with stage_times() as st:
+        final, _ans, _ret = runner.run(q)
+    return _score(rec, q, str(gold), final, t0, st)
+
+
+async def aevaluate_record(
+    rec: ConvFinQARecord,
+    index_path: Optional[str] = None,
+    retriever: Optional[Retriever] = None,
+    concurrency: int = 1,
+) -> Optional[EvalResult]:
+    """Async counterpart of evaluate_record (drives PlanRAGRunner.arun)."""
+    q = get_turn_question(rec, turn=None)
+    gold = get_turn_gold(rec, turn=None)
+    if gold is None or not q:
+        return None
+    t0 = time.perf_counter()
+    if retriever is None:
+        retriever = load_retriever(rec, index_path)
+    runner = PlanRAGRunner(retriever, concurrency=concurrency)
+    with stage_times() as st:
+        final, _ans, _ret = await runner.arun(q)
+    return _score(rec, q, str(gold), final, t0, st)
+
+
+def _score(rec: ConvFinQARecord, q: str, gold: str, final: str, t0: float, st: Optional[StageTimes] = None) -> EvalResult:
+    row: EvalResult = {
+        "id": rec.id,
+        "turn": len(rec.dialogue.conv_questions) - 1,
+        "question": q,
+        "prediction": final,
+        "gold": gold,
+        "match": numeric_match(final, gold),
+        "seconds": round(time.perf_counter() - t0, 4),
+    }
+    if st is not None:
+        for col, names in STAGES.items():
+            row[col] = round(sum(st.ms.get(n, 0.0) for n in names), 3)
+    for f in FEATURES:
+        row[f] = getattr(rec.features, f)
+    return row
+
+
+def read_checkpoint(path: str) -> Dict[str, EvalResult]:
+    """
+    Completed results from a JSONL checkpoint (last entry per id wins).
+    Errored entries and a torn trailing line from an interrupted run are ignored.
+    """
+    done: Dict[str, EvalResult] = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                row = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict) and "id" in row and not row.get("error"):
+                done[str(row["id"])] = row
+    return done
+
+
+class _CheckpointWriter:
+    """Appends one JSON line per result; safe to share between worker threads."""
+
+    def __init__(self, path: Optional[str]):
+        self._lock = threading.Lock()
+        self._f = open(path, "a", encoding="utf-8") if path else None
+
+    def write(self, row: EvalResult) -> None:
+        if self._f is None:
+            return
+        with self._lock:
+            self._f.write(json.dumps(row) + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        if self._f is not None:
+            self._f.close()
+
+
+def run_eval(
+    records: Mapping[str, ConvFinQARecord],
+    ids: List[str],
+    index_path: Optional[str] = None,
+    workers: int = 1,
+    checkpoint: Optional[str] = None,
+    use_async: bool = False,
+    retriever_for: Optional[Callable[[ConvFinQARecord], Retriever]] = None,
+) -> List[EvalResult]:
+    """
+    Evaluate the given record ids, up to `workers` at a time
+    (threads by default, or tasks on one event loop with use_async).
+    Records already present in `checkpoint` are not re-run; every new result
+    (including failures, tagged with "error") is appended to it as it finishes.
+    Records are loaded inside the worker, so only in-flight ones are resident.
+    `retriever_for` overrides how a record's retriever is obtained.
+    """
+    done = read_checkpoint(checkpoint) if checkpoint else {}
+    results: List[EvalResult] = [done[rid] for rid in ids if rid in done]
+    todo = [rid for rid in ids if rid not in done]
+    writer = _CheckpointWriter(checkpoint)
+
+    def _one(rid: str) -> Optional[EvalResult]:
+        try:
+            rec = records[rid]
+            return evaluate_record(rec, index_path, retriever_for(rec) if retriever_for else None, concurrency=workers)
+        except Exception as e:
+            logger.warning("eval failed for %s: %s", rid, e)
+            return {"id": rid, "error": f"{type(e).__name__}: {e}", "match": False}
+
+    async def _aone(rid: str) -> Optional[EvalResult]:
+        try:
+            rec = records[rid]
+            return await aevaluate_record(rec, index_path, retriever_for(rec) if retriever_for else None, concurrency=workers)
+        except Exception as e:
+            logger.warning("eval failed for %s: %s", rid, e)
+            return {"id": rid, "error": f"{type(e).__name__}: {e}", "match": False}
+
+    async def _aworker(queue: asyncio.Queue[Optional[str]]) -> None:
+        while True:
+            rid = await queue.get()
+            if rid is None:
+                return
+            _collect(await _aone(rid))
+
+    async def _arun_all() -> None:
+        # Same bound as the threaded path: `workers` tasks, at most 2x workers ids queued.
+        n = max(1, workers)
+        queue: asyncio.Queue[Optional[str]] = asyncio.Queue(maxsize=2 * n)
+
+        async def _feed() -> None:
+            for rid in todo:
+                await queue.put(rid)
+            for _ in range(n):
+                await queue.put(None)
+
+        await asyncio.gather(_feed(), *(_aworker(queue) for _ in range(n)))
+
+    def _collect(row: Optional[EvalResult]) -> None:
+        if row is None:
+            return
+        writer.write(row)
+        results.append(row)
+
+    try:
+        if use_async:
+            asyncio.run(_arun_all())
+        elif workers <= 1:
+            for rid in todo:
+                _collect(_one(rid))
+        else:
+            # Bounded submission keeps at most 2x workers records in flight.
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pending: Set[Future[Optional[EvalResult]]] = set()
+                for rid in todo:
+                    if len(pending) >= 2 * workers:
+                        finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for fut in finished:
+                            _collect(fut.result())
+                    pending.add(pool.submit(_one, rid))
+                for fut in as_completed(pending):
+                    _collect(fut.result())
+    finally:
+        writer.close()
+    return results
+
+
+def _pandas() -> Any:
+    try:
+        import pandas as pd
+    except ImportError as e:
+        raise RuntimeError("Results tables need pandas (pip install pandas)") from e
+    return pd
+
+
+def results_frame(results: Sequence[EvalResult]) -> pd.DataFrame:
+    """Eval rows as a DataFrame (one row per record/turn; errored rows keep their error)."""
+    pd = _pandas()
+    df = pd.DataFrame(list(results))
+    for col in ("prediction", "gold"):
+        if col in df:
+            df[col] = df[col].astype("string")
+    return df
+
+
+def write_results(results: Sequence[EvalResult], path: str) -> str:
+    """Write eval rows to .parquet (needs pyarrow or fastparquet) or .csv, by extension."""
+    df = results_frame(results)
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        try:
+            df.to_parquet(path, index=False)
+        except ImportError as e:
+            raise RuntimeError(f"Writing {path} needs pyarrow or fastparquet; install one or use a .csv path") from e
+    return path
+
+
+def load_results(path: str) -> pd.DataFrame:
+    """Read a table written by write_results (.csv or parquet) back into a DataFrame."""
+    pd = _pandas()
+    if path.endswith(".csv"):
+        return pd.read_csv(path, dtype={"prediction": "string", "gold": "string"}, keep_default_na=False)
+    return pd.read_parquet(path)
+
+
+def slice_report(
+    df: pd.DataFrame,
+    by: Sequence[str] = FEATURES,
+    abs_tol: float = 1e-4,
+    rel_tol: float = 0.01,
+) -> pd.DataFrame:
+    """
+    Accuracy and latency per value of each `by` column (plus an "all" row).
+    Matches are recomputed with numeric_match_batch so tolerances can differ
+    from the run; errored rows count as misses.
+    """
+    pd = _pandas()
+    df = df.copy()
+    ok = df["error"].isna() if "error" in df else pd.Series(True, index=df.index)
+    preds = df["prediction"].fillna("").astype(str).to_numpy() if "prediction" in df else [""] * len(df)
+    golds = df["gold"].fillna("").astype(str).to_numpy() if "gold" in df else [""] * len(df)
+    df["match"] = numeric_match_batch(preds, golds, abs_tol=abs_tol, rel_tol=rel_tol) & ok.to_numpy()
+    stages = [c for c in STAGES if c in df]
+    agg: Dict[str, Tuple[str, Any]] = {"n": ("match", "size"), "accuracy": ("match", "mean")}
+    if "seconds" in df:
+        agg.update(p50_s=("seconds", "median"), p95_s=("seconds", lambda s: s.quantile(0.95)))
+    agg.update({f"mean_{c}": (c, "mean") for c in stages})
+    df["all"] = "all"
+    parts = []
+    for col in ["all", *[c for c in by if c in df]]:
+        g = df.groupby(col, dropna=False).agg(**agg).reset_index().rename(columns={col: "value"})
+        g.insert(0, "feature", col)
+        g["value"] = g["value"].astype(str)
+        parts.append(g)
+    return pd.concat(parts, ignore_index=True)
@@ -1,11 +1,110 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple, Set
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, AsyncIterator, ContextManager, Dict, Iterator, List, Optional, Set, Tuple
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+import asyncio
 import os
+import threading
+import time
+
+from .retrieval import CachingRetriever, Retriever
+from .planrag import PlanDAG, PlanNode, acall_planner, call_planner, heuristic_plan
+from .generation import (
+    BatchItem,
+    acall_generator,
+    acall_generator_batch,
+    astream_aggregator,
+    call_generator,
+    call_generator_batch,
+    stream_aggregator,
+)
+from .logger import get_logger
+from .program import ProgramError, answer_value, exact_value, execute_program, format_value, parse_program, table_row
+from .tracing import get_tracer, submit
+
+logger = get_logger(__name__)
+
+# Streaming event emitted by PlanRAGRunner.stream / astream (see stream()).
+Event = Dict[str, Any]
+# (node id, snippets, answer) for one solved node.
+Solved = Tuple[str, List[str], str]
+
+# Upper bound on node threads in the process, whatever runners ask for.
+MAX_POOL_WORKERS = int(os.getenv("NODE_POOL_MAX", "64"))
+
+_POOL: Optional[ThreadPoolExecutor] = None
+_POOL_SIZE = 0
+_POOL_LOCK = threading.Lock()
+
+
+def shared_pool(max_workers: int) -> ThreadPoolExecutor:
+    """
+    Process-wide worker pool, reused across runs and runners so threads are
+    not created and torn down for every question. There is one pool, sized to
+    the largest request so far (at most MAX_POOL_WORKERS); a larger request
+    replaces it. The replaced pool is not shut down, since runs in flight may
+    still submit to it: it drains, and its idle threads exit once the last run
+    holding it lets go.
+    """
+    global _POOL, _POOL_SIZE
+    size = max(1, min(max_workers, MAX_POOL_WORKERS))
+    with _POOL_LOCK:
+        if _POOL is None or size > _POOL_SIZE:
+            _POOL = ThreadPoolExecutor(max_workers=size, thread_name_prefix="planrag")
+            _POOL_SIZE = size
+        return _POOL
+
+
+def _parent_answers(node: PlanNode, answers: Dict[str, str]) -> Dict[str, str]:
+    return {pid: answers[pid] for pid in node.depends_on if pid in answers}
+
+
+def _subquery_context(dag: PlanDAG, node: PlanNode) -> str:
+    """The node's subquery and its parents' (years mentioned there are not answers)."""
+    return " ".join([node.text] + [dag.nodes[pid].text for pid in node.depends_on if pid in dag.nodes])
+
+
+def _subtracts_across_rows(program: str, parents: Dict[str, str]) -> bool:
+    """True when a subtract step takes table cells from two different rows (not one metric over time)."""
+    rows = {pid: table_row(a) for pid, a in parents.items()}
+    for op, args in parse_program(program):
+        if op != "subtract":
+            continue
+        found = {rows.get(a[1:]) for a in args if a.startswith("#") and not a[1:].isdigit()}
+        found.discard(None)
+        if len(found) > 1:
+            return True
+    return False
+
+
+class NodeMemory:
+    """
+    Answers of previously solved nodes, keyed by normalised subquery text plus
+    the parent answers it was conditioned on (so a reused answer is exactly
+    what solving the node again would be asked). Written only by the
+    dispatching thread; see session.ConversationSession.
+    """
+
+    def __init__(self) -> None:
+        self.entries: Dict[str, Tuple[str, List[str]]] = {}
+        self.hits = 0
+
+    @staticmethod
+    def key(node: PlanNode, parents: Dict[str, str]) -> str:
+        """Normalised node text plus its parents' answers: same key means the same evidence and inputs."""
+        text = " ".join(node.text.lower().split())
+        return text + "\x1f" + "\x1f".join(sorted(parents.values()))
+
+    def get(self, node: PlanNode, parents: Dict[str, str]) -> Optional[Tuple[str, List[str]]]:
+        """Remembered (answer, snippets) for node given its parents' answers, if any."""
+        hit = self.entries.get(self.key(node, parents))
+        if hit is not None:
+            self.hits += 1
+        return hit
+
+    def put(self, node: PlanNode, parents: Dict[str, str], answer: str, snippets: List[str]) -> None:
+        """Remember a solved node."""
+        self.entries[self.key(node, parents)] = (answer, snippets)
 
-from .retrieval import PerDocRetriever
-from .planrag import PlanDAG, call_planner
-from .generation import call_generator, call_aggregator
 
 class PlanRAGRunner:
     """
@@ -13,58 +112,497 @@ class PlanRAGRunner:
     Falls back to simple heuristics if no OPENAI_API_KEY is present.
     """
 
-    def __init__(self, retriever: PerDocRetriever, max_workers: int = 4, k_docs: int = 6):
+    def __init__(
+        self,
+        retriever: Retriever,
+        max_workers: int = 4,
+        k_docs: int = 6,
+        batch: Optional[bool] = None,
+        prefetch: Optional[bool] = None,
+        concurrency: int = 1,
+    ):
+        """
+        max_workers: node tasks in flight per question (<= 1 runs nodes inline).
+        concurrency: questions the caller runs at once; the shared node pool is
+        sized max_workers x concurrency so concurrent questions do not queue
+        behind each other. How many LLM calls actually run is up to the
+        LLMScheduler, not the thread count.
+        """
+        # Speculative retrieval while the LLM plans (default on; PREFETCH=off disables).
+        self.prefetch = prefetch if prefetch is not None else os.getenv("PREFETCH", "on").lower() not in {"0", "false", "off"}
+        if self.prefetch and not isinstance(retriever, CachingRetriever):
+            # Prefetched lookups/searches are handed to the real plan's nodes through this cache.
+            retriever = CachingRetriever(retriever)
         self.retriever = retriever
         self.max_workers = max_workers
+        self.concurrency = max(1, concurrency)
         self.k_docs = k_docs
+        # Batched generation: ready siblings share one generator call (default from GEN_BATCH).
+        self.batch = batch if batch is not None else os.getenv("GEN_BATCH", "").lower() in {"1", "true", "on"}
+
+    @staticmethod
+    def _compute(node: PlanNode, parents: Dict[str, str], context: str = "") -> Optional[str]:
+        """
+        Evaluate a compute node's program from numeric parent answers; None -> use the LLM.
+        `context` is the subquery text whose years are not taken for answer values.
+        """
+        if not node.program:
+            return None
+        try:
+            if _subtracts_across_rows(node.program, parents):
+                return None
+        except ProgramError:
+            return None
+        refs = {pid: v for pid, v in ((pid, answer_value(a, context)) for pid, a in parents.items()) if v is not None}
+        try:
+            return format_value(execute_program(node.program, refs))
+        except ProgramError:
+            return None
+
+    def _evidence(self, nodes: List[PlanNode], fallback: bool = False) -> Dict[str, List[str]]:
+        """
+        Evidence for a frontier of ready nodes: a resolved table cell where one
+        exists, otherwise one batched text search for the rest. Compute nodes
+        are skipped up front; pass fallback=True once their program has failed
+        and they go to the LLM instead.
+        """
+        out: Dict[str, List[str]] = {}
+        if not nodes:
+            return out
+        with get_tracer().span("evidence", nodes=len(nodes)) as sp:
+            search: List[PlanNode] = []
+            for node in nodes:
+                if node.program and not fallback:
+                    continue
+                # A single resolved table cell beats fuzzy text search for metric fetches.
+                cell = self.retriever.lookup(node.text)
+                if cell is not None:
+                    out[node.id] = [cell]
+                else:
+                    search.append(node)
+            if search:
+                # Retrieve top-k evidence snippets (restricted to this document)
+                batch = self.retriever.query_batch([n.text for n in search], k=self.k_docs)
+                for node, hits in zip(search, batch):
+                    out[node.id] = [h[0] for h in hits]
+            sp.set(table_cells=len(out) - len(search), text_searches=len(search))
+        return out
+
+    def _pool(self) -> ThreadPoolExecutor:
+        return shared_pool(max(1, self.max_workers or 1) * self.concurrency)
+
+    def _speculating(self) -> bool:
+        # Without an API key the planner is heuristic_plan itself: nothing to overlap.
+        return bool(self.prefetch and os.getenv("OPENAI_API_KEY"))
+
+    def _prefetch(self, question: str) -> Set[str]:
+        """
+        Speculative evidence for the question while the planner runs: table
+        lookups and one batched search for heuristic_plan's retrieval nodes,
+        plus the raw question. Results land in the CachingRetriever, so real
+        plan nodes with the same text reuse them. Returns the normalised texts.
+        """
+        with get_tracer().span("prefetch") as sp:
+            guess = [n.text for n in heuristic_plan(question).nodes.values() if not n.program]
+            search = [q for q in guess if self.retriever.lookup(q) is None]
+            self.retriever.query_batch(search + [question], k=self.k_docs)
+            sp.set(nodes=len(guess), text_searches=len(search) + 1)
+            return {CachingRetriever._norm(q) for q in guess + [question]}
+
+    @staticmethod
+    def _prefetch_reused(dag: PlanDAG, prefetched: Set[str]) -> int:
+        return sum(1 for n in dag.nodes.values() if CachingRetriever._norm(n.text) in prefetched)
 
-    def run(self, question: str) -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
+    def _final_leaf(self, dag: PlanDAG, answers: Dict[str, str]) -> Optional[str]:
+        """
+        The answer of the DAG's only leaf when the aggregator could only restate
+        it: the leaf is a program that was executed locally, and every input is
+        the cell the table index resolves for that parent's subquery, all from
+        one row. Search hits or generator answers that merely look like table
+        lines do not count. Else None.
+        """
+        leaves = dag.leaves()
+        if len(leaves) != 1:
+            return None
+        leaf = leaves[0]
+        program = leaf.program
+        if not program or leaf.id not in answers:
+            return None
+        refs: Dict[str, float] = {}
+        rows: Set[Optional[str]] = set()
+        for pid in leaf.depends_on:
+            parent = dag.nodes.get(pid)
+            answer = answers.get(pid, "").strip()
+            if parent is None or not answer or self.retriever.lookup(parent.text) != answer:
+                return None
+            v = exact_value(answer)
+            if v is None:
+                return None
+            refs[pid] = v
+            rows.add(table_row(answer))
+        if len(rows) != 1 or None in rows:
+            return None
+        try:
+            value = format_value(execute_program(program, refs))
+        except ProgramError:
+            return None
+        # Not equal -> the leaf was answered some other way (LLM fallback, memory).
+        return value if value == answers[leaf.id].strip() else None
+
+    @staticmethod
+    def _node_span(node: PlanNode, queued_at: Optional[float]) -> Tuple[ContextManager[Any], Optional[float]]:
+        sp = get_tracer().span("node", node_id=node.id, depth=node.depth)
+        return sp, (None if queued_at is None else round((time.perf_counter() - queued_at) * 1000.0, 3))
+
+    def _solve(
+        self, node: PlanNode, parents: Dict[str, str], snips: Optional[List[str]] = None, queued_at: Optional[float] = None, context: str = ""
+    ) -> Solved:
+        span, wait_ms = self._node_span(node, queued_at)
+        with span as sp:
+            sp.set(queue_wait_ms=wait_ms)
+            computed = self._compute(node, parents, context)
+            if computed is not None:
+                sp.set(kind="compute")
+                return node.id, [], computed
+            if snips is None:
+                snips = self._evidence([node], fallback=True).get(node.id, [])
+            sp.set(kind="llm", snippets=len(snips))
+            # LLM generation per node (or heuristic fallback inside call_generator)
+            ans = call_generator(subquery=node.text, parents=parents, snippets=snips)
+            return node.id, snips, ans
+
+    async def _asolve(
+        self, node: PlanNode, parents: Dict[str, str], snips: Optional[List[str]] = None, queued_at: Optional[float] = None, context: str = ""
+    ) -> Solved:
+        span, wait_ms = self._node_span(node, queued_at)
+        with span as sp:
+            sp.set(queue_wait_ms=wait_ms)
+            computed = self._compute(node, parents, context)
+            if computed is not None:
+                sp.set(kind="compute")
+                return node.id, [], computed
+            if snips is None:
+                # Retrieval is synchronous (sparse products, table lookups): keep it off the loop.
+                evidence = await asyncio.to_thread(self._evidence, [node], True)
+                snips = evidence.get(node.id, [])
+            sp.set(kind="llm", snippets=len(snips))
+            ans = await acall_generator(subquery=node.text, parents=parents, snippets=snips)
+            return node.id, snips, ans
+
+    def _groups(self, frontier: List[PlanNode]) -> List[List[PlanNode]]:
+        """How a frontier is dispatched: one batch of all siblings, or one node per task."""
+        if self.batch and len(frontier) > 1:
+            return [frontier]
+        return [[node] for node in frontier]
+
+    def _split_batch(
+        self, dag: PlanDAG, nodes: List[PlanNode], parents: Dict[str, Dict[str, str]], evidence: Dict[str, List[str]]
+    ) -> Tuple[Dict[str, Solved], List[BatchItem]]:
+        """
+        Compute nodes are answered locally; the rest become batched-generation
+        items (failed programs get their evidence fetched here).
+        """
+        done: Dict[str, Solved] = {}
+        pending: List[PlanNode] = []
+        for node in nodes:
+            computed = self._compute(node, parents[node.id], _subquery_context(dag, node))
+            if computed is not None:
+                done[node.id] = (node.id, [], computed)
+            else:
+                pending.append(node)
+        missing = [n for n in pending if n.id not in evidence]
+        if missing:
+            evidence = {**evidence, **self._evidence(missing, fallback=True)}
+        items: List[BatchItem] = [(n.id, n.text, parents[n.id], evidence.get(n.id, [])) for n in pending]
+        return done, items
+
+    def _solve_group(
+        self,
+        dag: PlanDAG,
+        nodes: List[PlanNode],
+        parents: Dict[str, Dict[str, str]],
+        evidence: Dict[str, List[str]],
+        queued_at: Optional[float] = None,
+    ) -> List[Solved]:
+        """
+        Solve sibling nodes together: one call_generator_batch for every node
+        that needs the LLM, then per-node calls for any answer the batch reply
+        did not provide.
+        """
+        if len(nodes) == 1:
+            node = nodes[0]
+            return [self._solve(node, parents[node.id], evidence.get(node.id), queued_at, _subquery_context(dag, node))]
+        with get_tracer().span("batch", nodes=len(nodes)) as sp:
+            done, items = self._split_batch(dag, nodes, parents, evidence)
+            answered = call_generator_batch(items) if len(items) > 1 else {}
+            sp.set(batched=len(answered), fallback=len(items) - len(answered))
+            for nid, _q, _p, snips in items:
+                if nid in answered:
+                    done[nid] = (nid, snips, answered[nid])
+            for node in nodes:
+                if node.id not in done:
+                    done[node.id] = self._solve(node, parents[node.id], evidence.get(node.id), context=_subquery_context(dag, node))
+            return [done[n.id] for n in nodes]
+
+    async def _asolve_group(
+        self,
+        dag: PlanDAG,
+        nodes: List[PlanNode],
+        parents: Dict[str, Dict[str, str]],
+        evidence: Dict[str, List[str]],
+        queued_at: Optional[float] = None,
+    ) -> List[Solved]:
+        if len(nodes) == 1:
+            node = nodes[0]
+            return [await self._asolve(node, parents[node.id], evidence.get(node.id), queued_at, _subquery_context(dag, node))]
+        with get_tracer().span("batch", nodes=len(nodes)) as sp:
+            done, items = await asyncio.to_thread(self._split_batch, dag, nodes, parents, evidence)
+            answered = await acall_generator_batch(items) if len(items) > 1 else {}
+            sp.set(batched=len(answered), fallback=len(items) - len(answered))
+            for nid, _q, _p, snips in items:
+                if nid in answered:
+                    done[nid] = (nid, snips, answered[nid])
+            rest = [n for n in nodes if n.id not in done]
+            for res in await asyncio.gather(*(self._asolve(n, parents[n.id], evidence.get(n.id), context=_subquery_context(dag, n)) for n in rest)):
+                done[res[0]] = res
+            return [done[n.id] for n in nodes]
+
+    @staticmethod
+    def _frontier(
+        dag: PlanDAG,
+        answers: Dict[str, str],
+        retrieved: Dict[str, List[str]],
+        running: Set[str],
+        memory: Optional[NodeMemory],
+    ) -> Tuple[List[PlanNode], List[str]]:
+        """
+        Ready nodes that still need work, plus the ids of nodes answered in
+        place from memory while getting there.
+        """
+        recalled: List[str] = []
+        while True:
+            frontier = [n for n in dag.ready(set(answers.keys())) if n.id not in running]
+            if memory is None:
+                return frontier, recalled
+            todo: List[PlanNode] = []
+            for node in frontier:
+                hit = memory.get(node, _parent_answers(node, answers))
+                if hit is None:
+                    todo.append(node)
+                else:
+                    answers[node.id], retrieved[node.id] = hit[0], list(hit[1])
+                    recalled.append(node.id)
+            if len(todo) == len(frontier):
+                return todo, recalled
+
+    @staticmethod
+    def _node_event(dag: PlanDAG, nid: str, answers: Dict[str, str], retrieved: Dict[str, List[str]], cached: bool) -> Event:
+        return {"type": "node", "id": nid, "text": dag.nodes[nid].text, "answer": answers[nid], "snippets": retrieved[nid], "cached": cached}
+
+    def run(self, question: str, memory: Optional[NodeMemory] = None) -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
         """
         Orchestrates:
-          1) LLM plan (PlanDAG)
-          2) Depth-by-depth execution; nodes at same depth can run in parallel
-          3) LLM aggregation to produce final answer
+          1) LLM plan (PlanDAG), while retrieval for heuristic_plan's guess of
+             it is prefetched into the retriever cache (see _prefetch)
+          2) Dependency-driven execution: each node is dispatched to the shared
+             pool as soon as all of its depends_on are answered (nodes already
+             in `memory` are answered from it without retrieval or LLM)
+          3) LLM aggregation to produce final answer, skipped when the DAG's
+             only leaf already answered with a bare value
 
         Returns:
           (final_answer, answers_by_node, snippets_by_node)
         """
-        dag: PlanDAG = call_planner(question)
-        answers: Dict[str, str] = {}
-        retrieved: Dict[str, List[str]] = {}
+        final: Event = {}
+        for event in self.stream(question, memory):
+            if event["type"] == "final":
+                final = event
+        return final["answer"], final["answers"], final["retrieved"]
 
-        # Keep executing until all nodes answered
-        while True:
-            ready = dag.ready(set(answers.keys()))
-            if not ready:
-                break
+    def stream(self, question: str, memory: Optional[NodeMemory] = None) -> Iterator[Event]:
+        """
+        run() as a sequence of events, emitted as soon as each is known:
+          {"type": "plan", "nodes": [...]}                      planner finished
+          {"type": "node", "id", "text", "answer", "snippets", "cached"}
+                                                                one per node, in completion order
+          {"type": "token", "text"}                             aggregator output chunks
+          {"type": "final", "answer", "answers", "retrieved"}   always last
+        """
+        with get_tracer().span("question", question=question) as sp:
+            spec: Optional[Future[Set[str]]] = None
+            if self._speculating():
+                spec = submit(self._pool(), self._prefetch, question)
+            dag: PlanDAG = call_planner(question)
+            if spec is not None and not spec.cancel():
+                # Already running: let it finish rather than repeat its searches.
+                try:
+                    sp.set(prefetch_reused=self._prefetch_reused(dag, spec.result()))
+                except Exception as e:
+                    logger.debug("prefetch failed: %s", e)
+            yield {"type": "plan", "nodes": [n.model_dump() for n in dag.nodes.values()]}
+            answers: Dict[str, str] = {}
+            retrieved: Dict[str, List[str]] = {}
+            for nid, cached in self._execute(dag, answers, retrieved, memory):
+                yield self._node_event(dag, nid, answers, retrieved, cached)
 
-            # Execute one depth at a time (parallel across nodes at that depth)
-            current_depth = min(n.depth for n in ready)
-            batch = [n for n in ready if n.depth == current_depth]
+            # Final aggregation via LLM (with internal fallback), streamed as it is generated
+            final = "No answer."
+            leaf = self._final_leaf(dag, answers)
+            if leaf is not None:
+                sp.set(aggregate="skipped")
+                final = leaf
+                yield {"type": "token", "text": leaf}
+            elif answers:
+                parts: List[str] = []
+                for text in stream_aggregator(question, answers):
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                final = "".join(parts).strip()
+            sp.set(nodes=len(answers))
+            yield {"type": "final", "answer": final, "answers": answers, "retrieved": retrieved}
 
-            def _solve(node):
-                # Gather parent answers for context
-                parents = {pid: answers[pid] for pid in node.depends_on if pid in answers}
-                # Retrieve top-k evidence snippets (restricted to this document)
-                hits = self.retriever.query(node.text, k=self.k_docs)
-                snips = [h[0] for h in hits]
-                # LLM generation per node (or heuristic fallback inside call_generator)
-                ans = call_generator(subquery=node.text, parents=parents, snippets=snips)
-                return node.id, snips, ans
-
-            if self.max_workers and self.max_workers > 1 and len(batch) > 1:
-                with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
-                    futs = [pool.submit(_solve, node) for node in batch]
-                    for fut in as_completed(futs):
-                        nid, sn, an = fut.result()
-                        retrieved[nid] = sn
-                        answers[nid] = an
-            else:
-                for node in batch:
-                    nid, sn, an = _solve(node)
-                    retrieved[nid] = sn
-                    answers[nid] = an
-
-        # Final aggregation via LLM (with internal fallback)
-        final = call_aggregator(question, answers) if answers else "No answer."
-        return final, answers, retrieved
+    def _execute(
+        self,
+        dag: PlanDAG,
+        answers: Dict[str, str],
+        retrieved: Dict[str, List[str]],
+        memory: Optional[NodeMemory],
+    ) -> Iterator[Tuple[str, bool]]:
+        """Solve every node into answers/retrieved, yielding (node id, from memory) as each lands."""
+
+        def _record(node: PlanNode, sn: List[str], an: str) -> None:
+            retrieved[node.id] = sn
+            answers[node.id] = an
+            if memory is not None:
+                memory.put(node, _parent_answers(node, answers), an, sn)
+
+        if not (self.max_workers and self.max_workers > 1):
+            while True:
+                ready, recalled = self._frontier(dag, answers, retrieved, set(), memory)
+                for nid in recalled:
+                    yield nid, True
+                if not ready:
+                    break
+                evidence = self._evidence(ready)
+                for group in self._groups(ready):
+                    parents = {n.id: _parent_answers(n, answers) for n in group}
+                    for node, (_nid, sn, an) in zip(group, self._solve_group(dag, group, parents, evidence)):
+                        _record(node, sn, an)
+                        yield node.id, False
+            return
+
+        pool = self._pool()
+        inflight: Dict[Future[List[Solved]], List[PlanNode]] = {}
+
+        def _dispatch() -> List[str]:
+            running = {n.id for group in inflight.values() for n in group}
+            frontier, recalled = self._frontier(dag, answers, retrieved, running, memory)
+            frontier = frontier[:max(0, self.max_workers - len(inflight))]
+            evidence = self._evidence(frontier)
+            for group in self._groups(frontier):
+                # Parent answers are snapshotted (workers never see the live dict)
+                parents = {n.id: _parent_answers(n, answers) for n in group}
+                fut = submit(pool, self._solve_group, dag, group, parents, evidence, time.perf_counter())
+                inflight[fut] = group
+            return recalled
+
+        try:
+            for nid in _dispatch():
+                yield nid, True
+            while inflight:
+                done, _ = wait(list(inflight), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    group = inflight.pop(fut)
+                    for node, (_nid, sn, an) in zip(group, fut.result()):
+                        _record(node, sn, an)
+                        yield node.id, False
+                for nid in _dispatch():
+                    yield nid, True
+        finally:
+            # Consumer stopped early: drop work that has not started yet.
+            for fut in inflight:
+                fut.cancel()
+
+    async def arun(self, question: str, memory: Optional[NodeMemory] = None) -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
+        """
+        Async counterpart of run(): same dependency-driven schedule, but nodes are
+        tasks on the running event loop (at most max_workers in flight per question)
+        and the planner/generator/aggregator use the chat models' async API.
+        """
+        final: Event = {}
+        async for event in self.astream(question, memory):
+            if event["type"] == "final":
+                final = event
+        return final["answer"], final["answers"], final["retrieved"]
+
+    async def astream(self, question: str, memory: Optional[NodeMemory] = None) -> AsyncIterator[Event]:
+        """Async counterpart of stream(); same events."""
+        with get_tracer().span("question", question=question) as sp:
+            # Retrieval is CPU-bound: speculate on a worker thread while the planner awaits.
+            spec = asyncio.ensure_future(asyncio.to_thread(self._prefetch, question)) if self._speculating() else None
+            dag: PlanDAG = await acall_planner(question)
+            if spec is not None:
+                try:
+                    sp.set(prefetch_reused=self._prefetch_reused(dag, await spec))
+                except Exception as e:
+                    logger.debug("prefetch failed: %s", e)
+            yield {"type": "plan", "nodes": [n.model_dump() for n in dag.nodes.values()]}
+            answers: Dict[str, str] = {}
+            retrieved: Dict[str, List[str]] = {}
+            async for nid, cached in self._aexecute(dag, answers, retrieved, memory):
+                yield self._node_event(dag, nid, answers, retrieved, cached)
+
+            final = "No answer."
+            leaf = await asyncio.to_thread(self._final_leaf, dag, answers)
+            if leaf is not None:
+                sp.set(aggregate="skipped")
+                final = leaf
+                yield {"type": "token", "text": leaf}
+            elif answers:
+                parts: List[str] = []
+                async for text in astream_aggregator(question, answers):
+                    parts.append(text)
+                    yield {"type": "token", "text": text}
+                final = "".join(parts).strip()
+            sp.set(nodes=len(answers))
+            yield {"type": "final", "answer": final, "answers": answers, "retrieved": retrieved}
+
+    async def _aexecute(
+        self,
+        dag: PlanDAG,
+        answers: Dict[str, str],
+        retrieved: Dict[str, List[str]],
+        memory: Optional[NodeMemory],
+    ) -> AsyncIterator[Tuple[str, bool]]:
+        limit = max(1, self.max_workers or 1)
+        inflight: Dict[asyncio.Task[List[Solved]], List[PlanNode]] = {}
+
+        async def _dispatch() -> List[str]:
+            running = {n.id for group in inflight.values() for n in group}
+            frontier, recalled = self._frontier(dag, answers, retrieved, running, memory)
+            frontier = frontier[:max(0, limit - len(inflight))]
+            evidence = await asyncio.to_thread(self._evidence, frontier) if frontier else {}
+            for group in self._groups(frontier):
+                parents = {n.id: _parent_answers(n, answers) for n in group}
+                task = asyncio.ensure_future(self._asolve_group(dag, group, parents, evidence, time.perf_counter()))
+                inflight[task] = group
+            return recalled
+
+        try:
+            for nid in await _dispatch():
+                yield nid, True
+            while inflight:
+                done, _ = await asyncio.wait(list(inflight), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    group = inflight.pop(task)
+                    for node, (_nid, sn, an) in zip(group, task.result()):
+                        retrieved[node.id] = sn
+                        answers[node.id] = an
+                        if memory is not None:
+                            memory.put(node, _parent_answers(node, answers), an, sn)
+                        yield node.id, False
+                for nid in await _dispatch():
+                    yield nid, True
+        finally:
+            for task in inflight:
+                task.cancel()
@@ -1,28 +1,122 @@
 from __future__ import annotations
+import functools
 import os
-from typing import Dict, List
-from langchain.chat_models import init_chat_model
-from langchain.schema import HumanMessage
-from .prompts import GEN_SYSTEM, GEN_USER_TEMPLATE, AGG_SYSTEM, AGG_USER_TEMPLATE
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple
+from .llm_cache import CacheMissError, acached_invoke, acached_stream, cached_invoke, cached_stream
+from .clients import get_chat_model
+from .planrag import _parse_plan_json
+from .scheduler import AGGREGATE
+from .tracing import current_span, get_tracer, traced
 
+# One batched-generation item: (node id, subquery, parent answers, snippets).
+BatchItem = Tuple[str, str, Dict[str, str], List[str]]
 
-def _chat(model_env: str, default_model: str = "gpt-4o-mini"):
+BATCH_SYSTEM_PROMPT = (
+    "You answer several atomic financial sub-questions about one document at once. "
+    "Use only the numbered evidence snippets and the given parent answers. "
+    "Be concise: give the number (with unit or %) or a short phrase for each. "
+    'Reply with a single JSON object mapping each question id to its answer string, e.g. {"2.1": "494"}.'
+)
+
+# langchain message classes and the prompts module are imported inside the
+# message builders, which only run on the LLM path (OPENAI_API_KEY set).
+
+
+def _model_name(model_env: str, default_model: str = "gpt-4o-mini") -> str:
+    return os.getenv(model_env) or default_model
+
+
+def _chat(model_env: str, default_model: str = "gpt-4o-mini") -> Any:
     """
-    Create a chat model using env vars:
+    Shared chat model (see clients.get_chat_model) using env vars:
       - OPENAI_API_KEY (required for LLM path)
       - OPENAI_BASE_URL (optional)
       - model_env: one of PLAN_MODEL / GEN_MODEL / AGG_MODEL
     Falls back to default_model if the env var is unset.
     """
-    name = os.getenv(model_env) or default_model
-    return init_chat_model(
-        name=name,
-        model_provider="openai",
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL"),
+    return get_chat_model(_model_name(model_env, default_model))
+
+
+def _generator_fallback(snippets: List[str]) -> str:
+    return snippets[0].split("\n")[0][:300] if snippets else "N/A"
+
+
+def _generator_messages(subquery: str, parents: Dict[str, str], snippets: List[str]) -> List[Any]:
+    from langchain.schema import HumanMessage
+
+    from .prompts import GEN_SYSTEM, GEN_USER_TEMPLATE
+
+    parent_str = "\n".join([f"{k}: {v}" for k, v in parents.items()]) or "(none)"
+    snip_str = "\n---\n".join(snippets[:6]) or "(no snippets)"
+
+    user = HumanMessage(
+        content=GEN_USER_TEMPLATE.format(
+            subquery=subquery,
+            parents=parent_str,
+            snippets=snip_str,
+        )
     )
+    return [GEN_SYSTEM, user]
+
+
+def _batch_messages(items: List[BatchItem]) -> List[Any]:
+    """One prompt for all items; identical snippets are listed once and referenced by number."""
+    from langchain.schema import HumanMessage, SystemMessage
+
+    numbered: Dict[str, int] = {}
+    for _nid, _q, _parents, snippets in items:
+        for snip in snippets[:6]:
+            numbered.setdefault(snip, len(numbered) + 1)
+    lines = ["Evidence:"]
+    lines.extend(f"[S{i}] {snip}" for snip, i in numbered.items())
+    if not numbered:
+        lines.append("(no snippets)")
+    lines.append("")
+    lines.append("Questions:")
+    for nid, subquery, parents, snippets in items:
+        lines.append(f"- id {nid}: {subquery}")
+        if parents:
+            lines.append("  parent answers: " + "; ".join(f"{k}: {v}" for k, v in parents.items()))
+        refs = ", ".join(f"S{numbered[s]}" for s in snippets[:6])
+        lines.append(f"  evidence: {refs or '(none)'}")
+    return [SystemMessage(content=BATCH_SYSTEM_PROMPT), HumanMessage(content="\n".join(lines))]
+
 
+def _parse_batch(text: str, items: List[BatchItem]) -> Dict[str, str]:
+    """Answers for the requested ids found in the reply (missing/invalid ones are left out)."""
+    try:
+        data = _parse_plan_json(text)
+    except ValueError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    out: Dict[str, str] = {}
+    for nid, *_rest in items:
+        val = data.get(nid)
+        if isinstance(val, (str, int, float)) and not isinstance(val, bool) and str(val).strip():
+            out[nid] = str(val).strip()
+    return out
 
+
+def _aggregator_messages(query: str, ans_str: str) -> List[Any]:
+    from langchain.schema import HumanMessage
+
+    from .prompts import AGG_SYSTEM, AGG_USER_TEMPLATE
+
+    user = HumanMessage(
+        content=AGG_USER_TEMPLATE.format(
+            query=query,
+            answers=ans_str,
+        )
+    )
+    return [AGG_SYSTEM, user]
+
+
+def _agg_model_default() -> str:
+    return os.getenv("GEN_MODEL") or "gpt-4o-mini"
+
+
+@traced("generate")
 def call_generator(subquery: str, parents: Dict[str, str], snippets: List[str]) -> str:
     """
     LLM-based subquery answering.
@@ -35,23 +129,65 @@ def call_generator(subquery: str, parents: Dict[str, str], snippets: List[str])
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
-        return snippets[0].split("\n")[0][:300] if snippets else "N/A"
+        return _generator_fallback(snippets)
 
-    chat = _chat("GEN_MODEL")
-    parent_str = "\n".join([f"{k}: {v}" for k, v in parents.items()]) or "(none)"
-    snip_str = "\n---\n".join(snippets[:6]) or "(no snippets)"
+    make_chat = functools.partial(_chat, "GEN_MODEL")
+    text = cached_invoke(make_chat, _model_name("GEN_MODEL"), _generator_messages(subquery, parents, snippets))
+    return text.strip()
 
-    user = HumanMessage(
-        content=GEN_USER_TEMPLATE.format(
-            subquery=subquery,
-            parents=parent_str,
-            snippets=snip_str,
-        )
-    )
-    resp = chat.invoke([GEN_SYSTEM, user])
-    return getattr(resp, "content", "").strip()
+
+@traced("generate")
+async def acall_generator(subquery: str, parents: Dict[str, str], snippets: List[str]) -> str:
+    """Async counterpart of call_generator (uses the chat model's ainvoke)."""
+    if not os.getenv("OPENAI_API_KEY"):
+        return _generator_fallback(snippets)
+
+    make_chat = functools.partial(_chat, "GEN_MODEL")
+    text = await acached_invoke(make_chat, _model_name("GEN_MODEL"), _generator_messages(subquery, parents, snippets))
+    return text.strip()
 
 
+@traced("generate_batch")
+def call_generator_batch(items: List[BatchItem]) -> Dict[str, str]:
+    """
+    Answer several ready subqueries with one LLM call (JSON id -> answer).
+    Ids missing from the reply (or an unparseable reply) are simply absent
+    from the result; callers answer those with call_generator.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        return {nid: _generator_fallback(snippets) for nid, _q, _p, snippets in items}
+
+    make_chat = functools.partial(_chat, "GEN_MODEL")
+    try:
+        text = cached_invoke(make_chat, _model_name("GEN_MODEL"), _batch_messages(items))
+    except CacheMissError:
+        raise
+    except Exception:
+        text = ""
+    out = _parse_batch(text, items)
+    current_span().set(nodes=len(items), parsed=len(out))
+    return out
+
+
+@traced("generate_batch")
+async def acall_generator_batch(items: List[BatchItem]) -> Dict[str, str]:
+    """Async counterpart of call_generator_batch."""
+    if not os.getenv("OPENAI_API_KEY"):
+        return {nid: _generator_fallback(snippets) for nid, _q, _p, snippets in items}
+
+    make_chat = functools.partial(_chat, "GEN_MODEL")
+    try:
+        text = await acached_invoke(make_chat, _model_name("GEN_MODEL"), _batch_messages(items))
+    except CacheMissError:
+        raise
+    except Exception:
+        text = ""
+    out = _parse_batch(text, items)
+    current_span().set(nodes=len(items), parsed=len(out))
+    return out
+
+
+@traced("aggregate")
 def call_aggregator(query: str, answers: Dict[str, str]) -> str:
     """
     LLM-based final synthesis of the overall answer from solved subqueries.
@@ -63,12 +199,48 @@ def call_aggregator(query: str, answers: Dict[str, str]) -> str:
     if not api_key:
         return f"{query}\n\nSummary:\n{ans_str}"
 
-    chat = _chat("AGG_MODEL", default_model=os.getenv("GEN_MODEL") or "gpt-4o-mini")
-    user = HumanMessage(
-        content=AGG_USER_TEMPLATE.format(
-            query=query,
-            answers=ans_str,
-        )
-    )
-    resp = chat.invoke([AGG_SYSTEM, user])
-    return getattr(resp, "content", "").strip()
+    make_chat = functools.partial(_chat, "AGG_MODEL", default_model=_agg_model_default())
+    model = _model_name("AGG_MODEL", _agg_model_default())
+    return cached_invoke(make_chat, model, _aggregator_messages(query, ans_str), AGGREGATE).strip()
+
+
+@traced("aggregate")
+async def acall_aggregator(query: str, answers: Dict[str, str]) -> str:
+    """Async counterpart of call_aggregator."""
+    ans_str = "\n".join([f"{k}: {v}" for k, v in sorted(answers.items())])
+    if not os.getenv("OPENAI_API_KEY"):
+        return f"{query}\n\nSummary:\n{ans_str}"
+
+    make_chat = functools.partial(_chat, "AGG_MODEL", default_model=_agg_model_default())
+    model = _model_name("AGG_MODEL", _agg_model_default())
+    return (await acached_invoke(make_chat, model, _aggregator_messages(query, ans_str), AGGREGATE)).strip()
+
+
+def stream_aggregator(query: str, answers: Dict[str, str]) -> Iterator[str]:
+    """
+    call_aggregator as text chunks, yielded as the model produces them
+    (the heuristic summary is a single chunk). Join and strip for the answer.
+    """
+    with get_tracer().span("aggregate", stream=True):
+        ans_str = "\n".join([f"{k}: {v}" for k, v in sorted(answers.items())])
+        if not os.getenv("OPENAI_API_KEY"):
+            yield f"{query}\n\nSummary:\n{ans_str}"
+            return
+
+        make_chat = functools.partial(_chat, "AGG_MODEL", default_model=_agg_model_default())
+        model = _model_name("AGG_MODEL", _agg_model_default())
+        yield from cached_stream(make_chat, model, _aggregator_messages(query, ans_str), AGGREGATE)
+
+
+async def astream_aggregator(query: str, answers: Dict[str, str]) -> AsyncIterator[str]:
+    """Async counterpart of stream_aggregator."""
+    with get_tracer().span("aggregate", stream=True):
+        ans_str = "\n".join([f"{k}: {v}" for k, v in sorted(answers.items())])
+        if not os.getenv("OPENAI_API_KEY"):
+            yield f"{query}\n\nSummary:\n{ans_str}"
+            return
+
+        make_chat = functools.partial(_chat, "AGG_MODEL", default_model=_agg_model_default())
+        model = _model_name("AGG_MODEL", _agg_model_default())
+        async for text in acached_stream(make_chat, model, _aggregator_messages(query, ans_str), AGGREGATE):
+            yield text
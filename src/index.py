@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import json
+import os
+import re
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .data_models import ConvFinQARecord
+
+if TYPE_CHECKING:
+    from scipy.sparse import csr_matrix
+
+# On-disk layout of a prebuilt retrieval index (one directory):
+#   meta.json          vectorizer settings + record ids (in row-block order)
+#   vocab.json         term -> column id (shared across all records)
+#   idf.npy            float32 [n_terms]
+#   data.npy           float32 CSR values   (rows are L2-normalised TF-IDF)
+#   indices.npy        int32   CSR columns
+#   indptr.npy         int64   CSR row pointers [n_chunks + 1]
+#   row_offsets.npy    int64   record i owns rows [row_offsets[i], row_offsets[i+1])
+#   chunks.bin         utf-8 chunk texts, concatenated
+#   chunk_offsets.npy  int64   byte offsets into chunks.bin [n_chunks + 1]
+# Corpus-wide BM25 postings (term-major, see corpus.CorpusRetriever):
+#   post_indptr.npy      int64   term t owns postings [post_indptr[t], post_indptr[t+1])
+#   post_rows.npy        int32   chunk row per posting, ascending within a term
+#   post_tf.npy          float32 term count in that chunk
+#   chunk_len.npy        float32 in-vocabulary tokens per chunk
+#   doc_post_indptr.npy / doc_post_rows.npy / doc_post_tf.npy / doc_len.npy
+#                                the same, aggregated per record (row = record position)
+# Arrays are opened with mmap, so loading costs no more than reading meta/vocab.
+
+INDEX_VERSION = 2
+TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+
+
+class IndexVectorizer:
+    """
+    Query-side TF-IDF transform over a prebuilt vocabulary/IDF.
+    Mirrors TfidfVectorizer defaults (lowercase, token_pattern, l2 norm) so
+    query vectors land in the same space as the stored matrix, without sklearn.
+    """
+
+    def __init__(self, vocab: Dict[str, int], idf: np.ndarray, stop_words: Iterable[str], token_pattern: str = TOKEN_PATTERN):
+        self.vocab = vocab
+        self.idf = idf
+        self.stop_words = frozenset(stop_words)
+        self._token_re = re.compile(token_pattern)
+
+    def _tokens(self, text: str) -> List[str]:
+        return [t for t in self._token_re.findall(text.lower()) if t not in self.stop_words]
+
+    def transform(self, texts: List[str]) -> csr_matrix:
+        """TF-IDF rows (L2-normalised, csr) for texts over the stored vocabulary."""
+        from scipy.sparse import csr_matrix
+
+        data: List[float] = []
+        indices: List[int] = []
+        indptr: List[int] = [0]
+        for text in texts:
+            counts: Dict[int, int] = {}
+            for tok in self._tokens(text):
+                j = self.vocab.get(tok)
+                if j is not None:
+                    counts[j] = counts.get(j, 0) + 1
+            cols = sorted(counts)
+            vals = np.array([counts[j] for j in cols], dtype=np.float64) * self.idf[cols]
+            norm = float(np.sqrt((vals ** 2).sum())) if len(cols) else 0.0
+            if norm > 0:
+                vals /= norm
+            indices.extend(cols)
+            data.extend(vals.tolist())
+            indptr.append(len(indices))
+        return csr_matrix(
+            (np.asarray(data, dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(texts), len(self.idf)),
+        )
+
+
+class RetrievalIndex:
+    """Memory-mapped view over an index directory written by build_index."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported index version in {path}: {self.meta.get('version')}")
+        with open(os.path.join(path, "vocab.json"), encoding="utf-8") as f:
+            vocab: Dict[str, int] = json.load(f)
+
+        def _arr(name: str) -> np.ndarray:
+            arr: np.ndarray = np.load(os.path.join(path, name), mmap_mode="r")
+            return arr
+
+        self.idf = np.asarray(_arr("idf.npy"), dtype=np.float64)
+        self.data = _arr("data.npy")
+        self.indices = _arr("indices.npy")
+        self.indptr = _arr("indptr.npy")
+        self.row_offsets = _arr("row_offsets.npy")
+        self.chunk_offsets = _arr("chunk_offsets.npy")
+        blob_path = os.path.join(path, "chunks.bin")
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r") if os.path.getsize(blob_path) else np.zeros(0, dtype=np.uint8)
+        self.positions: Dict[str, int] = {rid: i for i, rid in enumerate(self.meta["ids"])}
+        self.vectorizer = IndexVectorizer(vocab, self.idf, self.meta["stop_words"], self.meta["token_pattern"])
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self.positions
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def chunk_text(self, row: int) -> str:
+        """Text of chunk row, decoded from the mmapped blob."""
+        a, b = int(self.chunk_offsets[row]), int(self.chunk_offsets[row + 1])
+        return bytes(self.blob[a:b]).decode("utf-8")
+
+    def record_slice(self, record_id: str) -> Tuple[List[str], csr_matrix]:
+        """Chunks + TF-IDF rows for one record; arrays are views into the mmap."""
+        from scipy.sparse import csr_matrix
+
+        pos = self.positions.get(record_id)
+        if pos is None:
+            raise KeyError(record_id)
+        r0, r1 = int(self.row_offsets[pos]), int(self.row_offsets[pos + 1])
+        p0, p1 = int(self.indptr[r0]), int(self.indptr[r1])
+        matrix = csr_matrix(
+            (self.data[p0:p1], self.indices[p0:p1], np.asarray(self.indptr[r0:r1 + 1]) - p0),
+            shape=(r1 - r0, len(self.idf)),
+            copy=False,
+        )
+        chunks = [self.chunk_text(r) for r in range(r0, r1)]
+        return chunks, matrix
+
+
+def build_index(records: Iterable[ConvFinQARecord], out_dir: str) -> Dict[str, int]:
+    """
+    Chunk every record, fit one shared TF-IDF vocabulary over the whole corpus
+    and write the artifact described at the top of this module.
+    Returns a few counts for reporting.
+    """
+    from scipy.sparse import csc_matrix, csr_matrix
+    from sklearn.feature_extraction.text import (
+        ENGLISH_STOP_WORDS,
+        CountVectorizer,
+        TfidfVectorizer,
+    )
+
+    from .retrieval import build_doc_chunks
+
+    ids: List[str] = []
+    chunks: List[str] = []
+    row_offsets: List[int] = [0]
+    for rec in records:
+        ids.append(rec.id)
+        chunks.extend(build_doc_chunks(rec))
+        row_offsets.append(len(chunks))
+
+    vectorizer = TfidfVectorizer(stop_words="english", max_df=0.95, token_pattern=TOKEN_PATTERN, dtype=np.float32)
+    matrix = vectorizer.fit_transform(chunks).tocsr()
+    matrix.sort_indices()
+    vocab = {term: int(j) for term, j in vectorizer.vocabulary_.items()}
+
+    # Raw term counts for BM25, over the same vocabulary as the TF-IDF matrix.
+    counts = CountVectorizer(vocabulary=vocab, stop_words="english", token_pattern=TOKEN_PATTERN, dtype=np.float32).transform(chunks).tocsr()
+    doc_of_row = np.repeat(np.arange(len(ids)), np.diff(row_offsets))
+    per_doc = csr_matrix(
+        (np.ones(len(chunks), dtype=np.float32), (doc_of_row, np.arange(len(chunks)))),
+        shape=(len(ids), len(chunks)),
+    )
+    doc_counts = (per_doc @ counts).tocsr()
+    postings: Dict[str, np.ndarray] = {}
+    for prefix, mat in (("", counts), ("doc_", doc_counts)):
+        csc: csc_matrix = mat.tocsc()
+        csc.sort_indices()
+        postings[f"{prefix}post_indptr.npy"] = csc.indptr.astype(np.int64)
+        postings[f"{prefix}post_rows.npy"] = csc.indices.astype(np.int32)
+        postings[f"{prefix}post_tf.npy"] = csc.data.astype(np.float32)
+    postings["chunk_len.npy"] = np.asarray(counts.sum(axis=1), dtype=np.float32).ravel()
+    postings["doc_len.npy"] = np.asarray(doc_counts.sum(axis=1), dtype=np.float32).ravel()
+
+    encoded = [c.encode("utf-8") for c in chunks]
+    chunk_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    chunk_offsets[1:] = np.cumsum([len(b) for b in encoded])
+
+    os.makedirs(out_dir, exist_ok=True)
+    np.save(os.path.join(out_dir, "idf.npy"), vectorizer.idf_.astype(np.float32))
+    np.save(os.path.join(out_dir, "data.npy"), matrix.data.astype(np.float32))
+    np.save(os.path.join(out_dir, "indices.npy"), matrix.indices.astype(np.int32))
+    np.save(os.path.join(out_dir, "indptr.npy"), matrix.indptr.astype(np.int64))
+    np.save(os.path.join(out_dir, "row_offsets.npy"), np.asarray(row_offsets, dtype=np.int64))
+    np.save(os.path.join(out_dir, "chunk_offsets.npy"), chunk_offsets)
+    for name, arr in postings.items():
+        np.save(os.path.join(out_dir, name), arr)
+    with open(os.path.join(out_dir, "chunks.bin"), "wb") as f:
+        for b in encoded:
+            f.write(b)
+    with open(os.path.join(out_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f)
+    with open(os.path.join(out_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(
+            {
+                "version": INDEX_VERSION,
+                "token_pattern": TOKEN_PATTERN,
+                "stop_words": sorted(ENGLISH_STOP_WORDS),
+                "ids": ids,
+            },
+            f,
+        )
+    return {"records": len(ids), "chunks": len(chunks), "terms": len(vocab), "nnz": int(matrix.nnz), "postings": int(counts.nnz)}
+
+
+_OPEN: Dict[str, RetrievalIndex] = {}
+
+
+def open_index(path: str) -> RetrievalIndex:
+    """Process-wide cache so repeated lookups share one mmap."""
+    key = os.path.abspath(path)
+    idx: Optional[RetrievalIndex] = _OPEN.get(key)
+    if idx is None:
+        idx = RetrievalIndex(path)
+        _OPEN[key] = idx
+    return idx
@@ -0,0 +1,296 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+from .scheduler import GENERATE, get_scheduler
+from .tracing import get_tracer, usage_tokens
+
+# Content-addressed cache for chat completions, keyed on
+# model name + every message (system prompt and rendered user prompt).
+# Configured from env (or the CLI via configure_cache):
+#   LLM_CACHE_PATH         sqlite file; unset -> caching disabled
+#   LLM_CACHE_MODE         readwrite (default) | replay (read-only, misses raise) | off
+#   LLM_CACHE_TTL          seconds before an entry expires (unset -> never)
+#   LLM_CACHE_MAX_ENTRIES  LRU-evict beyond this many entries
+#   LLM_CACHE_MAX_MB       LRU-evict beyond this many MB of responses
+
+CACHE_MODES = ("readwrite", "replay", "off")
+_EVICT_EVERY = 64
+
+
+class CacheMissError(LookupError):
+    """Raised in replay mode when a prompt has no cached response."""
+
+
+def _message_text(m: object) -> str:
+    role = getattr(m, "type", None) or type(m).__name__
+    return f"{role}\x1f{getattr(m, 'content', m)}"
+
+
+class LLMCache:
+    """SQLite-backed response store with TTL + size-bounded LRU eviction and hit/miss counters."""
+
+    def __init__(
+        self,
+        path: str,
+        mode: str = "readwrite",
+        ttl_seconds: Optional[float] = None,
+        max_entries: Optional[int] = None,
+        max_bytes: Optional[int] = None,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode} (expected one of {', '.join(CACHE_MODES)})")
+        self.path = path
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, model TEXT, response TEXT,"
+            " size INTEGER, created REAL, accessed REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        if mode == "readwrite":
+            with self._lock:
+                self._evict()
+
+    @staticmethod
+    def key(model: str, messages: List[object]) -> str:
+        """Content hash of the model name and message texts."""
+        h = hashlib.sha256(model.encode("utf-8"))
+        for m in messages:
+            h.update(b"\x1e")
+            h.update(_message_text(m).encode("utf-8"))
+        return h.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Cached response for key, or None if absent or past its TTL."""
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                if self.mode == "readwrite":
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.counters["evictions"] += 1
+                row = None
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.counters["hits"] += 1
+            if self.mode == "readwrite":
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            return str(row[0])
+
+    def put(self, key: str, model: str, response: str) -> None:
+        """Store a response (readwrite mode only), evicting every few writes."""
+        if self.mode != "readwrite":
+            return
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, response, len(response.encode("utf-8")), now, now),
+            )
+            self.counters["writes"] += 1
+            self._puts += 1
+            if self._puts % _EVICT_EVERY == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        # Caller holds the lock.
+        removed = 0
+        if self.ttl_seconds is not None:
+            cur = self._db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            removed += max(cur.rowcount, 0)
+        if self.max_entries is not None:
+            cur = self._db.execute(
+                "DELETE FROM responses WHERE key IN ("
+                " SELECT key FROM responses ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            removed += max(cur.rowcount, 0)
+        if self.max_bytes is not None:
+            total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            while total > self.max_bytes:
+                row = self._db.execute("SELECT key, size FROM responses ORDER BY accessed ASC LIMIT 1").fetchone()
+                if row is None:
+                    break
+                self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+                total -= row[1]
+                removed += 1
+        self.counters["evictions"] += removed
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/write/eviction counters plus the entry count."""
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return {**self.counters, "entries": int(entries)}
+
+
+_CACHE: Optional[LLMCache] = None
+_CONFIGURED = False
+_CACHE_LOCK = threading.Lock()
+
+
+def configure_cache(
+    path: Optional[str],
+    mode: str = "readwrite",
+    ttl_seconds: Optional[float] = None,
+    max_entries: Optional[int] = None,
+    max_bytes: Optional[int] = None,
+) -> Optional[LLMCache]:
+    """Install (or with path=None / mode="off", disable) the process-wide cache."""
+    global _CACHE, _CONFIGURED
+    with _CACHE_LOCK:
+        _CACHE = LLMCache(path, mode, ttl_seconds, max_entries, max_bytes) if path and mode != "off" else None
+        _CONFIGURED = True
+        return _CACHE
+
+
+def install_cache(cache: Optional[LLMCache]) -> Optional[LLMCache]:
+    """Install an existing cache instance (or None) as the process-wide cache, e.g. to restore one."""
+    global _CACHE, _CONFIGURED
+    with _CACHE_LOCK:
+        _CACHE = cache
+        _CONFIGURED = True
+        return _CACHE
+
+
+def get_cache() -> Optional[LLMCache]:
+    """Process-wide cache, lazily configured from LLM_CACHE_* env vars."""
+    if not _CONFIGURED:
+        ttl = os.getenv("LLM_CACHE_TTL")
+        max_entries = os.getenv("LLM_CACHE_MAX_ENTRIES")
+        max_mb = os.getenv("LLM_CACHE_MAX_MB")
+        configure_cache(
+            os.getenv("LLM_CACHE_PATH"),
+            mode=os.getenv("LLM_CACHE_MODE", "readwrite"),
+            ttl_seconds=float(ttl) if ttl else None,
+            max_entries=int(max_entries) if max_entries else None,
+            max_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else None,
+        )
+    return _CACHE
+
+
+def _content(resp: object) -> str:
+    return str(getattr(resp, "content", ""))
+
+
+def cached_invoke(make_chat: Callable[[], Any], model: str, messages: List[object], priority: int = GENERATE) -> str:
+    """
+    chat.invoke(messages).content, served from / written to the cache when enabled.
+    The chat model comes from make_chat(), called only on a miss, so hits never
+    build a client. Misses go through the LLM scheduler (if enabled) at `priority`.
+    """
+    with get_tracer().span("llm", model=model) as sp:
+        cache = get_cache()
+        key = cache.key(model, messages) if cache is not None else ""
+        hit = cache.get(key) if cache is not None else None
+        sp.set(cache="off" if cache is None else ("hit" if hit is not None else "miss"))
+        if hit is not None:
+            return hit
+        if cache is not None and cache.mode == "replay":
+            raise CacheMissError(f"No cached response for {model} prompt {key[:12]} (replay mode)")
+        chat = make_chat()
+        sched = get_scheduler()
+        resp = sched.call(chat.invoke, messages, priority) if sched is not None else chat.invoke(messages)
+        sp.set(**usage_tokens(resp))
+        text = _content(resp)
+        if cache is not None:
+            cache.put(key, model, text)
+        return text
+
+
+async def acached_invoke(make_chat: Callable[[], Any], model: str, messages: List[object], priority: int = GENERATE) -> str:
+    """Async counterpart of cached_invoke (uses chat.ainvoke on a miss)."""
+    with get_tracer().span("llm", model=model) as sp:
+        cache = get_cache()
+        key = cache.key(model, messages) if cache is not None else ""
+        hit = cache.get(key) if cache is not None else None
+        sp.set(cache="off" if cache is None else ("hit" if hit is not None else "miss"))
+        if hit is not None:
+            return hit
+        if cache is not None and cache.mode == "replay":
+            raise CacheMissError(f"No cached response for {model} prompt {key[:12]} (replay mode)")
+        chat = make_chat()
+        sched = get_scheduler()
+        resp = await (sched.acall(chat.ainvoke, messages, priority) if sched is not None else chat.ainvoke(messages))
+        sp.set(**usage_tokens(resp))
+        text = _content(resp)
+        if cache is not None:
+            cache.put(key, model, text)
+        return text
+
+
+def _add_usage(total: Dict[str, int], chunk: object) -> None:
+    for k, v in usage_tokens(chunk).items():
+        total[k] = total.get(k, 0) + v
+
+
+def cached_stream(make_chat: Callable[[], Any], model: str, messages: List[object], priority: int = GENERATE) -> Iterator[str]:
+    """
+    chat.stream(messages) as text chunks; a cache hit is yielded as one chunk
+    and a fully consumed miss is written back under the same key as cached_invoke.
+    """
+    with get_tracer().span("llm", model=model, stream=True) as sp:
+        cache = get_cache()
+        key = cache.key(model, messages) if cache is not None else ""
+        hit = cache.get(key) if cache is not None else None
+        sp.set(cache="off" if cache is None else ("hit" if hit is not None else "miss"))
+        if hit is not None:
+            yield hit
+            return
+        if cache is not None and cache.mode == "replay":
+            raise CacheMissError(f"No cached response for {model} prompt {key[:12]} (replay mode)")
+        parts: List[str] = []
+        usage: Dict[str, int] = {}
+        chat = make_chat()
+        sched = get_scheduler()
+        for chunk in sched.stream(chat.stream, messages, priority) if sched is not None else chat.stream(messages):
+            _add_usage(usage, chunk)
+            text = _content(chunk)
+            if text:
+                parts.append(text)
+                yield text
+        sp.set(**usage)
+        if cache is not None:
+            cache.put(key, model, "".join(parts))
+
+
+async def acached_stream(make_chat: Callable[[], Any], model: str, messages: List[object], priority: int = GENERATE) -> AsyncIterator[str]:
+    """Async counterpart of cached_stream (uses chat.astream on a miss)."""
+    with get_tracer().span("llm", model=model, stream=True) as sp:
+        cache = get_cache()
+        key = cache.key(model, messages) if cache is not None else ""
+        hit = cache.get(key) if cache is not None else None
+        sp.set(cache="off" if cache is None else ("hit" if hit is not None else "miss"))
+        if hit is not None:
+            yield hit
+            return
+        if cache is not None and cache.mode == "replay":
+            raise CacheMissError(f"No cached response for {model} prompt {key[:12]} (replay mode)")
+        parts: List[str] = []
+        usage: Dict[str, int] = {}
+        chat = make_chat()
+        sched = get_scheduler()
+        async for chunk in sched.astream(chat.astream, messages, priority) if sched is not None else chat.astream(messages):
+            _add_usage(usage, chunk)
+            text = _content(chunk)
+            if text:
+                parts.append(text)
+                yield text
+        sp.set(**usage)
+        if cache is not None:
+            cache.put(key, model, "".join(parts))
@@ -1,28 +1,104 @@
 #!/usr/bin/env python3
 from __future__ import annotations
 
+import json
 import os
-from typing import Optional
+import sys
+from itertools import islice
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import typer
 from rich import print as rprint
 from rich.table import Table
 
-from .dataset import load_records, index_by_id, get_turn_question, get_turn_gold
-from .retrieval import PerDocRetriever
-from .executor import PlanRAGRunner
+from .dataset import LazyRecords, get_turn_question, get_turn_gold
+from .retrieval import load_retriever
+from .index import build_index
+from .executor import Event, PlanRAGRunner
+from .session import ConversationSession
 from .metrics import numeric_match
+from .evaluation import FEATURES, load_results, run_eval, slice_report, write_results
+from .llm_cache import CACHE_MODES, configure_cache, get_cache
+from .bench import import_time, run_bench
+from .server import make_server
+from .corpus import CorpusRetriever
+from .scheduler import get_scheduler
+from .tracing import start_profiling
 
 app = typer.Typer(help="Plan*RAG Conversational QA over ConvFinQA")
+index_app = typer.Typer(help="Offline retrieval index artifacts")
+app.add_typer(index_app, name="index")
 
 
-def _load(data_path: str):
-    """Load dataset and return an id->record index."""
+@app.callback()
+def main(
+    ctx: typer.Context,
+    llm_cache: Optional[str] = typer.Option(None, help="SQLite file caching LLM responses (default: $LLM_CACHE_PATH)"),
+    cache_mode: Optional[str] = typer.Option(None, help=f"LLM cache mode: {' | '.join(CACHE_MODES)}; replay is read-only and fails on misses"),
+    cache_ttl: Optional[float] = typer.Option(None, help="Seconds before a cached response expires"),
+    cache_max_entries: Optional[int] = typer.Option(None, help="LRU-evict cached responses beyond this count"),
+    profile: Optional[str] = typer.Option(None, help="Directory to dump per-question traces (JSONL) and a CPU profile into"),
+) -> None:
+    """Global options shared by all commands."""
+    if profile:
+        stop = start_profiling(profile)
+
+        def _dump() -> None:
+            files = stop()
+            rprint(f"[dim]Profile written: {', '.join(files)}[/dim]")
+
+        ctx.call_on_close(_dump)
+    if cache_mode is not None and cache_mode not in CACHE_MODES:
+        rprint(f"[red]Unknown --cache-mode {cache_mode}; expected one of {', '.join(CACHE_MODES)}[/red]")
+        raise typer.Exit(code=2)
+    if llm_cache or cache_mode or cache_ttl is not None or cache_max_entries is not None:
+        configure_cache(
+            llm_cache or os.getenv("LLM_CACHE_PATH"),
+            mode=cache_mode or os.getenv("LLM_CACHE_MODE") or "readwrite",
+            ttl_seconds=cache_ttl,
+            max_entries=cache_max_entries,
+        )
+
+
+def _load(data_path: str) -> LazyRecords:
+    """Return a lazy id->record mapping (records are parsed on access)."""
     if not os.path.exists(data_path):
         rprint(f"[red]Dataset not found at {data_path}[/red]")
         raise typer.Exit(code=2)
-    records = load_records(data_path)
-    return index_by_id(records)
+    return LazyRecords(data_path)
+
+
+def _render_stream(events: Iterator[Event], show_nodes: bool = False, prefix: str = "") -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
+    """
+    Print runner events as they arrive (plan, node answers, aggregator tokens)
+    and return the final (answer, answers_by_node, snippets_by_node).
+    """
+    final: Event = {"answer": "No answer.", "answers": {}, "retrieved": {}}
+    streamed = False
+    for event in events:
+        kind = event["type"]
+        if kind == "plan" and show_nodes:
+            rprint(f"[dim]Plan: {len(event['nodes'])} subqueries[/dim]")
+        elif kind == "node" and show_nodes:
+            source = " (memory)" if event["cached"] else ""
+            rprint(f"[bold]{event['id']}[/bold] {event['text']} -> {event['answer']}{source}")
+        elif kind == "token":
+            if not streamed:
+                if show_nodes:
+                    rprint("[bold green]Final:[/bold green] ", end="")
+                sys.stdout.write(prefix)
+                streamed = True
+            sys.stdout.write(event["text"])
+            sys.stdout.flush()
+        elif kind == "final":
+            final = event
+    if streamed:
+        sys.stdout.write("\n")
+    else:
+        if show_nodes:
+            rprint("[bold green]Final:[/bold green] ", end="")
+        sys.stdout.write(prefix + final["answer"] + "\n")
+    return final["answer"], final["answers"], final["retrieved"]
 
 
 @app.command()
@@ -31,6 +107,7 @@ def chat(
     data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
     turn: Optional[int] = typer.Option(None, help="Dialogue turn index (default: last)"),
     show_snippets: bool = typer.Option(True, help="Print retrieved snippets per subquery"),
+    index: Optional[str] = typer.Option(None, help="Prebuilt retrieval index dir (see `index build`)"),
 ):
     """Answer one conversation turn using a Plan*RAG-style DAG executor."""
     idx = _load(data)
@@ -45,18 +122,10 @@ def chat(
         raise typer.Exit(code=1)
 
     rprint(f"[bold]Question:[/bold] {question}")
-    retriever = PerDocRetriever(rec)
+    retriever = load_retriever(rec, index)
     runner = PlanRAGRunner(retriever)
 
-    final, answers, retrieved = runner.run(question)
-
-    # Pretty print plan answers
-    t = Table(title="Plan*RAG sub-answers")
-    t.add_column("Node")
-    t.add_column("Answer")
-    for k, v in sorted(answers.items()):
-        t.add_row(k, str(v))
-    rprint(t)
+    final, answers, retrieved = _render_stream(runner.stream(question), show_nodes=True)
 
     if show_snippets:
         rprint("[cyan]Top snippets (by node):[/cyan]")
@@ -65,48 +134,109 @@ def chat(
             for s in snips[:3]:
                 rprint("-", s)
 
-    rprint(f"[bold green]Final:[/bold green] {final}")
-
     gold = get_turn_gold(rec, turn)
     if gold is not None:
         ok = numeric_match(final, str(gold))
         rprint(f"[bold]Gold:[/bold] {gold}    Match: {'✅' if ok else '❌'}")
 
 
+@app.command()
+def ask(
+    question: str = typer.Argument(..., help="Question about any filing in the corpus"),
+    index: str = typer.Option("convfinqa_index", help="Prebuilt retrieval index dir (see `index build`)"),
+    docs: int = typer.Option(10, help="Records kept by the first (document-level) retrieval stage"),
+    show_snippets: bool = typer.Option(True, help="Print retrieved snippets per subquery"),
+) -> None:
+    """Answer a question without a record id, retrieving across the whole corpus."""
+    if not os.path.isdir(index):
+        rprint(f"[red]Index not found at {index}; run `index build` first[/red]")
+        raise typer.Exit(code=2)
+    try:
+        retriever = CorpusRetriever.open(index, n_docs=docs)
+    except ValueError as e:
+        rprint(f"[red]{e}[/red]")
+        raise typer.Exit(code=2) from e
+    runner = PlanRAGRunner(retriever)
+    _final, _answers, retrieved = _render_stream(runner.stream(question), show_nodes=True)
+
+    if show_snippets:
+        rprint("[cyan]Top snippets (by node):[/cyan]")
+        for nid, snips in sorted(retrieved.items()):
+            rprint(f"[bold]{nid}[/bold]")
+            for s in snips[:3]:
+                rprint("-", s)
+
+
 @app.command()
 def eval(
     data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
     n: int = typer.Option(50, help="Evaluate first N records × last turn"),
+    index: Optional[str] = typer.Option(None, help="Prebuilt retrieval index dir (see `index build`)"),
+    workers: int = typer.Option(1, help="Records evaluated concurrently"),
+    checkpoint: Optional[str] = typer.Option(None, help="JSONL file of per-record results; existing entries are skipped (resume)"),
+    use_async: bool = typer.Option(False, "--async", help="Drive records on one asyncio event loop instead of threads"),
+    results_path: Optional[str] = typer.Option(None, "--results", help="Write per-record results (stage timings, feature flags) to .parquet or .csv"),
 ):
     """Tiny eval: last-turn numeric match against executed_answers (gold)."""
     idx = _load(data)
-    keys = list(idx.keys())[:max(0, n)]
-    total = 0
-    hits = 0
-    for rid in keys:
-        rec = idx[rid]
-        q = get_turn_question(rec, turn=None)
-        gold = get_turn_gold(rec, turn=None)
-        if gold is None or not q:
-            continue
-        retriever = PerDocRetriever(rec)
-        runner = PlanRAGRunner(retriever)
-        final, _ans, _ret = runner.run(q)
-        total += 1
-        if numeric_match(final, str(gold)):
-            hits += 1
-    if total == 0:
+    ids = list(islice(iter(idx), max(0, n)))
+    results = run_eval(idx, ids, index_path=index, workers=workers, checkpoint=checkpoint, use_async=use_async)
+    scored = [r for r in results if not r.get("error")]
+    errors = len(results) - len(scored)
+    if not results:
         rprint("[yellow]No evaluable examples found.[/yellow]")
         raise typer.Exit(code=1)
+    total = len(results)
+    hits = sum(1 for r in scored if r["match"])
     rprint(f"[bold]Numeric@1[/bold]: {hits}/{total} = {hits/total:.2%}")
+    if errors:
+        rprint(f"[yellow]{errors} record(s) failed; rerun with the same --checkpoint to retry them.[/yellow]")
+    cache = get_cache()
+    if cache is not None:
+        rprint(f"[dim]LLM cache ({cache.mode}): {cache.stats()}[/dim]")
+    sched = get_scheduler()
+    if sched is not None and sched.counters["requests"]:
+        rprint(f"[dim]LLM scheduler: {sched.stats()}[/dim]")
+    if results_path:
+        try:
+            write_results(results, results_path)
+        except RuntimeError as e:
+            rprint(f"[red]{e}[/red]")
+            raise typer.Exit(code=1) from e
+        rprint(f"Results written to {results_path}")
+
+
+@app.command()
+def report(
+    results_path: str = typer.Argument(..., help="Results table written by `eval --results`"),
+    by: Optional[List[str]] = typer.Option(None, help="Column to slice by (repeatable; default: the dataset feature flags)"),
+    abs_tol: float = typer.Option(1e-4, help="Absolute tolerance for a numeric match"),
+    rel_tol: float = typer.Option(0.01, help="Relative tolerance for a numeric match"),
+) -> None:
+    """Accuracy and latency breakdown of an eval results table by feature slice."""
+    if not os.path.exists(results_path):
+        rprint(f"[red]Results not found at {results_path}[/red]")
+        raise typer.Exit(code=2)
+    try:
+        df = slice_report(load_results(results_path), by=by or FEATURES, abs_tol=abs_tol, rel_tol=rel_tol)
+    except (RuntimeError, ImportError) as e:
+        rprint(f"[red]{e}[/red]")
+        raise typer.Exit(code=1) from e
+    t = Table(title=f"Slices of {results_path}")
+    for col in df.columns:
+        t.add_column(str(col))
+    for row in df.itertuples(index=False):
+        t.add_row(*[f"{v:.3f}" if isinstance(v, float) else str(v) for v in row])
+    rprint(t)
 
 
 @app.command()
 def repl(
     record_id: str = typer.Argument(..., help="Record ID from the dataset"),
     data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
+    index: Optional[str] = typer.Option(None, help="Prebuilt retrieval index dir (see `index build`)"),
 ):
-    """Simple interactive loop to ask multiple questions against the same record."""
+    """Interactive loop over one record; later questions reuse earlier turns' answers and lookups."""
     idx = _load(data)
     if record_id not in idx:
         rprint(f"[red]Unknown record_id: {record_id}[/red]")
@@ -114,8 +244,7 @@ def repl(
 
     rec = idx[record_id]
     rprint(f"[bold]Loaded record:[/bold] {record_id}")
-    retriever = PerDocRetriever(rec)
-    runner = PlanRAGRunner(retriever)
+    session = ConversationSession(load_retriever(rec, index))
 
     while True:
         try:
@@ -128,8 +257,126 @@ def repl(
         if not q:
             continue
 
-        final, answers, _ = runner.run(q)
-        print("bot>", final)
+        _render_stream(session.stream(q), prefix="bot> ")
+
+    st = session.stats()
+    if st["turns"]:
+        rprint(f"[dim]Session: {st['turns']} turns, {st['node_hits']} subqueries answered from memory[/dim]")
+
+
+@app.command()
+def serve(
+    data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
+    host: str = typer.Option("127.0.0.1", help="Interface to bind"),
+    port: int = typer.Option(8000, help="Port to listen on"),
+    index: Optional[str] = typer.Option(None, help="Prebuilt retrieval index dir (see `index build`)"),
+    cache_mb: float = typer.Option(512.0, help="Memory budget (MB) for cached per-record retrievers"),
+    preload: bool = typer.Option(True, help="Parse every record at startup (else on demand)"),
+    concurrency: int = typer.Option(16, help="Requests expected in flight at once (sizes the node pool)"),
+) -> None:
+    """Serve chat/eval over HTTP from one resident process (GET /health, POST /chat, POST /eval)."""
+    if not os.path.exists(data):
+        rprint(f"[red]Dataset not found at {data}[/red]")
+        raise typer.Exit(code=2)
+    server = make_server(data, host=host, port=port, index_path=index, cache_mb=cache_mb, preload=preload, concurrency=concurrency)
+    rprint(f"[bold]Serving {len(server.records)} records[/bold] on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+@app.command()
+def bench(
+    data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
+    n: int = typer.Option(50, help="Benchmark the last turn of the first N records"),
+    workers: int = typer.Option(1, help="Questions run concurrently"),
+    index: Optional[str] = typer.Option(None, help="Prebuilt retrieval index dir (see `index build`)"),
+    plan_ms: float = typer.Option(400.0, help="Median fake planner latency (ms)"),
+    gen_ms: float = typer.Option(250.0, help="Median fake generator latency (ms)"),
+    agg_ms: float = typer.Option(300.0, help="Median fake aggregator latency (ms)"),
+    sigma: float = typer.Option(0.3, help="Lognormal sigma of fake LLM latency (0 = fixed)"),
+    seed: int = typer.Option(0, help="Seed for the latency sampler"),
+    plan_json: Optional[str] = typer.Option(None, help="File with canned planner JSON (default: heuristic plan per question)"),
+    batch: bool = typer.Option(False, help="Batched generation: ready sibling nodes share one generator call"),
+    quota_rpm: Optional[float] = typer.Option(None, help="Fake API requests/minute before it returns 429s"),
+    quota_concurrency: Optional[int] = typer.Option(None, help="Fake API concurrent requests before it returns 429s"),
+    scheduler: bool = typer.Option(True, help="Route LLM calls through the adaptive scheduler (retries, AIMD, priorities)"),
+    llm_concurrency: Optional[int] = typer.Option(None, help="Scheduler's initial concurrency limit (default: 4 per worker)"),
+    out: Optional[str] = typer.Option(None, help="Write the JSON report here"),
+) -> None:
+    """Offline latency/throughput benchmark against fake LLMs."""
+    if not os.path.exists(data):
+        rprint(f"[red]Dataset not found at {data}[/red]")
+        raise typer.Exit(code=2)
+    canned = None
+    if plan_json:
+        with open(plan_json, encoding="utf-8") as f:
+            canned = f.read()
+    report = run_bench(
+        data, n=n, workers=workers, index_path=index, plan_ms=plan_ms, gen_ms=gen_ms,
+        agg_ms=agg_ms, sigma=sigma, seed=seed, plan_json=canned, batch=batch,
+        quota_rpm=quota_rpm, quota_concurrency=quota_concurrency, scheduler=scheduler, llm_concurrency=llm_concurrency,
+    )
+
+    lat = report["latency"]
+    rprint(
+        f"[bold]{report['questions']} questions[/bold] in {report['wall_s']}s "
+        f"({report['throughput_qps']} q/s) — p50 {lat['p50_ms']}ms, p95 {lat['p95_ms']}ms, p99 {lat['p99_ms']}ms"
+    )
+    t = Table(title="Per-stage time")
+    for col in ("Stage", "Count", "Total ms", "Mean ms", "p50 ms", "p95 ms"):
+        t.add_column(col)
+    for stage, st in report["stages"].items():
+        t.add_row(stage, str(st["count"]), str(st["total_ms"]), str(st["mean_ms"]), str(st["p50_ms"]), str(st["p95_ms"]))
+    rprint(t)
+    rprint(f"[dim]Fake API quota: {report['quota']}[/dim]")
+    if report["scheduler"] is not None:
+        rprint(f"[dim]Scheduler: {report['scheduler']}[/dim]")
+    if report["errors"]:
+        rprint(f"[yellow]{report['errors']} question(s) failed, e.g. {report['error_samples'][0]}[/yellow]")
+    if out:
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        rprint(f"Report written to {out}")
+
+
+@app.command("check-imports")
+def check_imports(
+    budget_ms: float = typer.Option(750.0, help="Fail when importing the CLI takes longer than this"),
+    module: str = typer.Option("src.main", help="Module to import in a fresh interpreter"),
+    runs: int = typer.Option(3, help="Take the best of this many cold imports"),
+) -> None:
+    """Import-time regression check: budget plus no eager langchain/sklearn/scipy."""
+    report = import_time(module, runs=runs)
+    for row in report["slowest"][:8]:
+        rprint(f"[dim]{row['cumulative_ms']:>9.1f} ms  {row['module']}[/dim]")
+    rprint(f"[bold]import {module}[/bold]: {report['total_ms']} ms (budget {budget_ms} ms)")
+    failed = False
+    if report["total_ms"] > budget_ms:
+        rprint("[red]Over the import-time budget.[/red]")
+        failed = True
+    if report["heavy"]:
+        rprint(f"[red]Heavy modules imported eagerly: {', '.join(report['heavy'][:10])}[/red]")
+        failed = True
+    if failed:
+        raise typer.Exit(code=1)
+
+
+@index_app.command("build")
+def index_build(
+    data: str = typer.Option("convfinqa_dataset.json", help="Path to convfinqa_dataset.json"),
+    out: str = typer.Option("convfinqa_index", help="Output directory for the index artifact"),
+) -> None:
+    """Chunk + vectorize the whole dataset once into a memory-mappable index."""
+    idx = _load(data)
+    stats = build_index(idx.values(), out)
+    rprint(
+        f"[bold]Index written to {out}[/bold]: {stats['records']} records, "
+        f"{stats['chunks']} chunks, {stats['terms']} terms, {stats['nnz']} nnz"
+    )
 
 
 @app.command()
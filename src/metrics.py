@@ -1,5 +1,6 @@
 from __future__ import annotations
-from typing import Optional
+from typing import Optional, Sequence, Tuple
+import numpy as np
 
 def _to_float(s: str) -> Optional[float]:
     if s is None:
@@ -24,3 +25,156 @@ def numeric_match(pred: str, gold: str, abs_tol: float = 1e-4, rel_tol: float =
         return True
     denom = max(1e-9, abs(g))
     return abs(p - g) / denom <= rel_tol
+
+# Vectorized parse. Plain decimals ([+-]digits[.digits], <= 15 digits) are read
+# straight from their code points by a small state machine: the integer mantissa
+# is exact below 2**53 and one division by an exact power of ten rounds the same
+# way float() does. Rejected rows are split by character class: exponents get
+# numpy's cast, "decorated" rows the $ , % ( ) rewrite, and only what is left
+# and could still parse goes through _to_float row by row.
+_MAX_WIDTH = 32  # longer strings are never bare numbers worth vectorizing
+_MAX_DIGITS = 15
+# Character classes 0-9 are the digits themselves.
+_SPACE, _DOT, _MINUS, _PLUS, _OTHER = 10, 11, 12, 13, 14
+_CHAR = np.full(128, _OTHER, dtype=np.uint8)  # code points above 127 clip onto DEL
+_CHAR[48:58] = np.arange(10)
+_CHAR[[0, 9, 32]] = _SPACE  # 0 is the padding of fixed-width strings
+_CHAR[46], _CHAR[45], _CHAR[43] = _DOT, _MINUS, _PLUS
+# States: 0 leading space, 1 sign, 2 integer part, 3 fraction, 4 trailing space, 5 rejected.
+_TRANSITIONS = np.full((6, 15), 5, dtype=np.uint8)
+_TRANSITIONS[0, :10], _TRANSITIONS[0, _SPACE], _TRANSITIONS[0, _DOT] = 2, 0, 3
+_TRANSITIONS[0, _MINUS], _TRANSITIONS[0, _PLUS] = 1, 1
+_TRANSITIONS[1, :10], _TRANSITIONS[1, _DOT] = 2, 3
+_TRANSITIONS[2, :10], _TRANSITIONS[2, _SPACE], _TRANSITIONS[2, _DOT] = 2, 4, 3
+_TRANSITIONS[3, :10], _TRANSITIONS[3, _SPACE] = 3, 4
+_TRANSITIONS[4, _SPACE] = 4
+_NEXT = _TRANSITIONS.ravel()
+_SCALE = np.where(np.arange(15) < 10, 10, 1).astype(np.int64)
+_DIGIT = np.where(np.arange(15) < 10, np.arange(15), 0).astype(np.int64)
+_POW10 = np.array([float(10 ** k) for k in range(_MAX_DIGITS + 1)])
+# Coarse per-character bits that route the rows the state machine rejected.
+# _FLOAT_CH marks characters _to_float could possibly accept (inf/nan spellings,
+# underscores, any whitespace); non-ASCII code points clip onto 127 and count
+# as possible too, so a row with any other character is settled without Python.
+_DECORATED_CH, _PLAIN_CH, _DIGIT_CH, _FLOAT_CH = 1, 2, 4, 8
+_ROUTE = np.zeros(128, dtype=np.uint8)
+_ROUTE[[c for c in range(128) if chr(c).isspace() or chr(c) in "\0_infatyINFATY\x7f"]] = _FLOAT_CH
+_ROUTE[[0, *map(ord, ".eE+- \t")]] |= _DECORATED_CH | _PLAIN_CH | _FLOAT_CH
+_ROUTE[48:58] = _DECORATED_CH | _PLAIN_CH | _DIGIT_CH | _FLOAT_CH
+_ROUTE[list(map(ord, ",$%()"))] = _DECORATED_CH | _FLOAT_CH
+
+def _parse_decimal(codes: np.ndarray, width: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(values, ok) for rows of code points (first `width` columns); ok marks the plain decimals."""
+    n = len(codes)
+    cols = np.ascontiguousarray(codes[:, :width].T)
+    state = np.zeros(n, dtype=np.intp)
+    neg = np.zeros(n, dtype=bool)
+    mant = np.zeros(n, dtype=np.int64)
+    ndig = np.zeros(n, dtype=np.int8)
+    frac = np.zeros(n, dtype=np.int8)
+    for ch in cols:
+        c = _CHAR.take(ch, mode="clip")
+        digit = c < 10
+        frac += digit & (state == 3)
+        ndig += digit
+        mant = mant * _SCALE.take(c) + _DIGIT.take(c)
+        neg |= c == _MINUS
+        state = _NEXT.take(state * 15 + c)
+    ok = (state != 5) & (ndig > 0) & (ndig <= _MAX_DIGITS)
+    values = mant / _POW10[np.minimum(frac, _MAX_DIGITS)]
+    values[neg] *= -1
+    values[~ok] = np.nan
+    return values, ok
+
+def _classify(t: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    (plain, decorated, possible) masks over a 1-D str array: rows longer than
+    _MAX_WIDTH are never plain/decorated, and only `possible` rows can parse at all.
+    """
+    width = t.itemsize // 4
+    codes = t.view(np.uint32).reshape(len(t), width)
+    bits = _ROUTE.take(codes, mode="clip")
+    possible = (np.bitwise_and.reduce(bits, axis=1) & _FLOAT_CH).astype(bool)
+    head = bits[:, :_MAX_WIDTH]
+    every = np.bitwise_and.reduce(head, axis=1)
+    digit = (np.bitwise_or.reduce(head, axis=1) & _DIGIT_CH).astype(bool)
+    if width > _MAX_WIDTH:
+        digit &= codes[:, _MAX_WIDTH] == 0
+    plain = digit & (every & _PLAIN_CH).astype(bool)
+    return plain, digit & ~plain & (every & _DECORATED_CH).astype(bool), possible
+
+def _parse_rows(t: np.ndarray, idx: np.ndarray, out: np.ndarray, parsed: np.ndarray) -> None:
+    # Cast the rows at idx in one go; if any of them is malformed, only these rows go per row.
+    try:
+        out[idx] = t[idx].astype(np.float64)
+        parsed[idx] = True
+    except ValueError:
+        _parse_slow(t, idx, out, parsed)
+
+def _parse_slow(t: np.ndarray, idx: np.ndarray, out: np.ndarray, parsed: np.ndarray) -> None:
+    for i, s in zip(idx.tolist(), t[idx].tolist()):
+        v = _to_float(s)
+        if v is not None:
+            out[i] = v
+            parsed[i] = True
+
+def _to_float_array(values: Sequence[object]) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized _to_float: (float64 values, parsed mask); unparsed entries are NaN."""
+    arr = np.asarray(values)
+    if arr.dtype.kind in "iufb":
+        return arr.astype(np.float64), np.ones(arr.shape, dtype=bool)
+    t = np.ascontiguousarray(arr if arr.dtype.kind == "U" else arr.astype(str)).ravel()
+    if not t.size or not t.itemsize:
+        return np.full(arr.shape, np.nan), np.zeros(arr.shape, dtype=bool)
+    n = len(t)
+    lengths = np.char.str_len(t)
+    codes = t.view(np.uint32).reshape(n, t.itemsize // 4)
+    out = np.full(n, np.nan)
+    parsed = np.zeros(n, dtype=bool)
+    # Prose rarely starts and ends like a number: checking both ends keeps it
+    # (and its width) out of the state machine.
+    first = _CHAR.take(codes[:, 0], mode="clip")
+    last = _CHAR.take(codes[np.arange(n), np.maximum(lengths - 1, 0)], mode="clip")
+    rows = np.flatnonzero((lengths <= _MAX_WIDTH) & (first != _OTHER) & (last != _OTHER))
+    if rows.size:
+        out[rows], parsed[rows] = _parse_decimal(codes[rows], int(lengths[rows].max()))
+        if parsed.all():
+            return out.reshape(arr.shape), parsed.reshape(arr.shape)
+    # Only rows the state machine rejected pay for anything slower.
+    rest = np.flatnonzero(~parsed)
+    plain = np.zeros(n, dtype=bool)
+    decorated = np.zeros(n, dtype=bool)
+    possible = np.zeros(n, dtype=bool)
+    plain[rest], decorated[rest], possible[rest] = _classify(t[rest])
+    # Exponents, very long mantissas, malformed rows: numpy's cast, then per row.
+    _parse_rows(t, np.flatnonzero(plain), out, parsed)
+    dec = np.flatnonzero(decorated)
+    if dec.size:
+        d = np.char.replace(np.char.replace(np.char.strip(t[dec]), ",", ""), "$", "")
+        pct = np.char.endswith(d, "%")
+        d[pct] = np.char.rstrip(np.char.rstrip(d[pct], "%"))
+        neg = np.char.startswith(d, "(") & np.char.endswith(d, ")")
+        d[neg] = np.char.add("-", np.char.strip(d[neg], "()"))
+        try:
+            out[dec] = d.astype(np.float64)
+            parsed[dec] = True
+        except ValueError:
+            _parse_slow(t, dec, out, parsed)
+    # Scatter per-row parses back only for what is left and could still parse.
+    _parse_slow(t, np.flatnonzero(possible & ~(parsed | plain | decorated)), out, parsed)
+    return out.reshape(arr.shape), parsed.reshape(arr.shape)
+
+def numeric_match_batch(preds: Sequence[object], golds: Sequence[object], abs_tol: float = 1e-4, rel_tol: float = 0.01) -> np.ndarray:
+    """numeric_match over aligned arrays at once; returns a bool array."""
+    p, p_ok = _to_float_array(preds)
+    g, g_ok = _to_float_array(golds)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        diff = np.abs(p - g)
+        ok: np.ndarray = (diff <= abs_tol) | (diff / np.maximum(1e-9, np.abs(g)) <= rel_tol)
+    numeric = p_ok & g_ok
+    if numeric.all():
+        return ok
+    # Pairs where either side does not parse fall back to case-insensitive string equality.
+    for i in np.flatnonzero(~numeric).tolist():
+        ok[i] = str(preds[i]).strip().lower() == str(golds[i]).strip().lower()
+    return ok
@@ -1,10 +1,15 @@
 from __future__ import annotations
-import os, json, re
-from typing import Dict, List, Set, Optional
+import os
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Set, Optional, Tuple
 from pydantic import BaseModel, Field
-from langchain.chat_models import init_chat_model
-from langchain.schema import HumanMessage
-from .prompts import PLANNER_SYSTEM, PLANNER_USER_TEMPLATE
+from .llm_cache import CacheMissError, acached_invoke, cached_invoke
+from .scheduler import PLAN
+from .clients import get_chat_model
+from .tracing import current_span, traced
 
 class PlanNode(BaseModel):
     """One DAG node: atomic subquery."""
@@ -12,6 +17,7 @@ class PlanNode(BaseModel):
     text: str               # subquery text
     depth: int              # i (1-based)
     depends_on: List[str] = Field(default_factory=list)  # parent ids
+    program: Optional[str] = None  # ConvFinQA DSL over parent answers ("#2.1"), run locally
 
 class PlanDAG(BaseModel):
     """Lightweight DAG container + helpers."""
@@ -30,16 +36,177 @@ class PlanDAG(BaseModel):
     def max_depth(self) -> int:
         return max((n.depth for n in self.nodes.values()), default=0)
 
+    def leaves(self) -> List[PlanNode]:
+        """Nodes no other node depends on."""
+        parents = {p for n in self.nodes.values() for p in n.depends_on}
+        return [n for n in self.nodes.values() if n.id not in parents]
+
+# ---------- Plan cache (question-shape templates) ----------
+# ConvFinQA questions repeat a few shapes ("what was the change in X from Y1 to Y2").
+# A question is normalised by masking years, numbers and (for known shapes) the
+# metric phrase into typed slots; the planner's DAG for that shape is stored with
+# the same slots as placeholders and re-instantiated for later questions.
+# Env: PLAN_CACHE=off disables it, PLAN_CACHE_SIZE bounds the LRU (default 512),
+# PLAN_CACHE_PATH persists templates as JSON across processes.
+
+_SLOT_RE = re.compile(
+    r"(?P<Y>(?<![\w.])(?:19|20)\d{2}(?![\w.]))"
+    r"|(?P<N>(?<![\w.])\$?-?\d[\d,]*(?:\.\d+)?%?(?![\w]))"
+)
+_ENTITY_PATTERNS = [
+    re.compile(
+        r"\b(?:change|difference|increase|decrease|growth|percentage|portion|proportion|ratio|sum|total|average|value)"
+        r" (?:in|of) (?:the )?(?P<E>[a-z][a-z &/'-]*?)(?= (?:from|between|in|for|during|over|at|as of|compared|<)\b| ?[?.]?$)"
+    ),
+    re.compile(r"^what (?:was|were|is|are) (?:the )?(?P<E>[a-z][a-z &/'-]*?)(?= (?:in|for|during|at|as of|from|<)\b)"),
+]
+
+def _normalize(question: str) -> str:
+    return re.sub(r"\s+", " ", question.strip().lower()).rstrip(" ?.")
+
+def question_shape(question: str) -> Tuple[str, Dict[str, str]]:
+    """
+    Mask slot values in a question.
+    Returns (shape key, slot name -> original value), e.g.
+    ("what was the change in <E0> from <Y0> to <Y1>", {"E0": "revenue", "Y0": "2007", "Y1": "2008"}).
+    """
+    q = _normalize(question)
+    slots: Dict[str, str] = {}
+    counts: Dict[str, int] = {}
+
+    def _mask(kind: str, value: str) -> str:
+        name = f"{kind}{counts.get(kind, 0)}"
+        counts[kind] = counts.get(kind, 0) + 1
+        slots[name] = value
+        return f"<{name}>"
+
+    q = _SLOT_RE.sub(lambda m: _mask(m.lastgroup or "N", m.group(0)), q)
+    for pat in _ENTITY_PATTERNS:
+        m = pat.search(q)
+        if m is None:
+            continue
+        ent = m.group("E").strip()
+        if ent and not re.search(r"\b(?:of|in|on|the|and|to|from|by)$", ent):
+            start = m.start("E")
+            q = q[:start] + _mask("E", ent) + q[start + len(ent):]
+            break
+    return q, slots
+
+def _value_re(value: str) -> re.Pattern[str]:
+    return re.compile(r"(?<![\w.])" + re.escape(value) + r"(?![\w])", flags=re.I)
+
+def _stem_re(value: str) -> re.Pattern[str]:
+    """Matches value with any inflection ("revenue" -> "revenues", "revenues" -> "revenue")."""
+    stem = re.sub(r"(?:ies|es|s)$", "", value)
+    return re.compile(r"(?<![\w.])" + re.escape(stem), flags=re.I)
+
+class PlanCache:
+    """Thread-safe LRU of plan templates keyed by question shape."""
+
+    def __init__(self, max_entries: int = 512, path: Optional[str] = None):
+        self.max_entries = max_entries
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._templates: OrderedDict[str, List[Dict[str, Any]]] = OrderedDict()
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self._templates.update(json.load(f))
+            except (OSError, ValueError):
+                pass
+
+    def get(self, question: str) -> Optional[PlanDAG]:
+        """Cached template for the question shape, re-instantiated with its entity and years."""
+        key, slots = question_shape(question)
+        with self._lock:
+            template = self._templates.get(key)
+            if template is None:
+                self.misses += 1
+                return None
+            self._templates.move_to_end(key)
+            self.hits += 1
+        nodes: Dict[str, PlanNode] = {}
+        for n in template:
+            text = n["text"]
+            for name, value in slots.items():
+                text = text.replace(f"<{name}>", value)
+            nodes[n["id"]] = PlanNode(
+                id=n["id"], text=text, depth=n["depth"], depends_on=list(n["depends_on"]), program=n.get("program")
+            )
+        return PlanDAG(nodes=nodes)
+
+    def put(self, question: str, dag: PlanDAG) -> bool:
+        """
+        Store dag as the template for this question's shape. Plans that still
+        mention a year/number that is not a slot of the question are specific to
+        it and are not cached; nor are plans where an entity slot is not masked
+        everywhere (e.g. "revenues" for the slot "revenue") or nowhere at all.
+        Returns whether a template was stored.
+        """
+        key, slots = question_shape(question)
+        # Longest values first so "net income" is masked before "income".
+        ordered = sorted(slots.items(), key=lambda kv: -len(kv[1]))
+        entities = [_stem_re(v) for name, v in slots.items() if name.startswith("E")]
+        masked_entities: Set[str] = set()
+        template: List[Dict[str, Any]] = []
+        for n in dag.nodes.values():
+            text = n.text
+            for name, value in ordered:
+                text = _value_re(value).sub(f"<{name}>", text)
+            # Programs are kept verbatim: node refs and constants only, no literal values.
+            program = re.sub(r"#[\w.]+|const_\w+", "", n.program or "")
+            for part in (re.sub(r"<[YNE]\d+>", "", text), program):
+                if _SLOT_RE.search(part) or any(pat.search(part) for pat in entities):
+                    return False
+            masked_entities.update(re.findall(r"<(E\d+)>", text))
+            template.append(
+                {"id": n.id, "text": text, "depth": n.depth, "depends_on": list(n.depends_on), "program": n.program}
+            )
+        if any(name.startswith("E") and name not in masked_entities for name in slots):
+            return False
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.max_entries:
+                self._templates.popitem(last=False)
+            snapshot = dict(self._templates) if self.path else None
+        if snapshot is not None and self.path:
+            tmp = f"{self.path}.tmp{threading.get_ident()}"
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(snapshot, f)
+                os.replace(tmp, self.path)
+            except OSError:
+                pass
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and the number of stored templates."""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "templates": len(self._templates)}
+
+_PLAN_CACHE: Optional[PlanCache] = None
+_PLAN_CACHE_LOCK = threading.Lock()
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """Process-wide plan cache (None when PLAN_CACHE=off)."""
+    global _PLAN_CACHE
+    if os.getenv("PLAN_CACHE", "on").lower() in {"0", "off", "false", "no"}:
+        return None
+    with _PLAN_CACHE_LOCK:
+        if _PLAN_CACHE is None:
+            _PLAN_CACHE = PlanCache(int(os.getenv("PLAN_CACHE_SIZE", "512")), os.getenv("PLAN_CACHE_PATH"))
+        return _PLAN_CACHE
+
 # ---------- LLM planner ----------
 
-def _planner_chat():
-    name = os.getenv("PLAN_MODEL") or "gpt-4o-mini"
-    return init_chat_model(
-        name=name,
-        model_provider="openai",
-        api_key=os.getenv("OPENAI_API_KEY"),
-        base_url=os.getenv("OPENAI_BASE_URL"),
-    )
+def _planner_model() -> str:
+    return os.getenv("PLAN_MODEL") or "gpt-4o-mini"
+
+def _planner_chat() -> Any:
+    return get_chat_model(_planner_model())
 
 def _parse_plan_json(text: str) -> Dict:
     """Be resilient to code fences, extra text, etc."""
@@ -58,35 +225,85 @@ def _parse_plan_json(text: str) -> Dict:
         return json.loads(curly.group(1))
     raise ValueError("Could not parse planner JSON.")
 
+def _plan_from_text(raw: str) -> PlanDAG:
+    data = _parse_plan_json(raw)
+
+    dag = PlanDAG(nodes={})
+    for node in data.get("nodes", []):
+        dag.nodes[node["id"]] = PlanNode(
+            id=str(node["id"]),
+            text=str(node["text"]),
+            depth=int(node["depth"]),
+            depends_on=[str(x) for x in node.get("depends_on", [])],
+            program=str(node["program"]) if node.get("program") else None,
+        )
+    if not dag.nodes:
+        raise ValueError("Planner produced no nodes.")
+    return dag
+
+def _planner_messages(question: str) -> List[Any]:
+    # Imported here so the heuristic (no API key) path never loads langchain.
+    from langchain.schema import HumanMessage
+
+    from .prompts import PLANNER_SYSTEM, PLANNER_USER_TEMPLATE
+
+    return [PLANNER_SYSTEM, HumanMessage(content=PLANNER_USER_TEMPLATE.format(query=question))]
+
+@traced("plan")
 def call_planner(question: str) -> PlanDAG:
     """
     LLM-based planner: returns a PlanDAG with nodes:
       nodes=[{id, text, depth, depends_on: []}]
+    Reuses a cached template for the question's shape when there is one.
     Falls back to heuristic_plan on failure or missing key.
     """
     if not os.getenv("OPENAI_API_KEY"):
+        current_span().set(source="heuristic")
         return heuristic_plan(question)
 
+    plan_cache = get_plan_cache()
+    cached = plan_cache.get(question) if plan_cache else None
+    if cached is not None:
+        current_span().set(source="plan_cache")
+        return cached
     try:
-        chat = _planner_chat()
-        user = HumanMessage(content=PLANNER_USER_TEMPLATE.format(query=question))
-        resp = chat.invoke([PLANNER_SYSTEM, user])
-        raw = getattr(resp, "content", "")
-        data = _parse_plan_json(raw)
-
-        dag = PlanDAG(nodes={})
-        for node in data.get("nodes", []):
-            dag.nodes[node["id"]] = PlanNode(
-                id=str(node["id"]),
-                text=str(node["text"]),
-                depth=int(node["depth"]),
-                depends_on=[str(x) for x in node.get("depends_on", [])],
-            )
-        if not dag.nodes:
-            raise ValueError("Planner produced no nodes.")
+        raw = cached_invoke(_planner_chat, _planner_model(), _planner_messages(question), PLAN)
+        dag = _plan_from_text(raw)
+        current_span().set(source="llm", nodes=len(dag.nodes))
+        if plan_cache:
+            plan_cache.put(question, dag)
         return dag
+    except CacheMissError:
+        # Replay runs must not silently diverge from the recorded plans.
+        raise
     except Exception:
         # Safe fallback keeps you unblocked.
+        current_span().set(source="heuristic_fallback")
+        return heuristic_plan(question)
+
+@traced("plan")
+async def acall_planner(question: str) -> PlanDAG:
+    """Async counterpart of call_planner (same fallback behaviour)."""
+    if not os.getenv("OPENAI_API_KEY"):
+        current_span().set(source="heuristic")
+        return heuristic_plan(question)
+
+    plan_cache = get_plan_cache()
+    cached = plan_cache.get(question) if plan_cache else None
+    if cached is not None:
+        current_span().set(source="plan_cache")
+        return cached
+    try:
+        raw = await acached_invoke(_planner_chat, _planner_model(), _planner_messages(question), PLAN)
+        dag = _plan_from_text(raw)
+        current_span().set(source="llm", nodes=len(dag.nodes))
+        if plan_cache:
+            plan_cache.put(question, dag)
+        return dag
+    except CacheMissError:
+        raise
+    except Exception:
+        current_span().set(source="heuristic_fallback")
         return heuristic_plan(question)
 
 # ---------- Heuristic fallback (kept small & simple) ----------
@@ -96,7 +313,8 @@ def heuristic_plan(question: str) -> PlanDAG:
     Small non-LLM plan as a backup:
       1.1: Ground entity/period
       2.*: Fetch metric(s)
-      3.1: Compute change if the query hints at YoY/delta
+      3.1: Compute change if the query hints at YoY/delta; for one metric
+           over two years this is a DSL program evaluated locally
     """
     q = question.lower()
     nodes: Dict[str, PlanNode] = {}
@@ -115,9 +333,34 @@ def heuristic_plan(question: str) -> PlanDAG:
         metrics.append("revenue")
     if any(k in q for k in ["gross margin", "operating margin", "margin"]):
         metrics.append("margin")
+    # Without a concrete metric the leaves have no row to agree on, so no program.
+    concrete = bool(metrics)
     if not metrics:
         metrics = ["the requested financial metric in the question"]
 
+    wants_change = any(k in q for k in ["yoy", "year over year", "change", "difference", "delta", "increase", "decrease"])
+    years = list(dict.fromkeys(re.findall(r"(?<!\d)(?:19|20)\d{2}(?!\d)", q)))
+    if wants_change and concrete and len(metrics) == 1 and len(years) == 2:
+        # One metric over two periods: fetch each value, then compute locally.
+        start, end = years
+        for j, y in enumerate((start, end), start=1):
+            nid = f"2.{j}"
+            nodes[nid] = PlanNode(
+                id=nid,
+                text=f"Retrieve the value for {metrics[0]} in {y}.",
+                depth=2,
+                depends_on=["1.1"],
+            )
+        pct = any(k in q for k in ["percent", "%", "rate"])
+        nodes["3.1"] = PlanNode(
+            id="3.1",
+            text=f"Compute the {'percentage ' if pct else ''}change in {metrics[0]} from {start} to {end}.",
+            depth=3,
+            depends_on=["2.1", "2.2"],
+            program="subtract(#2.2, #2.1), divide(#0, #2.1)" if pct else "subtract(#2.2, #2.1)",
+        )
+        return PlanDAG(nodes=nodes)
+
     for j, m in enumerate(metrics, start=1):
         nid = f"2.{j}"
         nodes[nid] = PlanNode(
@@ -127,7 +370,7 @@ def heuristic_plan(question: str) -> PlanDAG:
             depends_on=["1.1"],
         )
 
-    if any(k in q for k in ["yoy", "year over year", "change", "difference", "delta", "increase", "decrease"]):
+    if wants_change:
         nodes["3.1"] = PlanNode(
             id="3.1",
             text="Compute absolute and percentage change vs prior comparable period for the requested metric(s).",
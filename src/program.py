@@ -0,0 +1,142 @@
+from __future__ import annotations
+
+import math
+import re
+from typing import Dict, List, Optional, Tuple, Union
+
+from .metrics import _to_float
+
+# Local executor for the ConvFinQA arithmetic DSL (Dialogue.turn_program), e.g.
+#   "subtract(206588, 181001), divide(#0, 181001)"
+# Arguments are numeric literals (optionally with %), const_* constants,
+# "#n" (result of step n of this program) or "#<node id>" such as "#2.1"
+# (the numeric answer of a parent plan node).
+
+Value = Union[float, bool]
+
+_STEP_RE = re.compile(r"\s*([a-z_]+)\(([^()]*)\)\s*,?")
+_NUM_RE = re.compile(r"\(?-?\$?\d[\d,]*(?:\.\d+)?\)?%?")
+_YEAR_RE = re.compile(r"(?<!\d)(?:19|20)\d{2}(?!\d)")
+
+
+class ProgramError(ValueError):
+    """Program cannot be evaluated locally (unknown op, bad/missing argument)."""
+
+
+def _greater(a: float, b: float) -> bool:
+    return a > b
+
+
+def _divide(a: float, b: float) -> float:
+    if b == 0:
+        raise ProgramError("division by zero")
+    return a / b
+
+
+OPS = {
+    "add": lambda a, b: a + b,
+    "subtract": lambda a, b: a - b,
+    "multiply": lambda a, b: a * b,
+    "divide": _divide,
+    "exp": lambda a, b: math.pow(a, b),
+    "greater": _greater,
+}
+
+
+def parse_program(program: str) -> List[Tuple[str, List[str]]]:
+    """Split a DSL program into (op, args) steps; raises ProgramError if malformed."""
+    steps: List[Tuple[str, List[str]]] = []
+    pos = 0
+    text = program.strip()
+    while pos < len(text):
+        m = _STEP_RE.match(text, pos)
+        if not m:
+            raise ProgramError(f"Cannot parse program at: {text[pos:]!r}")
+        steps.append((m.group(1), [a.strip() for a in m.group(2).split(",") if a.strip()]))
+        pos = m.end()
+    if not steps:
+        raise ProgramError("Empty program.")
+    return steps
+
+
+def _arg(token: str, results: List[Value], refs: Dict[str, float]) -> float:
+    if token.startswith("#"):
+        ref = token[1:]
+        if ref.isdigit():
+            i = int(ref)
+            if i >= len(results):
+                raise ProgramError(f"Step reference {token} is out of range.")
+            return float(results[i])
+        if ref not in refs:
+            raise ProgramError(f"No numeric value for node {ref}.")
+        return refs[ref]
+    if token.startswith("const_"):
+        c = token[len("const_"):]
+        return -1.0 if c == "m1" else float(c)
+    v = _to_float(token)
+    if v is None:
+        raise ProgramError(f"Not a number: {token!r}")
+    return v / 100.0 if token.rstrip().endswith("%") else v
+
+
+def execute_program(program: str, refs: Optional[Dict[str, float]] = None) -> Value:
+    """Evaluate a DSL program; returns the last step's result."""
+    results: List[Value] = []
+    for op, args in parse_program(program):
+        fn = OPS.get(op)
+        if fn is None:
+            raise ProgramError(f"Unsupported op: {op}")
+        if len(args) != 2:
+            raise ProgramError(f"{op} expects 2 arguments, got {len(args)}")
+        a, b = (_arg(t, results, refs or {}) for t in args)
+        try:
+            results.append(fn(a, b))
+        except (OverflowError, ValueError) as e:
+            raise ProgramError(str(e)) from e
+    return results[-1]
+
+
+def format_value(v: Value) -> str:
+    """Render like executed_answers: yes/no for comparisons, up to 5 decimals otherwise."""
+    if isinstance(v, bool):
+        return "yes" if v else "no"
+    if float(v).is_integer():
+        return str(int(v))
+    return f"{v:.5f}".rstrip("0").rstrip(".")
+
+
+def exact_value(text: str) -> Optional[float]:
+    """
+    Value of an answer that parses unambiguously: the value column of a
+    "row | col | value" table line, or a bare number. Anything else -> None.
+    """
+    if not text:
+        return None
+    t = text.strip()
+    if " | " in t:
+        v = _to_float(t.rsplit(" | ", 1)[1])
+        if v is not None:
+            return v
+    return _to_float(t)
+
+
+def table_row(text: str) -> Optional[str]:
+    """Row label of a "row | col | value" table line (lowercased), else None."""
+    parts = text.strip().split(" | ") if text else []
+    return " ".join(parts[0].lower().split()) if len(parts) == 3 else None
+
+
+def answer_value(text: str, context: str = "") -> Optional[float]:
+    """
+    Numeric value of a node answer: exact_value when it applies, otherwise the
+    only number in the text once years mentioned in `context` (the subqueries
+    the answer responds to) are dropped. Several candidates left -> None, so
+    the caller falls back to the LLM instead of guessing.
+    """
+    v = exact_value(text)
+    if v is not None or not text:
+        return v
+    years = set(_YEAR_RE.findall(context))
+    found = [m.group(0) for m in _NUM_RE.finditer(text)]
+    found = [c for c in found if c.strip("()$%") not in years]
+    return _to_float(found[0]) if len(found) == 1 else None
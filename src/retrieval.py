@@ -1,11 +1,35 @@
 from __future__ import annotations
-from typing import Dict, List, Tuple
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, List, Mapping, Optional, Protocol, Tuple
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from .data_models import ConvFinQARecord
+from .table_index import TableIndex
+from .tracing import get_tracer
 
-def _flatten_table(table: Dict[str, Dict[str, object]]) -> List[str]:
+if TYPE_CHECKING:
+    from .index import RetrievalIndex
+
+class Retriever(Protocol):
+    """
+    What PlanRAGRunner needs from evidence retrieval: an exact table cell and
+    top-k snippets. PerDocRetriever, corpus.CorpusRetriever and the
+    CachingRetriever/TimedRetriever proxies all satisfy it.
+    """
+
+    def lookup(self, q: str) -> Optional[str]:
+        """Exact table cell for q as a "row | col | value" snippet, if it resolves."""
+        ...
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        """Top-k (snippet, score) pairs for one query, best first."""
+        ...
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        """query() for several queries at once."""
+        ...
+
+def _flatten_table(table: Mapping[str, Mapping[str, object]]) -> List[str]:
     # Convert table dict[col][row] -> "row | col | value" lines for indexing
     lines: List[str] = []
     for col, rowmap in table.items():
@@ -32,17 +56,121 @@ def build_doc_chunks(record: ConvFinQARecord) -> List[str]:
 class PerDocRetriever:
     """TF-IDF retriever restricted to a single record/document."""
     def __init__(self, record: ConvFinQARecord):
+        # sklearn is only needed when fitting per record (not for index-backed retrievers).
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
         self.chunks = build_doc_chunks(record)
         self.vectorizer = TfidfVectorizer(stop_words="english", max_df=0.95)
         self.matrix = self.vectorizer.fit_transform(self.chunks)
+        self.table = TableIndex(record.doc.table)
+
+    @classmethod
+    def from_index(cls, index: RetrievalIndex, record_id: str, table: Optional[Mapping[str, Mapping[str, object]]] = None) -> PerDocRetriever:
+        """Build from a prebuilt index slice (see index.build_index); no fitting."""
+        self = cls.__new__(cls)
+        self.chunks, self.matrix = index.record_slice(record_id)
+        self.vectorizer = index.vectorizer
+        self.table = TableIndex(table or {})
+        return self
+
+    def lookup(self, q: str) -> Optional[str]:
+        """Exact table cell for q as a "row | col | value" snippet, if it resolves."""
+        return self.table.snippet(q)
 
     def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
-        if not q.strip():
-            return []
-        q_vec = self.vectorizer.transform([q])
-        sims = cosine_similarity(q_vec, self.matrix)[0]
-        idxs = np.argsort(-sims)
-        out: List[Tuple[str, float]] = []
-        for i in idxs[:k]:
-            out.append((self.chunks[i], float(sims[i])))
+        return self.query_batch([q], k=k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        """
+        Top-k chunks for several queries at once: one transform, one sparse
+        product (rows are L2-normalised, so the dot product is the cosine) and
+        an argpartition per query instead of a full sort.
+        """
+        out: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        live = [i for i, q in enumerate(queries) if q.strip()]
+        if not live or k <= 0:
+            return out
+        with get_tracer().span("retrieve", queries=len(live), k=k, chunks=len(self.chunks)):
+            q_mat = self.vectorizer.transform([queries[i] for i in live])
+            sims = np.asarray((q_mat @ self.matrix.T).todense(), dtype=np.float64)
+            for pos, (row, idxs) in enumerate(zip(live, top_k(sims, k))):
+                out[row] = [(self.chunks[i], float(sims[pos, i])) for i in idxs]
         return out
+
+class CachingRetriever:
+    """
+    Memoizes lookup/query results of a per-record retriever (keyed on the
+    normalised text and k), so repeated subqueries within a conversation skip
+    table resolution and the sparse product. With max_entries each memo keeps
+    only that many most recently used keys.
+    """
+    def __init__(self, inner: Retriever, max_entries: Optional[int] = None):
+        self.inner = inner
+        self.max_entries = max_entries
+        self.cells: OrderedDict[str, Optional[str]] = OrderedDict()
+        self.hits: OrderedDict[Tuple[str, int], List[Tuple[str, float]]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.inner, name)
+
+    @staticmethod
+    def _norm(q: str) -> str:
+        return " ".join(q.lower().split())
+
+    def _trim(self, memo: OrderedDict[Any, Any]) -> None:
+        # Caller holds the lock.
+        while self.max_entries is not None and len(memo) > self.max_entries:
+            memo.popitem(last=False)
+
+    def lookup(self, q: str) -> Optional[str]:
+        """Memoized inner.lookup."""
+        key = self._norm(q)
+        with self._lock:
+            if key in self.cells:
+                self.cells.move_to_end(key)
+                return self.cells[key]
+        snip = self.inner.lookup(q)
+        with self._lock:
+            self.cells[key] = snip
+            self._trim(self.cells)
+        return snip
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        """Memoized inner.query."""
+        return self.query_batch([q], k=k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        """Memoized inner.query_batch; only the misses reach the inner retriever, in one call."""
+        keys = [(self._norm(q), k) for q in queries]
+        with self._lock:
+            out = [self.hits.get(key) for key in keys]
+            for key, hit in zip(keys, out):
+                if hit is not None:
+                    self.hits.move_to_end(key)
+        todo = [i for i, hit in enumerate(out) if hit is None]
+        if todo:
+            fresh = self.inner.query_batch([queries[i] for i in todo], k=k)
+            with self._lock:
+                for i, hits in zip(todo, fresh):
+                    self.hits[keys[i]] = out[i] = hits
+                self._trim(self.hits)
+        return [list(hits or []) for hits in out]
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Per-row indices of the k largest scores, best first (argpartition + sort of k)."""
+    n = scores.shape[1]
+    if k >= n:
+        return np.argsort(-scores, axis=1, kind="stable")
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+def load_retriever(record: ConvFinQARecord, index_path: Optional[str] = None) -> PerDocRetriever:
+    """Slice the prebuilt index when given (and it covers the record), else fit per record."""
+    if index_path:
+        from .index import open_index
+        ridx = open_index(index_path)
+        if record.id in ridx:
+            return PerDocRetriever.from_index(ridx, record.id, record.doc.table)
+    return PerDocRetriever(record)
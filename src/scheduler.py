@@ -0,0 +1,437 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    TypeVar,
+)
+
+from .logger import get_logger
+from .tracing import current_span, usage_tokens
+
+# Central admission control for every chat model request (planner, generator,
+# aggregator), shared by threads and event loops of one process:
+#   - token buckets on requests/minute and tokens/minute (unset -> unlimited)
+#   - an AIMD concurrency limit: +1 per limit's worth of successes, halved on a
+#     429 (at most once per cooldown), trimmed when latency exceeds a target
+#   - retries with full-jitter exponential backoff (honouring Retry-After) on
+#     429s, 5xx, timeouts and connection errors
+#   - priority: aggregator calls finish nearly done questions before generator
+#     calls, which go before planner calls that start new ones
+# Configured from env (or configure_scheduler):
+#   LLM_SCHEDULER            on (default) | off
+#   LLM_CONCURRENCY          initial limit (default 4)
+#   LLM_MAX_CONCURRENCY      AIMD ceiling (default 32)
+#   LLM_RPM / LLM_TPM        request / token budgets per minute
+#   LLM_MAX_RETRIES          (default 4)
+#   LLM_BACKOFF_BASE / LLM_BACKOFF_MAX   seconds (default 0.5 / 20)
+#   LLM_LATENCY_TARGET       seconds; slower successes shrink the limit
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+# Lower runs first.
+AGGREGATE, GENERATE, PLAN = 0, 1, 2
+
+# Completion tokens assumed per request until the response reports usage.
+_OUTPUT_TOKENS_GUESS = 200
+_RETRYABLE_NAMES = {
+    "APITimeoutError", "APIConnectionError", "InternalServerError", "ServiceUnavailableError",
+    "TimeoutException", "ConnectError", "ReadError", "RemoteProtocolError",
+}
+
+
+def estimate_tokens(messages: List[object]) -> int:
+    """Rough prompt + completion token count (4 chars per token) for the token bucket."""
+    chars = sum(len(str(getattr(m, "content", m))) for m in messages)
+    return chars // 4 + _OUTPUT_TOKENS_GUESS
+
+
+def _status(e: BaseException) -> Optional[int]:
+    code = getattr(e, "status_code", None) or getattr(getattr(e, "response", None), "status_code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_throttle(e: BaseException) -> bool:
+    """True for a provider rate-limit error (HTTP 429 or a RateLimitError class)."""
+    return _status(e) == 429 or any(c.__name__ == "RateLimitError" for c in type(e).__mro__)
+
+
+def is_retryable(e: BaseException) -> bool:
+    """True for errors worth retrying: throttles, timeouts, connection drops and 5xx/408."""
+    if is_throttle(e) or isinstance(e, (TimeoutError, ConnectionError)):
+        return True
+    code = _status(e)
+    if code is not None:
+        return code >= 500 or code == 408
+    return any(c.__name__ in _RETRYABLE_NAMES for c in type(e).__mro__)
+
+
+def retry_after(e: BaseException) -> Optional[float]:
+    """Server-requested delay from a Retry-After header (or attribute), in seconds."""
+    value = getattr(e, "retry_after", None)
+    if value is None:
+        headers = getattr(getattr(e, "response", None), "headers", None) or {}
+        value = headers.get("retry-after") if hasattr(headers, "get") else None
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills `rate` units per second up to `capacity`; reservations may go into debt."""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate * 60.0
+        self.level = self.capacity
+        self._t = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._t) * self.rate)
+        self._t = now
+
+    def reserve(self, n: float) -> float:
+        """Take n units now; returns how long to wait before using them."""
+        with self._lock:
+            self._refill()
+            self.level -= n
+            return 0.0 if self.level >= 0 else -self.level / self.rate
+
+    def charge(self, n: float) -> None:
+        """Correct an earlier reservation by n (negative gives units back)."""
+        with self._lock:
+            self._refill()
+            self.level = min(self.capacity, self.level - n)
+
+
+class AIMDLimit:
+    """Additive-increase / multiplicative-decrease concurrency limit."""
+
+    def __init__(
+        self,
+        initial: float = 4,
+        minimum: float = 1,
+        maximum: float = 32,
+        backoff: float = 0.5,
+        latency_target: Optional[float] = None,
+        cooldown: float = 1.0,
+    ):
+        self.limit = float(min(max(initial, minimum), maximum))
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.backoff = backoff
+        self.latency_target = latency_target
+        self.cooldown = cooldown
+        self._last_decrease = 0.0
+
+    @property
+    def slots(self) -> int:
+        """Whole concurrency slots the current limit allows (at least one)."""
+        return max(1, int(self.limit))
+
+    def on_success(self, latency: float) -> None:
+        """Additive increase, or a gentle decrease if the call ran past latency_target."""
+        if self.latency_target is not None and latency > self.latency_target:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self) -> None:
+        """Multiplicative decrease, at most once per cooldown."""
+        # One burst of 429s from the same window counts as a single signal.
+        now = time.monotonic()
+        if now - self._last_decrease >= self.cooldown:
+            self.limit = max(self.minimum, self.limit * self.backoff)
+            self._last_decrease = now
+
+
+class _Waiter:
+    __slots__ = ("grant", "granted", "cancelled")
+
+    def __init__(self, grant: Callable[[], None]):
+        self.grant = grant
+        self.granted = False
+        self.cancelled = False
+
+
+class LLMScheduler:
+    """
+    Priority admission + rate limits + retries around chat model calls.
+    Waiters are woken through callbacks (threading.Event for threads, the
+    owning loop's future for tasks), so one instance serves both.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 4,
+        max_concurrency: int = 32,
+        rpm: Optional[float] = None,
+        tpm: Optional[float] = None,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 20.0,
+        latency_target: Optional[float] = None,
+        seed: Optional[int] = None,
+    ):
+        self.aimd = AIMDLimit(concurrency, 1, max(concurrency, max_concurrency), latency_target=latency_target)
+        self.requests = TokenBucket(rpm / 60.0) if rpm else None
+        self.tokens = TokenBucket(tpm / 60.0) if tpm else None
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._queue: List[Any] = []
+        self._seq = itertools.count()
+        self.inflight = 0
+        self.counters: Dict[str, int] = {"requests": 0, "retries": 0, "throttled": 0, "failures": 0}
+
+    # -- admission -------------------------------------------------------
+
+    def _dispatch(self) -> None:
+        # Caller holds the lock.
+        while self._queue and self.inflight < self.aimd.slots:
+            _prio, _seq, waiter = heapq.heappop(self._queue)
+            if waiter.cancelled:
+                continue
+            waiter.granted = True
+            self.inflight += 1
+            waiter.grant()
+
+    def _enqueue(self, priority: int, grant: Callable[[], None]) -> _Waiter:
+        waiter = _Waiter(grant)
+        with self._lock:
+            heapq.heappush(self._queue, (priority, next(self._seq), waiter))
+            self._dispatch()
+        return waiter
+
+    def _release(self) -> None:
+        with self._lock:
+            self.inflight -= 1
+            self._dispatch()
+
+    def _rate_wait(self, tokens: int) -> float:
+        wait = self.requests.reserve(1) if self.requests else 0.0
+        if self.tokens:
+            wait = max(wait, self.tokens.reserve(tokens))
+        return wait
+
+    @contextmanager
+    def slot(self, priority: int = GENERATE, tokens: int = 0) -> Iterator[None]:
+        """
+        Hold one concurrency slot. Rate limits are waited out first, so a
+        throttled call never sits on a slot other priorities could use.
+        """
+        t0 = time.perf_counter()
+        wait = self._rate_wait(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        event = threading.Event()
+        self._enqueue(priority, event.set)
+        event.wait()
+        try:
+            current_span().set(queue_ms=round((time.perf_counter() - t0) * 1000.0, 3))
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def aslot(self, priority: int = GENERATE, tokens: int = 0) -> AsyncIterator[None]:
+        """Async counterpart of slot."""
+        t0 = time.perf_counter()
+        wait = self._rate_wait(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        loop = asyncio.get_running_loop()
+        fut: asyncio.Future[None] = loop.create_future()
+
+        def _resolve() -> None:
+            if not fut.done():
+                fut.set_result(None)
+
+        def _grant() -> None:
+            loop.call_soon_threadsafe(_resolve)
+
+        waiter = self._enqueue(priority, _grant)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            with self._lock:
+                waiter.cancelled = True
+                granted = waiter.granted
+            if granted:
+                self._release()
+            raise
+        try:
+            current_span().set(queue_ms=round((time.perf_counter() - t0) * 1000.0, 3))
+            yield
+        finally:
+            self._release()
+
+    # -- outcomes --------------------------------------------------------
+
+    def _succeeded(self, latency: float, reserved: int, resp: Any) -> None:
+        used = usage_tokens(resp)
+        with self._lock:
+            self.counters["requests"] += 1
+            self.aimd.on_success(latency)
+            self._dispatch()
+        if self.tokens and used:
+            self.tokens.charge(sum(used.values()) - reserved)
+
+    def _failed(self, e: BaseException, attempt: int) -> float:
+        """Record a failed attempt; returns the backoff before retrying or re-raises."""
+        with self._lock:
+            if is_throttle(e):
+                self.counters["throttled"] += 1
+                self.aimd.on_throttle()
+            if not is_retryable(e) or attempt >= self.max_retries:
+                self.counters["failures"] += 1
+                raise e
+            self.counters["retries"] += 1
+            delay = self._rng.uniform(0.0, min(self.backoff_max, self.backoff_base * 2**attempt))
+        delay = max(delay, retry_after(e) or 0.0)
+        logger.debug("LLM call failed (%s: %s); retry %d in %.2fs", type(e).__name__, e, attempt + 1, delay)
+        current_span().set(retries=attempt + 1)
+        return delay
+
+    # -- calls -----------------------------------------------------------
+
+    def call(self, fn: Callable[[List[object]], T], messages: List[object], priority: int = GENERATE) -> T:
+        """fn(messages) under the scheduler, retried on throttling / transient errors."""
+        tokens = estimate_tokens(messages)
+        for attempt in itertools.count():
+            try:
+                with self.slot(priority, tokens):
+                    t0 = time.perf_counter()
+                    resp = fn(messages)
+                self._succeeded(time.perf_counter() - t0, tokens, resp)
+                return resp
+            except Exception as e:
+                time.sleep(self._failed(e, attempt))
+        raise AssertionError("unreachable")
+
+    async def acall(self, fn: Callable[[List[object]], Awaitable[T]], messages: List[object], priority: int = GENERATE) -> T:
+        """Async counterpart of call (fn returns an awaitable)."""
+        tokens = estimate_tokens(messages)
+        for attempt in itertools.count():
+            try:
+                async with self.aslot(priority, tokens):
+                    t0 = time.perf_counter()
+                    resp = await fn(messages)
+                self._succeeded(time.perf_counter() - t0, tokens, resp)
+                return resp
+            except Exception as e:
+                await asyncio.sleep(self._failed(e, attempt))
+        raise AssertionError("unreachable")
+
+    def stream(self, fn: Callable[[List[object]], Iterator[T]], messages: List[object], priority: int = GENERATE) -> Iterator[T]:
+        """
+        Chunks of fn(messages), holding one slot for the whole stream.
+        Only failures before the first chunk are retried.
+        """
+        tokens = estimate_tokens(messages)
+        for attempt in itertools.count():
+            started = False
+            try:
+                with self.slot(priority, tokens):
+                    t0 = time.perf_counter()
+                    last: Any = None
+                    for chunk in fn(messages):
+                        started = True
+                        last = chunk
+                        yield chunk
+                self._succeeded(time.perf_counter() - t0, tokens, last)
+                return
+            except Exception as e:
+                if started:
+                    raise
+                time.sleep(self._failed(e, attempt))
+
+    async def astream(self, fn: Callable[[List[object]], AsyncIterator[T]], messages: List[object], priority: int = GENERATE) -> AsyncIterator[T]:
+        """Async counterpart of stream."""
+        tokens = estimate_tokens(messages)
+        for attempt in itertools.count():
+            started = False
+            try:
+                async with self.aslot(priority, tokens):
+                    t0 = time.perf_counter()
+                    last: Any = None
+                    async for chunk in fn(messages):
+                        started = True
+                        last = chunk
+                        yield chunk
+                self._succeeded(time.perf_counter() - t0, tokens, last)
+                return
+            except Exception as e:
+                if started:
+                    raise
+                await asyncio.sleep(self._failed(e, attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus current limit, in-flight and queued calls."""
+        with self._lock:
+            return {
+                **self.counters,
+                "limit": round(self.aimd.limit, 2),
+                "inflight": self.inflight,
+                "queued": sum(1 for _p, _s, w in self._queue if not w.cancelled),
+            }
+
+
+_SCHEDULER: Optional[LLMScheduler] = None
+_CONFIGURED = False
+_SCHED_LOCK = threading.Lock()
+
+
+def configure_scheduler(scheduler: Optional[LLMScheduler]) -> Optional[LLMScheduler]:
+    """Install (or with None, disable) the process-wide scheduler."""
+    global _SCHEDULER, _CONFIGURED
+    with _SCHED_LOCK:
+        _SCHEDULER = scheduler
+        _CONFIGURED = True
+        return _SCHEDULER
+
+
+def get_scheduler() -> Optional[LLMScheduler]:
+    """Process-wide scheduler, lazily configured from LLM_* env vars (None when LLM_SCHEDULER=off)."""
+    if not _CONFIGURED:
+        if os.getenv("LLM_SCHEDULER", "on").lower() in {"0", "off", "false"}:
+            return configure_scheduler(None)
+
+        def _num(name: str) -> Optional[float]:
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        configure_scheduler(
+            LLMScheduler(
+                concurrency=int(_num("LLM_CONCURRENCY") or 4),
+                max_concurrency=int(_num("LLM_MAX_CONCURRENCY") or 32),
+                rpm=_num("LLM_RPM"),
+                tpm=_num("LLM_TPM"),
+                max_retries=int(os.getenv("LLM_MAX_RETRIES", "4")),
+                backoff_base=_num("LLM_BACKOFF_BASE") or 0.5,
+                backoff_max=_num("LLM_BACKOFF_MAX") or 20.0,
+                latency_target=_num("LLM_LATENCY_TARGET"),
+            )
+        )
+    return _SCHEDULER
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from itertools import islice
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from .data_models import ConvFinQARecord
+from .dataset import LazyRecords, get_turn_gold, get_turn_question, load_compact_records
+from .evaluation import run_eval
+from .executor import PlanRAGRunner
+from .logger import get_logger
+from .metrics import numeric_match
+from .retrieval import PerDocRetriever, load_retriever
+from .scheduler import get_scheduler
+from .session import ConversationSession
+
+# Resident QA process behind `main serve`: the dataset, per-record retrievers
+# and the shared LLM clients (clients.get_chat_model) stay loaded across
+# requests, so a short question pays only for planning/generation.
+#
+#   GET  /health                      liveness + cache stats
+#   POST /chat  {"record_id", "question"? | "turn"?, "session"?}
+#   POST /eval  {"ids"? | "n"?, "workers"?}
+#
+# Requests run on their own threads; node work shares executor.shared_pool.
+
+logger = get_logger(__name__)
+
+# Upper bound on /eval "workers": records evaluated at once by one request.
+MAX_EVAL_WORKERS = 32
+
+
+def retriever_nbytes(retriever: PerDocRetriever) -> int:
+    """Approximate resident size of a retriever (sparse matrix, chunk text, table arrays, own vocabulary)."""
+    m = retriever.matrix
+    n = m.data.nbytes + m.indices.nbytes + m.indptr.nbytes
+    n += sum(len(c) for c in retriever.chunks)
+    n += retriever.table.values.nbytes + retriever.table.present.nbytes
+    vocab = getattr(retriever.vectorizer, "vocabulary_", None)
+    if vocab is not None:
+        # Fitted per record; index-backed retrievers share the index vectorizer.
+        n += 100 * len(vocab)
+    return int(n)
+
+
+class RetrieverCache:
+    """
+    LRU of PerDocRetriever by record id, evicting beyond max_bytes (retriever_nbytes).
+    Retrievers pinned by live sessions stay counted after eviction until released.
+    """
+
+    def __init__(self, index_path: Optional[str] = None, max_bytes: int = 512 * 1024 * 1024):
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._items: OrderedDict[str, Tuple[PerDocRetriever, int]] = OrderedDict()
+        # Evicted from the LRU but still referenced by a session: no longer reusable
+        # through the LRU order, yet resident, so their bytes stay in the budget.
+        self._held: Dict[str, Tuple[PerDocRetriever, int]] = {}
+        self._pins: Dict[str, int] = {}
+        self.bytes = 0
+        self.counters: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, rec: ConvFinQARecord, pin: bool = False) -> PerDocRetriever:
+        """Retriever for rec, built on a miss; with pin it stays counted until release(rec.id)."""
+        with self._lock:
+            item = self._items.get(rec.id)
+            if item is None and rec.id in self._held:
+                item = self._items[rec.id] = self._held.pop(rec.id)
+            if item is not None:
+                self._items.move_to_end(rec.id)
+                self.counters["hits"] += 1
+                if pin:
+                    self._pins[rec.id] = self._pins.get(rec.id, 0) + 1
+                return item[0]
+            self.counters["misses"] += 1
+        # Built outside the lock; a concurrent miss on the same id builds twice and one copy wins.
+        retriever = load_retriever(rec, self.index_path)
+        size = retriever_nbytes(retriever)
+        with self._lock:
+            if rec.id in self._held:
+                self._items[rec.id] = self._held.pop(rec.id)
+            if rec.id not in self._items:
+                self._items[rec.id] = (retriever, size)
+                self.bytes += size
+            retriever = self._items[rec.id][0]
+            if pin:
+                self._pins[rec.id] = self._pins.get(rec.id, 0) + 1
+            self._trim()
+        return retriever
+
+    def release(self, rid: str) -> None:
+        """Drop one pin taken by get(..., pin=True); the last one frees an evicted retriever."""
+        with self._lock:
+            left = self._pins.get(rid, 0) - 1
+            if left > 0:
+                self._pins[rid] = left
+                return
+            self._pins.pop(rid, None)
+            held = self._held.pop(rid, None)
+            if held is not None:
+                self.bytes -= held[1]
+            self._trim()
+
+    def over_budget(self) -> bool:
+        """True while resident retrievers (cached or pinned) exceed max_bytes."""
+        with self._lock:
+            return self.bytes > self.max_bytes
+
+    def _trim(self) -> None:
+        # Caller holds the lock. Pinned entries leave the LRU but keep their bytes.
+        while self.bytes > self.max_bytes and len(self._items) > 1:
+            rid, item = self._items.popitem(last=False)
+            if rid in self._pins:
+                self._held[rid] = item
+            else:
+                self.bytes -= item[1]
+                self.counters["evictions"] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/eviction counters plus current entries, pinned records and bytes."""
+        with self._lock:
+            return {**self.counters, "entries": len(self._items), "pinned": len(self._pins), "bytes": self.bytes}
+
+
+class QAServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: Tuple[str, int],
+        records: Mapping[str, ConvFinQARecord],
+        retrievers: RetrieverCache,
+        max_sessions: int = 256,
+        concurrency: int = 16,
+    ):
+        super().__init__(address, _Handler)
+        self.records = records
+        self.retrievers = retrievers
+        self.max_sessions = max_sessions
+        self.concurrency = concurrency
+        self.sessions: OrderedDict[str, Tuple[ConversationSession, threading.Lock]] = OrderedDict()
+        self.sessions_lock = threading.Lock()
+        self.started = time.time()
+
+    def session(self, key: str, rec: ConvFinQARecord) -> Tuple[ConversationSession, threading.Lock]:
+        """
+        Per-client conversation over one record (LRU, at most max_sessions),
+        with the lock that serialises its turns.
+        """
+        key = f"{key}\x1f{rec.id}"
+        with self.sessions_lock:
+            sess = self.sessions.get(key)
+            if sess is not None:
+                self.sessions.move_to_end(key)
+                return sess
+        # A session keeps its retriever alive, so it pins it in the byte budget.
+        retriever = self.retrievers.get(rec, pin=True)
+        with self.sessions_lock:
+            sess = self.sessions.get(key)
+            if sess is not None:
+                self.retrievers.release(rec.id)
+            else:
+                sess = (ConversationSession(retriever, concurrency=self.concurrency), threading.Lock())
+                self.sessions[key] = sess
+                # Oldest sessions also give way when pinned retrievers overrun the budget.
+                while len(self.sessions) > self.max_sessions or (
+                    len(self.sessions) > 1 and self.retrievers.over_budget()
+                ):
+                    old, _ = self.sessions.popitem(last=False)
+                    self.retrievers.release(old.rsplit("\x1f", 1)[1])
+            self.sessions.move_to_end(key)
+            return sess
+
+    def chat(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Answer one question (given, or a dataset turn) for a record, optionally within a session."""
+        rid = str(body.get("record_id", ""))
+        if rid not in self.records:
+            return 404, {"error": f"Unknown record_id: {rid}"}
+        rec = self.records[rid]
+        turn = body.get("turn")
+        question = body.get("question") or get_turn_question(rec, turn)
+        if not question:
+            return 400, {"error": "No question given and none available for this record/turn."}
+        t0 = time.perf_counter()
+        if body.get("session"):
+            sess, turn_lock = self.session(str(body["session"]), rec)
+            with turn_lock:
+                final, answers, retrieved = sess.ask(question)
+        else:
+            final, answers, retrieved = PlanRAGRunner(self.retrievers.get(rec), concurrency=self.concurrency).run(question)
+        out: Dict[str, Any] = {
+            "id": rid,
+            "question": question,
+            "answer": final,
+            "answers": answers,
+            "retrieved": retrieved,
+            "seconds": round(time.perf_counter() - t0, 4),
+        }
+        if "question" not in body:
+            gold = get_turn_gold(rec, turn)
+            if gold is not None:
+                out["gold"] = str(gold)
+                out["match"] = numeric_match(final, str(gold))
+        return 200, out
+
+    def eval(self, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """Run the evaluation over given ids (or the first n records) and return per-record results."""
+        try:
+            n = int(body.get("n", 10))
+            workers = int(body.get("workers", 1))
+        except (TypeError, ValueError):
+            return 400, {"error": "'n' and 'workers' must be integers"}
+        workers = max(1, min(workers, MAX_EVAL_WORKERS))
+        ids: List[str] = [str(i) for i in body.get("ids") or []]
+        if not ids:
+            ids = list(islice(iter(self.records), max(0, n)))
+        unknown = [i for i in ids if i not in self.records]
+        if unknown:
+            return 404, {"error": f"Unknown record_id(s): {', '.join(unknown[:5])}"}
+        results = run_eval(self.records, ids, workers=workers, retriever_for=self.retrievers.get)
+        hits = sum(1 for r in results if r.get("match"))
+        return 200, {"total": len(results), "hits": hits, "accuracy": hits / len(results) if results else 0.0, "results": results}
+
+    def health(self) -> Dict[str, Any]:
+        """Liveness plus record count, uptime, cache, session and scheduler stats."""
+        sched = get_scheduler()
+        return {
+            "status": "ok",
+            "records": len(self.records),
+            "uptime_s": round(time.time() - self.started, 1),
+            "retrievers": self.retrievers.stats(),
+            "sessions": len(self.sessions),
+            "scheduler": sched.stats() if sched is not None else None,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: QAServer
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path.rstrip("/") in {"", "/health"}:
+            self._send(200, self.server.health())
+        else:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+
+    def do_POST(self) -> None:
+        routes = {"/chat": self.server.chat, "/eval": self.server.eval}
+        route = routes.get(self.path.rstrip("/"))
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            # The body cannot be delimited, so the connection cannot be reused either.
+            self.close_connection = True
+            self._send(400, {"error": "Invalid Content-Length header"})
+            return
+        raw = self.rfile.read(length) if length else b"{}"
+        if route is None:
+            self._send(404, {"error": f"Unknown path: {self.path}"})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError as e:
+            self._send(400, {"error": f"Invalid JSON: {e}"})
+            return
+        if not isinstance(body, dict):
+            self._send(400, {"error": "Request body must be a JSON object"})
+            return
+        try:
+            status, payload = route(body)
+        except Exception as e:
+            logger.exception("%s failed", self.path)
+            status, payload = 500, {"error": f"{type(e).__name__}: {e}"}
+        self._send(status, payload)
+
+    def log_message(self, fmt: str, *args: Any) -> None:
+        logger.info("%s %s", self.address_string(), fmt % args)
+
+
+def make_server(
+    data: str,
+    host: str = "127.0.0.1",
+    port: int = 8000,
+    index_path: Optional[str] = None,
+    cache_mb: float = 512.0,
+    preload: bool = True,
+    concurrency: int = 16,
+) -> QAServer:
+    """
+    Build (but do not start) the server. With preload every record is parsed
+    up front and kept as a CompactRecord; otherwise records are parsed on
+    demand from the offset index. `concurrency` is the number of requests
+    expected in flight at once (sizes the shared node pool).
+    """
+    records: Mapping[str, ConvFinQARecord] = load_compact_records(data) if preload else LazyRecords(data)
+    retrievers = RetrieverCache(index_path, max_bytes=int(cache_mb * 1024 * 1024))
+    return QAServer((host, port), records, retrievers, concurrency=concurrency)
@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from .executor import Event, NodeMemory, PlanRAGRunner
+from .retrieval import CachingRetriever, Retriever
+
+# Multi-turn state for one ConvFinQA dialogue. Later turns mostly re-ask for
+# numbers earlier turns already fetched, so the session keeps:
+#   - answered plan nodes (NodeMemory): a node whose text and parent answers
+#     match an earlier one is answered without retrieval or an LLM call
+#   - resolved table cells and retrieved snippets (CachingRetriever)
+
+
+class ConversationSession:
+    """PlanRAGRunner over one record, with memory carried across turns."""
+
+    def __init__(self, retriever: Retriever, cache_entries: Optional[int] = 512, **runner_kwargs: Any):
+        """cache_entries caps each of the session's cell and snippet memos (None: unbounded)."""
+        self.retriever = CachingRetriever(retriever, max_entries=cache_entries)
+        self.runner = PlanRAGRunner(self.retriever, **runner_kwargs)
+        self.memory = NodeMemory()
+        self.history: List[Dict[str, Any]] = []
+
+    def _record(self, question: str, final: str, answers: Dict[str, str], seconds: float) -> None:
+        self.history.append({"question": question, "answer": final, "nodes": len(answers), "seconds": round(seconds, 4)})
+
+    def ask(self, question: str) -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
+        """Answer one turn; same return shape as PlanRAGRunner.run."""
+        t0 = time.perf_counter()
+        final, answers, retrieved = self.runner.run(question, memory=self.memory)
+        self._record(question, final, answers, time.perf_counter() - t0)
+        return final, answers, retrieved
+
+    async def aask(self, question: str) -> Tuple[str, Dict[str, str], Dict[str, List[str]]]:
+        """Async counterpart of ask (turns of one session must not overlap)."""
+        t0 = time.perf_counter()
+        final, answers, retrieved = await self.runner.arun(question, memory=self.memory)
+        self._record(question, final, answers, time.perf_counter() - t0)
+        return final, answers, retrieved
+
+    def stream(self, question: str) -> Iterator[Event]:
+        """Answer one turn as PlanRAGRunner.stream events."""
+        t0 = time.perf_counter()
+        for event in self.runner.stream(question, memory=self.memory):
+            if event["type"] == "final":
+                self._record(question, event["answer"], event["answers"], time.perf_counter() - t0)
+            yield event
+
+    async def astream(self, question: str) -> AsyncIterator[Event]:
+        """Async counterpart of stream."""
+        t0 = time.perf_counter()
+        async for event in self.runner.astream(question, memory=self.memory):
+            if event["type"] == "final":
+                self._record(question, event["answer"], event["answers"], time.perf_counter() - t0)
+            yield event
+
+    def stats(self) -> Dict[str, int]:
+        """Turn count and reuse counters (remembered nodes, node hits, cached cells)."""
+        return {
+            "turns": len(self.history),
+            "nodes_remembered": len(self.memory.entries),
+            "node_hits": self.memory.hits,
+            "cells_cached": len(self.retriever.cells),
+            "queries_cached": len(self.retriever.hits),
+        }
@@ -0,0 +1,217 @@
+from __future__ import annotations
+
+import difflib
+import re
+from typing import Dict, List, Mapping, Optional, Tuple
+
+import numpy as np
+
+from .compact import CompactTable
+
+# Per-record structured view of Document.table (dict[col][row] -> value):
+# normalised row/column label maps over a float64 value array, so a metric
+# fetch like "revenue in 2008" resolves to one cell without text search.
+
+_YEAR_RE = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+_TOKEN_RE = re.compile(r"[a-z0-9%]+")
+_MAX_NGRAM = 8
+# Words too generic to pin a label on their own ("total" matches a row in most tables).
+_GENERIC = frozenset(
+    "a an and as at by for from in of on or per the to total net other all "
+    "amount amounts value values year years ended end beginning balance change "
+    "what was were is are did".split()
+)
+
+# Label synonyms: question wording -> words that appear in table labels.
+SYNONYMS: Dict[str, List[str]] = {
+    "revenue": ["revenues", "net revenue", "net revenues", "net sales", "sales", "total revenue", "total revenues"],
+    "sales": ["net sales", "revenue", "revenues"],
+    "net income": ["net earnings", "net income loss", "earnings", "profit"],
+    "earnings": ["net earnings", "net income"],
+    "profit": ["net income", "net earnings", "income"],
+    "operating income": ["operating profit", "income from operations"],
+    "cash": ["cash and cash equivalents"],
+    "eps": ["earnings per share", "diluted earnings per share", "basic earnings per share"],
+    "debt": ["total debt", "long-term debt", "long term debt"],
+    "expenses": ["total expenses", "operating expenses"],
+}
+
+
+def normalize_label(label: str) -> str:
+    """Lowercased label tokens joined by single spaces, for matching rows and columns."""
+    return " ".join(_TOKEN_RE.findall(str(label).lower()))
+
+
+def _specific(words: List[str]) -> bool:
+    return any(w not in _GENERIC for w in words)
+
+
+def _to_number(v: object) -> float:
+    if isinstance(v, bool):
+        return np.nan
+    if isinstance(v, (int, float)):
+        return float(v)
+    return np.nan
+
+
+class TableIndex:
+    """Row/column label maps + value array with O(1) exact cell lookup."""
+
+    cols: List[str]
+    rows: List[str]
+    values: np.ndarray
+    present: np.ndarray
+    raw: Dict[Tuple[int, int], object]
+
+    def __init__(self, table: Mapping[str, Mapping[str, object]]):
+        if isinstance(table, CompactTable):
+            # Already columnar: share its arrays instead of re-walking dicts.
+            self.cols = list(table.cols)
+            self.rows = list(table.rows)
+            self.values = table.data  # non-numeric cells are already NaN
+            self.present = table.present
+            self.raw = dict(table.text)
+        else:
+            self._from_dict(table)
+
+        # First label wins on normalisation collisions (duplicate columns are suffixed upstream).
+        self.row_pos: Dict[str, int] = {}
+        for i, r in enumerate(self.rows):
+            self.row_pos.setdefault(normalize_label(r), i)
+        self.col_pos: Dict[str, int] = {}
+        for j, c in enumerate(self.cols):
+            self.col_pos.setdefault(normalize_label(c), j)
+        self.row_years = self._years(self.rows)
+        self.col_years = self._years(self.cols)
+        self._row_vocab = sorted({t for k in self.row_pos for t in k.split()})
+        self._col_vocab = sorted({t for k in self.col_pos for t in k.split()})
+
+    def _from_dict(self, table: Mapping[str, Mapping[str, object]]) -> None:
+        self.cols = list(table.keys())
+        rows: Dict[str, None] = {}
+        for rowmap in table.values():
+            for row in rowmap:
+                rows.setdefault(row, None)
+        self.rows = list(rows)
+        self.values = np.full((len(self.rows), len(self.cols)), np.nan, dtype=np.float64)
+        self.present = np.zeros((len(self.rows), len(self.cols)), dtype=bool)
+        self.raw = {}
+        row_idx = {r: i for i, r in enumerate(self.rows)}
+        for j, (_, rowmap) in enumerate(table.items()):
+            for row, val in rowmap.items():
+                i = row_idx[row]
+                self.values[i, j] = _to_number(val)
+                self.present[i, j] = True
+                if np.isnan(self.values[i, j]):
+                    self.raw[(i, j)] = val
+
+    @staticmethod
+    def _years(labels: List[str]) -> Dict[str, int]:
+        """year -> position, only for years that name exactly one label."""
+        seen: Dict[str, List[int]] = {}
+        for i, label in enumerate(labels):
+            for y in set(_YEAR_RE.findall(str(label))):
+                seen.setdefault(y, []).append(i)
+        return {y: pos[0] for y, pos in seen.items() if len(pos) == 1}
+
+    def __len__(self) -> int:
+        return int(self.present.sum())
+
+    def value(self, i: int, j: int) -> object:
+        """Cell (i, j) with its original value: raw text, or an int/float."""
+        if (i, j) in self.raw:
+            return self.raw[(i, j)]
+        v = float(self.values[i, j])
+        return int(v) if v.is_integer() else v
+
+    def cell(self, row: str, col: str) -> Optional[object]:
+        """Exact lookup by (normalised) labels."""
+        i = self.row_pos.get(normalize_label(row))
+        j = self.col_pos.get(normalize_label(col))
+        if i is None or j is None or not self.present[i, j]:
+            return None
+        return self.value(i, j)
+
+    # ----- matching free text against labels -----
+
+    @staticmethod
+    def _ngram_lookup(tokens: List[str], pos: Dict[str, int], specific: bool = False) -> Optional[int]:
+        # Longest n-gram of the text that is exactly a label
+        # (with `specific`, one that has a non-generic word in it).
+        for n in range(min(_MAX_NGRAM, len(tokens)), 0, -1):
+            for s in range(len(tokens) - n + 1):
+                gram = tokens[s:s + n]
+                i = pos.get(" ".join(gram))
+                if i is not None and (not specific or _specific(gram)):
+                    return i
+        return None
+
+    def _match_label(self, text: str, pos: Dict[str, int], vocab: List[str]) -> Optional[int]:
+        norm = normalize_label(_YEAR_RE.sub(" ", text))
+        tokens = norm.split()
+        i = self._ngram_lookup(tokens, pos, specific=True)
+        if i is not None:
+            return i
+        # Synonyms: rewrite known question wording into table wording.
+        for word, alts in SYNONYMS.items():
+            if re.search(rf"\b{re.escape(word)}\b", norm):
+                for alt in alts:
+                    i = pos.get(alt)
+                    if i is not None:
+                        return i
+        # Fuzzy: snap each token to the closest label word, then score label coverage.
+        snapped = set(tokens)
+        for t in tokens:
+            snapped.update(difflib.get_close_matches(t, vocab, n=2, cutoff=0.85))
+        best, best_key = None, (0.0, 0)
+        for label, idx in pos.items():
+            words = label.split()
+            if not _specific([w for w in words if w in snapped]):
+                continue
+            # Coverage first, longer (more specific) labels break ties.
+            key = (sum(w in snapped for w in words) / len(words), len(words))
+            if key > best_key:
+                best, best_key = idx, key
+        return best if best_key[0] >= 0.75 else None
+
+    @staticmethod
+    def _match_year(text: str, years: Dict[str, int]) -> Optional[int]:
+        hits = {years[y] for y in _YEAR_RE.findall(text) if y in years}
+        return hits.pop() if len(hits) == 1 else None
+
+    def resolve(self, text: str) -> Optional[Tuple[str, str, object]]:
+        """
+        (row label, column label, value) for the single cell `text` asks about,
+        or None when it cannot be pinned down unambiguously.
+        """
+        if not self.rows or not self.cols:
+            return None
+        # Usual orientation: metric rows x year columns.
+        i = self._match_label(text, self.row_pos, self._row_vocab)
+        if i is not None:
+            j = self._match_year(text, self.col_years)
+            if j is None:
+                # Non-year column headers ("amount", "total"); years were handled above.
+                j = self._ngram_lookup(normalize_label(_YEAR_RE.sub(" ", text)).split(), self.col_pos)
+            if j is None and len(self.cols) == 1 and not _YEAR_RE.search(text):
+                # A lone column is only safe when the text names no year it could contradict.
+                j = 0
+            if j is not None and self.present[i, j]:
+                return self.rows[i], self.cols[j], self.value(i, j)
+        # Transposed tables: year rows x metric columns.
+        j = self._match_label(text, self.col_pos, self._col_vocab)
+        if j is not None:
+            i = self._match_year(text, self.row_years)
+            if i is None and len(self.rows) == 1 and not _YEAR_RE.search(text):
+                i = 0
+            if i is not None and self.present[i, j]:
+                return self.rows[i], self.cols[j], self.value(i, j)
+        return None
+
+    def snippet(self, text: str) -> Optional[str]:
+        """Resolved cell rendered like retrieval's table lines ("row | col | value")."""
+        hit = self.resolve(text)
+        if hit is None:
+            return None
+        row, col, val = hit
+        return f"{row} | {col} | {val}"
@@ -0,0 +1,312 @@
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+# Lightweight span tracing for the Plan*RAG pipeline. One trace per question
+# ("question" root span) with children for planning, each DAG node (queue wait,
+# retrieval, LLM calls with token counts and cache status) and aggregation.
+# Disabled by default; enable via configure_tracing() (the CLI's --profile) or
+# TRACE_JSONL=<path>. TRACE_OTEL=1 mirrors spans to OpenTelemetry if installed.
+
+class StageTimes:
+    """Total milliseconds per span name, summed across threads/tasks of one unit of work."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.ms: Dict[str, float] = {}
+
+    def add(self, name: str, ms: float) -> None:
+        """Add ms to the total for name."""
+        with self._lock:
+            self.ms[name] = self.ms.get(name, 0.0) + ms
+
+
+_stages: contextvars.ContextVar[Optional[StageTimes]] = contextvars.ContextVar("planrag_stages", default=None)
+
+
+@contextmanager
+def stage_times() -> Iterator[StageTimes]:
+    """
+    Sum span durations by name for everything run inside the block (including
+    pool threads via submit and asyncio tasks), even with tracing disabled.
+    """
+    times = StageTimes()
+    token = _stages.set(times)
+    try:
+        yield times
+    finally:
+        _stages.reset(token)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start", "end", "attrs", "_t0", "_otel")
+
+    def __init__(self, name: str, parent: Optional[Span], attrs: Dict[str, Any]):
+        self.name = name
+        self.trace_id: str = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id: str = uuid.uuid4().hex[:16]
+        self.parent_id: Optional[str] = parent.span_id if parent else None
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attrs = dict(attrs)
+        self._t0 = time.perf_counter()
+        self._otel: Any = None
+
+    def set(self, **attrs: Any) -> None:
+        """Attach (or overwrite) attributes on this span."""
+        self.attrs.update(attrs)
+
+    @property
+    def duration_ms(self) -> float:
+        """Elapsed milliseconds; still running spans measure up to now."""
+        return round(((self.end or time.time()) - self.start) * 1000.0, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """JSON-ready record of the span, as written to TRACE_JSONL."""
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "attrs": self.attrs,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("planrag_span", default=None)
+
+
+class _NoopSpan:
+    def set(self, **attrs: Any) -> None:
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+# Trace ids remembered after their root span ends, so stragglers are recognised.
+_CLOSED_IDS = 10_000
+
+
+class Tracer:
+    """
+    Collects finished spans per trace. When a trace's root span ends the trace
+    is appended to the JSONL file, if any; without one only the last
+    `keep_traces` finished traces stay in memory (for traces()). Spans that end
+    after their root are exported on their own.
+    """
+
+    def __init__(self, enabled: bool = False, jsonl_path: Optional[str] = None, otel: bool = False, keep_traces: int = 100):
+        self.enabled = enabled
+        self.jsonl_path = jsonl_path
+        self.keep_traces = keep_traces
+        self._open: Dict[str, List[Span]] = {}
+        self._done: OrderedDict[str, List[Span]] = OrderedDict()
+        self._closed: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+        self._otel_tracer: Any = None
+        if enabled and otel:
+            try:
+                from opentelemetry import trace as otel_trace
+
+                self._otel_tracer = otel_trace.get_tracer("planrag")
+            except ImportError:
+                self._otel_tracer = None
+
+    @contextmanager
+    def span(self, name: str, **attrs: Any) -> Iterator[Any]:
+        """Context manager timing the block as a child of the current span."""
+        stages = _stages.get()
+        if not self.enabled:
+            if stages is None:
+                yield _NOOP
+                return
+            t0 = time.perf_counter()
+            try:
+                yield _NOOP
+            finally:
+                stages.add(name, (time.perf_counter() - t0) * 1000.0)
+            return
+        parent = _current.get()
+        sp = Span(name, parent, attrs)
+        if self._otel_tracer is not None:
+            from opentelemetry import trace as otel_trace
+
+            ctx = otel_trace.set_span_in_context(parent._otel) if parent is not None and parent._otel is not None else None
+            sp._otel = self._otel_tracer.start_span(name, context=ctx)
+        token = _current.set(sp)
+        try:
+            yield sp
+        except BaseException as e:
+            sp.set(error=f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            _current.reset(token)
+            sp.end = sp.start + (time.perf_counter() - sp._t0)
+            if stages is not None:
+                stages.add(name, (time.perf_counter() - sp._t0) * 1000.0)
+            self._finish(sp)
+
+    def _finish(self, sp: Span) -> None:
+        if sp._otel is not None:
+            for k, v in sp.attrs.items():
+                if isinstance(v, (str, bool, int, float)):
+                    sp._otel.set_attribute(k, v)
+            sp._otel.end()
+        with self._lock:
+            if sp.trace_id in self._closed:
+                # Ended after its root (e.g. an abandoned prefetch).
+                self._export([sp])
+                kept = self._done.get(sp.trace_id)
+                if kept is not None:
+                    kept.append(sp)
+                return
+            trace = self._open.setdefault(sp.trace_id, [])
+            trace.append(sp)
+            if sp.parent_id is not None:
+                return
+            del self._open[sp.trace_id]
+            self._export(trace)
+            self._closed[sp.trace_id] = None
+            if len(self._closed) > _CLOSED_IDS:
+                self._closed.popitem(last=False)
+            # Exported traces are not kept in memory (long eval runs, `serve`).
+            if not self.jsonl_path and self.keep_traces > 0:
+                self._done[sp.trace_id] = trace
+                while len(self._done) > self.keep_traces:
+                    self._done.popitem(last=False)
+
+    def _export(self, spans: List[Span]) -> None:
+        # Caller holds the lock.
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                for s in spans:
+                    f.write(json.dumps(s.to_dict(), default=str) + "\n")
+
+    def traces(self) -> Dict[str, List[Span]]:
+        """Spans of open and recently finished, unexported traces by trace id."""
+        with self._lock:
+            return {tid: list(spans) for tid, spans in [*self._done.items(), *self._open.items()]}
+
+
+_TRACER: Optional[Tracer] = None
+
+
+def configure_tracing(enabled: bool = True, jsonl_path: Optional[str] = None, otel: bool = False) -> Tracer:
+    """Replace the process-wide tracer (e.g. from CLI flags)."""
+    global _TRACER
+    _TRACER = Tracer(enabled, jsonl_path, otel)
+    return _TRACER
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer, lazily configured from TRACE_JSONL / TRACE_OTEL."""
+    global _TRACER
+    if _TRACER is None:
+        path = os.getenv("TRACE_JSONL")
+        otel = os.getenv("TRACE_OTEL", "").lower() in {"1", "true", "on"}
+        _TRACER = Tracer(bool(path) or otel, path, otel)
+    return _TRACER
+
+
+def current_span() -> Any:
+    """The span the caller runs inside, or a no-op stand-in outside any span."""
+    sp = _current.get()
+    return sp if sp is not None else _NOOP
+
+
+def traced(name: str) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator: run the (sync or async) function inside a span called `name`."""
+
+    def deco(fn: Callable[..., Any]) -> Callable[..., Any]:
+        if asyncio.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def awrapper(*args: Any, **kwargs: Any) -> Any:
+                with get_tracer().span(name):
+                    return await fn(*args, **kwargs)
+
+            return awrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_tracer().span(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return deco
+
+
+def submit(pool: Executor, fn: Callable[..., Any], *args: Any) -> Future[Any]:
+    """pool.submit that carries the caller's span context into the worker thread."""
+    ctx = contextvars.copy_context()
+    return pool.submit(ctx.run, fn, *args)
+
+
+def usage_tokens(resp: Any) -> Dict[str, int]:
+    """Prompt/completion token counts from a LangChain message, when reported."""
+    usage = getattr(resp, "usage_metadata", None) or {}
+    out: Dict[str, int] = {}
+    if usage.get("input_tokens") is not None:
+        out["prompt_tokens"] = int(usage["input_tokens"])
+    if usage.get("output_tokens") is not None:
+        out["completion_tokens"] = int(usage["output_tokens"])
+    return out
+
+
+def start_profiling(out_dir: str) -> Callable[[], List[str]]:
+    """
+    Enable span tracing to <out_dir>/traces.jsonl and start a CPU profiler
+    (pyinstrument if installed, else cProfile). Returns a stop function that
+    writes the profile next to the traces and returns the files written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    traces = os.path.join(out_dir, "traces.jsonl")
+    configure_tracing(True, traces, otel=os.getenv("TRACE_OTEL", "").lower() in {"1", "true", "on"})
+    try:
+        from pyinstrument import Profiler
+
+        profiler: Any = Profiler()
+        profiler.start()
+
+        def _stop() -> List[str]:
+            profiler.stop()
+            html = os.path.join(out_dir, "profile.html")
+            with open(html, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            txt = os.path.join(out_dir, "profile.txt")
+            with open(txt, "w", encoding="utf-8") as f:
+                f.write(profiler.output_text())
+            return [traces, html, txt]
+
+        return _stop
+    except ImportError:
+        import cProfile
+        import pstats
+
+        prof = cProfile.Profile()
+        prof.enable()
+
+        def _stop_cprofile() -> List[str]:
+            prof.disable()
+            raw = os.path.join(out_dir, "profile.prof")
+            prof.dump_stats(raw)
+            txt = os.path.join(out_dir, "profile.txt")
+            with open(txt, "w", encoding="utf-8") as f:
+                pstats.Stats(prof, stream=f).sort_stats("cumulative").print_stats(60)
+            return [traces, raw, txt]
+
+        return _stop_cprofile
@@ -0,0 +1,39 @@
+from src.compact import CompactRecord, CompactRecords
+from src.data_models import ConvFinQARecord
+
+
+def _record() -> ConvFinQARecord:
+    return ConvFinQARecord.model_validate({
+        "id": "Single_K/0/page_0.pdf-1",
+        "doc": {
+            "pre_text": "Revenue grew.",
+            "post_text": "",
+            "table": {
+                "2007": {"revenue": 494, "margin": 12.5, "total assets": "n/a", "segment": "(1,234)"},
+                "2008": {"revenue": 520, "margin": 0.0, "total assets": "$ 3,100"},
+            },
+        },
+        "dialogue": {"conv_questions": ["what was revenue in 2008?", "and in 2007?"], "conv_answers": ["520", "494"],
+                     "turn_program": ["520", "494"], "executed_answers": [520, 494.0], "qa_split": [False, False]},
+        "features": {"num_dialogue_turns": 2, "has_type2_question": False,
+                     "has_duplicate_columns": False, "has_non_numeric_values": True},
+    })
+
+
+def test_from_model_round_trips():
+    """Text, int and float cells (and a cell missing from one column) survive unchanged."""
+    rec = _record()
+    back = CompactRecord.from_model(rec).to_model()
+    assert back == rec
+    table = back.doc.table
+    assert type(table["2007"]["revenue"]) is int and type(table["2007"]["margin"]) is float
+    assert type(table["2008"]["margin"]) is float
+    assert table["2007"]["total assets"] == "n/a" and "segment" not in table["2008"]
+
+
+def test_compact_table_reads_like_the_dict_table():
+    """The packed table iterates and indexes like Document.table."""
+    rec = _record()
+    compact = CompactRecords({rec.id: rec})[rec.id]
+    assert dict(compact.doc.table) == rec.doc.table
+    assert compact.doc.table["2008"]["total assets"] == "$ 3,100"
@@ -0,0 +1,78 @@
+import json
+import os
+
+import pytest
+
+from src.corpus import CorpusRetriever
+from src.data_models import ConvFinQARecord
+from src.index import build_index, open_index
+
+_TEXTS = [
+    "Aluminium smelting capacity expanded at the Quebec plant during the year.",
+    "Pipeline throughput rose as the Permian gathering system came online.",
+    "Smelting margins narrowed; aluminium prices fell through the fourth quarter.",
+    "Retail banking deposits grew while mortgage originations slowed sharply.",
+]
+
+
+def _record(i: int, text: str) -> ConvFinQARecord:
+    return ConvFinQARecord.model_validate({
+        "id": f"Single_C/{i}/page_{i}.pdf-1",
+        "doc": {"pre_text": text, "post_text": "", "table": {"2008": {"revenue": 100 + i}}},
+        "dialogue": {"conv_questions": ["what was revenue in 2008?"], "conv_answers": [str(100 + i)],
+                     "turn_program": [str(100 + i)], "executed_answers": [100 + i], "qa_split": [False]},
+        "features": {"num_dialogue_turns": 1, "has_type2_question": False,
+                     "has_duplicate_columns": False, "has_non_numeric_values": False},
+    })
+
+
+@pytest.fixture
+def index_path(tmp_path):
+    """Index built over four records, two of which share the smelting vocabulary."""
+    path = str(tmp_path / "index")
+    build_index([_record(i, t) for i, t in enumerate(_TEXTS)], path)
+    return path
+
+
+def test_search_ranks_matching_records_first(index_path):
+    """Only records containing the query terms come back, best first, labelled with their id."""
+    hits = CorpusRetriever.open(index_path).search("aluminium smelting", k=3)
+    assert {h.record_id for h in hits} == {"Single_C/0/page_0.pdf-1", "Single_C/2/page_2.pdf-1"}
+    assert all("smelting" in h.text.lower() for h in hits)
+    assert [h.score for h in hits] == sorted((h.score for h in hits), reverse=True)
+
+
+def test_search_respects_n_docs_and_k(index_path):
+    """Stage 1 keeps n_docs records; stage 2 returns at most k chunks from them."""
+    retriever = CorpusRetriever.open(index_path)
+    best = retriever.search("aluminium smelting", k=1)
+    assert len(best) == 1
+    narrowed = retriever.search("aluminium smelting", k=6, n_docs=1)
+    assert {h.record_id for h in narrowed} == {best[0].record_id}
+
+
+def test_search_without_known_terms_is_empty(index_path):
+    """Out-of-vocabulary queries and k <= 0 return nothing."""
+    retriever = CorpusRetriever.open(index_path)
+    assert retriever.search("zeppelin quasar") == []
+    assert retriever.search("pipeline throughput", k=0) == []
+
+
+def test_query_batch_prefixes_record_ids(index_path):
+    """Runner-facing results carry "[record_id]" and lookup never resolves cells."""
+    retriever = CorpusRetriever.open(index_path)
+    (top, _score), *_ = retriever.query("pipeline throughput")
+    assert top.startswith("[Single_C/1/page_1.pdf-1] ")
+    assert retriever.lookup("revenue in 2008") is None
+
+
+def test_open_index_rejects_indexes_without_postings(index_path):
+    """Indexes written before the BM25 postings (version 1) must be rebuilt."""
+    meta_path = os.path.join(index_path, "meta.json")
+    with open(meta_path, encoding="utf-8") as f:
+        meta = json.load(f)
+    meta["version"] = 1
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    with pytest.raises(ValueError):
+        open_index(index_path)
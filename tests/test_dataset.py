@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from src import dataset
+from src.dataset import (
+    OFFSET_INDEX_SUFFIX,
+    LazyRecords,
+    build_offset_index,
+    load_offset_index,
+)
+
+
+def _raw(i: int, text: str) -> dict:
+    return {
+        "id": f"Single_T/{i}/page_{i}.pdf-1",
+        "doc": {"pre_text": text, "post_text": "", "table": {"2008": {"revenue": 100 + i, "note": "n/a"}}},
+        "dialogue": {"conv_questions": ["what was revenue in 2008?"], "conv_answers": [str(100 + i)],
+                     "turn_program": [str(100 + i)], "executed_answers": [100 + i], "qa_split": [False]},
+        "features": {"num_dialogue_turns": 1, "has_type2_question": False,
+                     "has_duplicate_columns": False, "has_non_numeric_values": True},
+    }
+
+
+@pytest.fixture(params=["ascii", "utf8"])
+def data_path(request, tmp_path):
+    """Five-record dataset file, once with ASCII and once with multi-byte text."""
+    text = "Revenue grew." if request.param == "ascii" else "Société Générale — revenue grew ↑."
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps([_raw(i, text) for i in range(5)], indent=2, ensure_ascii=False), encoding="utf-8")
+    return str(path)
+
+
+def test_build_offset_index_slices_each_record(data_path):
+    """Every (offset, length) is the exact byte span of its record, multi-byte text included."""
+    raw = {r["id"]: r for r in json.load(open(data_path, encoding="utf-8"))}
+    offsets = build_offset_index(data_path)
+    assert list(offsets) == list(raw)
+    blob = open(data_path, "rb").read()
+    for rid, (offset, length) in offsets.items():
+        assert json.loads(blob[offset:offset + length]) == raw[rid]
+
+
+def test_load_offset_index_round_trips_through_sidecar(data_path, monkeypatch):
+    """The sidecar is reused while the dataset is unchanged and rebuilt once it changes."""
+    built = load_offset_index(data_path)
+    with open(data_path + OFFSET_INDEX_SUFFIX, encoding="utf-8") as f:
+        assert json.load(f)["offsets"] == {k: list(v) for k, v in built.items()}
+
+    def _no_rebuild(path: str) -> None:
+        raise AssertionError("sidecar should have been reused")
+
+    monkeypatch.setattr(dataset, "build_offset_index", _no_rebuild)
+    assert load_offset_index(data_path) == built
+    monkeypatch.undo()
+
+    records = json.load(open(data_path, encoding="utf-8"))[:2]
+    with open(data_path, "w", encoding="utf-8") as f:
+        json.dump(records, f)
+    assert list(load_offset_index(data_path)) == [r["id"] for r in records]
+
+
+def test_lazy_records_parse_on_access(data_path):
+    """LazyRecords yields the same validated records as a full load, in file order."""
+    lazy = LazyRecords(data_path)
+    full = dataset.load_records(data_path)
+    assert list(lazy) == [r.id for r in full]
+    assert all(lazy[r.id] == r for r in full)
+    assert "missing" not in lazy and len(lazy) == len(full)
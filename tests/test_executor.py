@@ -0,0 +1,66 @@
+from typing import Dict, List, Optional, Tuple
+
+from src.executor import PlanRAGRunner
+from src.planrag import PlanDAG, PlanNode
+
+
+class _Retriever:
+    def __init__(self, cells: Dict[str, str], hits: Optional[Dict[str, str]] = None):
+        self.cells = cells
+        self.hits = hits or {}
+
+    def lookup(self, q: str) -> Optional[str]:
+        return self.cells.get(q)
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        return self.query_batch([q], k=k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        return [[(self.hits[q], 1.0)] if q in self.hits else [] for q in queries]
+
+
+def _dag() -> PlanDAG:
+    nodes = {
+        "2.1": PlanNode(id="2.1", text="Retrieve net income in 2003.", depth=2),
+        "2.2": PlanNode(id="2.2", text="Retrieve net income in 2004.", depth=2),
+        "3.1": PlanNode(id="3.1", text="Compute the change.", depth=3, depends_on=["2.1", "2.2"], program="subtract(#2.2, #2.1)"),
+    }
+    return PlanDAG(nodes=nodes)
+
+
+def _runner(retriever: _Retriever) -> PlanRAGRunner:
+    return PlanRAGRunner(retriever, prefetch=False)
+
+
+def test_final_leaf_skips_aggregator_for_resolved_cells_of_one_row():
+    """Both inputs are the table index's own cells from one row: the program result is final."""
+    cells = {"Retrieve net income in 2003.": "net income | 2003 | 1023.4", "Retrieve net income in 2004.": "net income | 2004 | 716.6"}
+    answers = {"2.1": cells["Retrieve net income in 2003."], "2.2": cells["Retrieve net income in 2004."], "3.1": "-306.8"}
+    assert _runner(_Retriever(cells))._final_leaf(_dag(), answers) == "-306.8"
+
+
+def test_final_leaf_ignores_table_lines_from_search():
+    """Lines that only look like cells (search hits, generator answers) still go to the aggregator."""
+    answers = {"2.1": "net income | 2003 | 1023.4", "2.2": "net revenue | 2004 | 716.6", "3.1": "-306.8"}
+    assert _runner(_Retriever({}))._final_leaf(_dag(), answers) is None
+
+
+def test_final_leaf_rejects_cells_from_different_rows():
+    """Resolved cells from two rows are not one metric over time."""
+    cells = {"Retrieve net income in 2003.": "net income | 2003 | 1023.4", "Retrieve net income in 2004.": "net revenue | 2004 | 716.6"}
+    answers = {"2.1": cells["Retrieve net income in 2003."], "2.2": cells["Retrieve net income in 2004."], "3.1": "-306.8"}
+    assert _runner(_Retriever(cells))._final_leaf(_dag(), answers) is None
+
+
+def test_run_does_not_subtract_search_hits_from_different_rows(monkeypatch):
+    """End to end without an API key: mismatched search hits never become a bare final number."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    question = "What was the change in net income from 2003 to 2004?"
+    hits = {
+        "Retrieve the value for net income in 2003.": "net income | 2003 | 1023.4",
+        "Retrieve the value for net income in 2004.": "net revenue | 2004 | 716.6",
+    }
+    final, answers, _retrieved = _runner(_Retriever({}, hits)).run(question)
+    assert answers["2.1"] == hits["Retrieve the value for net income in 2003."]
+    assert final != "-306.8"
+    assert "Summary:" in final
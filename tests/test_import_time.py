@@ -0,0 +1,15 @@
+from pathlib import Path
+
+from src.bench import import_time
+
+# Same budget as `main check-imports`.
+BUDGET_MS = 750.0
+
+
+def test_cli_import_is_cheap(monkeypatch):
+    """Importing the CLI stays under budget and pulls in none of the heavy libraries."""
+    monkeypatch.chdir(Path(__file__).resolve().parents[1])
+    report = import_time("src.main", runs=3)
+    assert report["total_ms"] <= BUDGET_MS, report["slowest"][:8]
+    loaded = {name.split(".")[0] for name in report["heavy"]}
+    assert not loaded & {"langchain", "langchain_core", "sklearn", "scipy"}, report["heavy"]
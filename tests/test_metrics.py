@@ -0,0 +1,45 @@
+import random
+
+import numpy as np
+
+from src.metrics import _to_float, _to_float_array, numeric_match, numeric_match_batch
+
+_ODD = [
+    "", "-", ".", "-.5", "5.", "+3", "007", "1" * 16, " 12.5 ", "1 2", "1.2.3", "1e5", "-1.5e-3",
+    "$1,234", "(3)", "5%", "$ (4)", "inf", "nan", "1_000", "１２", "x" * 40,
+    "The answer is 42.", "None",
+]
+
+
+def _pairs(n: int, prose: float, seed: int = 0):
+    rng = random.Random(seed)
+    golds = [f"{rng.uniform(-1e4, 1e4):.{rng.randint(0, 4)}f}" for _ in range(n)]
+    preds = [f"The change was {g} million." if rng.random() < prose else g for g in golds]
+    return preds, golds
+
+
+def test_to_float_array_matches_scalar():
+    """Vectorized parse agrees with _to_float value for value, odd inputs included."""
+    rng = random.Random(1)
+    values = [rng.choice(_ODD) for _ in range(2000)] + [repr(rng.uniform(-1e6, 1e6)) for _ in range(2000)]
+    parsed, ok = _to_float_array(values)
+    for v, p, k in zip(values, parsed, ok):
+        want = _to_float(v)
+        assert k == (want is not None), v
+        assert not k or p == want or (np.isnan(p) and np.isnan(want)), v
+
+
+def test_numeric_match_batch_matches_scalar():
+    """Batch matching agrees with numeric_match pair for pair."""
+    rng = random.Random(2)
+    preds = [rng.choice(_ODD) if rng.random() < 0.3 else str(rng.randint(-99, 99)) for _ in range(3000)]
+    golds = [rng.choice(_ODD) if rng.random() < 0.3 else p for p in preds]
+    got = numeric_match_batch(preds, golds)
+    assert got.tolist() == [numeric_match(p, g) for p, g in zip(preds, golds)]
+
+
+def test_numeric_match_batch_matches_scalar_on_generated_answers():
+    """Clean and prose-heavy answer sets: batch results equal the scalar path."""
+    for prose in (0.0, 0.1):
+        preds, golds = _pairs(20_000, prose)
+        assert numeric_match_batch(preds, golds).tolist() == [numeric_match(a, b) for a, b in zip(preds, golds)], prose
@@ -0,0 +1,41 @@
+from src.planrag import PlanCache, PlanDAG, PlanNode
+
+
+def _dag(*texts: str, program: str = "subtract(#2.2, #2.1)") -> PlanDAG:
+    nodes = {f"2.{i}": PlanNode(id=f"2.{i}", text=t, depth=2) for i, t in enumerate(texts, start=1)}
+    nodes["3.1"] = PlanNode(id="3.1", text="Compute the change.", depth=3, depends_on=list(nodes), program=program)
+    return PlanDAG(nodes=nodes)
+
+
+def test_put_masks_entity_and_reinstantiates():
+    """A masked template answers the same question shape with another entity and years."""
+    cache = PlanCache()
+    q = "What was the change in revenue from 2007 to 2008?"
+    assert cache.put(q, _dag("Retrieve revenue in 2007.", "Retrieve revenue in 2008."))
+    dag = cache.get("What was the change in net income from 2009 to 2010?")
+    assert dag is not None
+    assert [n.text for n in dag.nodes.values()][:2] == ["Retrieve net income in 2009.", "Retrieve net income in 2010."]
+    assert dag.nodes["3.1"].program == "subtract(#2.2, #2.1)"
+
+
+def test_put_rejects_inflected_entity():
+    """A plural of the entity left in node text would leak into other questions."""
+    cache = PlanCache()
+    q = "What was the change in revenue from 2009 to 2010?"
+    assert not cache.put(q, _dag("Retrieve total revenues for fiscal 2009.", "Retrieve total revenues for fiscal 2010."))
+    assert cache.get("What was the change in net income from 2009 to 2010?") is None
+
+
+def test_put_rejects_plan_without_entity():
+    """Every E slot must be masked somewhere in the plan."""
+    cache = PlanCache()
+    q = "What was the change in revenue from 2007 to 2008?"
+    assert not cache.put(q, _dag("Retrieve sales in 2007.", "Retrieve sales in 2008."))
+
+
+def test_put_rejects_program_literals():
+    """Numbers baked into a program are specific to the original question."""
+    cache = PlanCache()
+    q = "What was the change in revenue from 2007 to 2008?"
+    dag = _dag("Retrieve revenue in 2007.", "Retrieve revenue in 2008.", program="subtract(9362, #2.1)")
+    assert not cache.put(q, dag)
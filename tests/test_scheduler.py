@@ -0,0 +1,92 @@
+from typing import Any, List
+
+import pytest
+
+from src.bench import FakeQuota, FakeRateLimitError
+from src.scheduler import AGGREGATE, GENERATE, PLAN, AIMDLimit, LLMScheduler
+
+
+def _scheduler(**kwargs: Any) -> LLMScheduler:
+    return LLMScheduler(backoff_base=0.001, backoff_max=0.01, seed=0, **kwargs)
+
+
+def test_aimd_halves_once_per_cooldown():
+    """A burst of 429s inside one cooldown window counts as a single decrease."""
+    aimd = AIMDLimit(initial=8, maximum=32, cooldown=60.0)
+    aimd.on_throttle()
+    aimd.on_throttle()
+    assert aimd.limit == 4.0
+    aimd.cooldown = 0.0
+    aimd.on_throttle()
+    assert aimd.limit == 2.0
+    for _ in range(10):
+        aimd.on_throttle()
+    assert aimd.limit == aimd.minimum == 1.0
+
+
+def test_aimd_grows_additively_and_trims_slow_successes():
+    """+1 per limit's worth of successes, x0.9 when a call ran past the latency target."""
+    aimd = AIMDLimit(initial=4, maximum=5, latency_target=1.0)
+    for _ in range(4):
+        aimd.on_success(0.1)
+    assert aimd.slots == 4 and aimd.limit == pytest.approx(4.9, abs=0.05)
+    for _ in range(20):
+        aimd.on_success(0.1)
+    assert aimd.limit == 5.0
+    aimd.on_success(2.0)
+    assert aimd.limit == pytest.approx(4.5)
+
+
+def test_dispatch_grants_by_priority():
+    """With the only slot taken, aggregator waiters go before generator, then planner waiters."""
+    sched = _scheduler(concurrency=1, max_concurrency=1)
+    order: List[int] = []
+    sched._enqueue(GENERATE, lambda: None)
+    for prio in (PLAN, GENERATE, AGGREGATE, PLAN):
+        sched._enqueue(prio, lambda p=prio: order.append(p))
+    assert order == [] and sched.inflight == 1
+    for _ in range(4):
+        sched._release()
+    assert order == [AGGREGATE, GENERATE, PLAN, PLAN]
+
+
+def test_call_retries_throttles_then_succeeds():
+    """A 429 from the provider is retried, and the AIMD limit backs off."""
+    quota = FakeQuota(max_concurrent=0, retry_after=0.0)
+    sched = _scheduler(concurrency=8)
+
+    def fn(_messages: List[object]) -> str:
+        try:
+            with quota.admit():
+                return "ok"
+        finally:
+            quota.max_concurrent = None
+
+    assert sched.call(fn, ["hi"]) == "ok"
+    assert sched.counters["throttled"] == 1 and sched.counters["retries"] == 1
+    assert sched.counters["failures"] == 0 and sched.aimd.limit < 8
+    assert quota.stats()["throttled"] == 1 and quota.stats()["accepted"] == 1
+
+
+def test_call_gives_up_after_max_retries():
+    """Persistent throttling re-raises once max_retries is used up; nothing stays in flight."""
+    quota = FakeQuota(max_concurrent=0, retry_after=0.0)
+    sched = _scheduler(max_retries=2)
+
+    def fn(_messages: List[object]) -> str:
+        with quota.admit():
+            return "ok"
+
+    with pytest.raises(FakeRateLimitError):
+        sched.call(fn, ["hi"])
+    assert sched.counters["retries"] == 2 and sched.counters["failures"] == 1
+    assert quota.stats()["throttled"] == 3 and sched.inflight == 0
+
+
+def test_failed_does_not_retry_other_errors_and_honours_retry_after():
+    """Non-transient errors re-raise at once; a Retry-After sets the minimum backoff."""
+    sched = _scheduler()
+    with pytest.raises(ValueError):
+        sched._failed(ValueError("bad request"), 0)
+    assert sched.counters["retries"] == 0 and sched.counters["failures"] == 1
+    assert sched._failed(FakeRateLimitError("slow down", retry_after=0.3), 0) >= 0.3
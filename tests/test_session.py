@@ -0,0 +1,71 @@
+import re
+from typing import List, Optional, Tuple
+
+from src.executor import NodeMemory
+from src.planrag import PlanNode
+from src.retrieval import CachingRetriever
+from src.session import ConversationSession
+
+
+class _Retriever:
+    """Resolves "net income in <year>" to a cell and records every call."""
+
+    def __init__(self) -> None:
+        self.calls: List[Tuple[str, str]] = []
+
+    def lookup(self, q: str) -> Optional[str]:
+        self.calls.append(("lookup", q))
+        years = re.findall(r"20\d\d", q)
+        if "net income" not in q or not years:
+            return None
+        return f"net income | {years[0]} | {1000 + 10 * int(years[0][-1])}"
+
+    def query(self, q: str, k: int = 6) -> List[Tuple[str, float]]:
+        return self.query_batch([q], k=k)[0]
+
+    def query_batch(self, queries: List[str], k: int = 6) -> List[List[Tuple[str, float]]]:
+        self.calls.extend(("query", q) for q in queries)
+        return [[] for _ in queries]
+
+
+def test_node_memory_keys_on_text_and_parent_answers():
+    """Same normalised text and parent answers hit; a changed parent answer misses."""
+    memory = NodeMemory()
+    node = PlanNode(id="3.1", text="Compute the change.", depth=3, depends_on=["2.1", "2.2"])
+    memory.put(node, {"2.1": "1030", "2.2": "1040"}, "10", [])
+    again = PlanNode(id="3.2", text="  compute the   CHANGE.", depth=3, depends_on=["2.1", "2.2"])
+    assert memory.get(again, {"2.1": "1030", "2.2": "1040"}) == ("10", [])
+    assert memory.get(node, {"2.1": "1030", "2.2": "1050"}) is None
+    assert memory.hits == 1
+
+
+def test_caching_retriever_memoizes_and_evicts_least_recent():
+    """Repeated subqueries skip the inner retriever; max_entries keeps the most recently used."""
+    inner = _Retriever()
+    cached = CachingRetriever(inner, max_entries=2)
+    first = cached.lookup("net income in 2003")
+    assert cached.lookup("Net income  in 2003") == first
+    cached.query_batch(["a", "b"])
+    cached.query("a")
+    cached.query("c")
+    assert inner.calls == [("lookup", "net income in 2003"), ("query", "a"), ("query", "b"), ("query", "c")]
+    assert list(cached.hits) == [("a", 6), ("c", 6)]
+
+
+def test_session_reuses_nodes_only_while_parent_answers_match(monkeypatch):
+    """A repeated turn is answered from memory; a new year recomputes the dependent node."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    inner = _Retriever()
+    session = ConversationSession(inner, prefetch=False)
+    question = "What was the change in net income from 2003 to 2004?"
+    final, answers, _ = session.ask(question)
+    assert final == "10" and answers["2.2"] == "net income | 2004 | 1040"
+
+    seen = len(inner.calls)
+    assert session.ask(question)[0] == "10"
+    assert len(inner.calls) == seen
+    assert session.stats()["node_hits"] == len(answers)
+
+    final, answers, _ = session.ask("What was the change in net income from 2003 to 2005?")
+    assert final == "20" and answers["3.1"] == "20"
+    assert inner.calls[seen:] == [("lookup", "Retrieve the value for net income in 2005.")]
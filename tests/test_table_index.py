@@ -0,0 +1,44 @@
+from src.table_index import TableIndex
+
+_TABLE = {
+    "2007": {"net sales": 494, "net income": 63.5, "total": 900, "goodwill": "n/a"},
+    "2008": {"net sales": 520, "net income": 71.25, "total": 950, "goodwill": 12},
+    "fiscal 2009 (restated)": {"net sales": 610, "net income": 80, "total": 1010, "goodwill": 12},
+}
+
+
+def test_resolve_rewrites_question_wording_through_synonyms():
+    """Question wording "revenue" finds the "net sales" row when no label says revenue."""
+    assert TableIndex(_TABLE).resolve("What was revenue in 2008?") == ("net sales", "2008", 520)
+
+
+def test_resolve_picks_year_columns_by_the_year_they_name():
+    """A year inside a longer column header still selects that column; text cells keep their value."""
+    index = TableIndex(_TABLE)
+    assert index.resolve("net income for 2009") == ("net income", "fiscal 2009 (restated)", 80)
+    assert index.resolve("goodwill in 2007") == ("goodwill", "2007", "n/a")
+    assert index.resolve("net income in 2010") is None
+
+
+def test_resolve_rejects_a_year_shared_by_two_columns():
+    """Two headers naming the same year leave the column ambiguous."""
+    table = {"2008": {"net sales": 1}, "2008 pro forma": {"net sales": 2}}
+    assert TableIndex(table).resolve("net sales in 2008") is None
+
+
+def test_resolve_matches_misspelt_labels_fuzzily():
+    """Tokens snap to close label words before coverage is scored."""
+    assert TableIndex(_TABLE).resolve("net incme in 2007") == ("net income", "2007", 63.5)
+
+
+def test_resolve_does_not_pin_generic_words():
+    """Words like "total" or "net" name a row in most tables, so alone they resolve nothing."""
+    index = TableIndex(_TABLE)
+    assert index.resolve("What was the total in 2008?") is None
+    assert index.resolve("net change in 2008") is None
+
+
+def test_resolve_handles_transposed_tables():
+    """Year rows x metric columns resolve the same questions."""
+    table = {"revenue": {"2007": 10, "2008": 12}, "net income": {"2007": 1, "2008": 2}}
+    assert TableIndex(table).resolve("net income in 2008") == ("2008", "net income", 2)